@@ -5,17 +5,143 @@
 TabletopSimulatorCompanion (TTS Companion) - 服务端入口
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g, send_file
 import os
 import json
+import atexit
+import threading
+import time
 from services.workshop_manager import WorkshopManager
-from services.langchain_manager import LangchainManager
+from services.langchain_manager import LangchainManager, INDEX_MANIFEST_FILENAME
+from services.metrics import REGISTRY as METRICS, PROMETHEUS_CONTENT_TYPE, labels
+from services.profiling import RequestProfiler
+from services.request_trace import RequestTrace
+from services.rulebook_watcher import RulebookWatcher, ReindexQueue
+from services.citations import format_citations
+from services.access_stats import GameAccessStats
+from services.single_flight import SingleFlightCache
 import config as cfg
 
 app = Flask(__name__)
 workshop_manager = WorkshopManager()
 langchain_manager = LangchainManager()
 app.json.ensure_ascii = False
+profiler = RequestProfiler(
+    cfg.PROFILES_DIRECTORY,
+    mode=cfg.PROFILING_MODE,
+    threshold_ms=cfg.PROFILING_THRESHOLD_MS,
+    sample_every=cfg.PROFILING_SAMPLE_EVERY,
+    max_files=cfg.PROFILING_MAX_FILES,
+)
+
+def _reindex_changed_rulebook(rulebook_path):
+    """规则书文件变化后在后台队列中执行: 只重建该规则书所属游戏的索引"""
+    found = workshop_manager.find_rulebook_by_path(rulebook_path)
+    if not found:
+        print(f"规则书监视: {rulebook_path} 不属于已记录的游戏，忽略")
+        return
+    game_name, pdf_key = found
+    if workshop_manager.rulebook_manager.is_template_content(rulebook_path, game_name):
+        print(f"规则书监视: {os.path.basename(rulebook_path)} 仍是模板内容，跳过")
+        return
+    print(f"规则书监视: 检测到 '{game_name}' 的规则书 {os.path.basename(rulebook_path)} 已修改，重建索引")
+    with profiler.profile("watch_reindex", game_name=game_name, rulebook=os.path.basename(rulebook_path)):
+        rebuilt = langchain_manager.add_rulebook_text(
+            rulebook_path, game_name, skip_if_unchanged=True,
+            rulebook_id=workshop_manager.get_rulebook_display_id(game_name, pdf_key),
+        )
+    if rebuilt:
+        workshop_manager.update_rulebook_status(game_name, pdf_key, "processed_into_rag")
+
+_pending_extractions = set()
+_pending_extractions_lock = threading.Lock()
+
+def _extract_rulebook_texts_in_background(game_name=None):
+    """
+    在后台线程中从TTS缓存的PDF提取规则书文本，写入的 .md 文件由规则书监视器重建索引。
+    同一游戏的提取尚未开始或正在进行时不重复提交 (重复的游戏加载通知不会堆积线程)。
+    """
+    if not cfg.PDF_TEXT_EXTRACTION:
+        return
+    with _pending_extractions_lock:
+        if game_name in _pending_extractions:
+            return
+        _pending_extractions.add(game_name)
+
+    def extract():
+        try:
+            workshop_manager.extract_rulebook_texts(game_name=game_name)
+        finally:
+            with _pending_extractions_lock:
+                _pending_extractions.discard(game_name)
+
+    threading.Thread(target=extract, name="pdf-extraction", daemon=True).start()
+
+def _warm_up_in_background():
+    """在后台线程中预热Embedding模型，并按访问统计预加载最近使用的游戏的检索器"""
+    def warm_up():
+        if cfg.EMBEDDING_WARMUP:
+            try:
+                print(f"Embedding模型预热完成，耗时 {langchain_manager.warm_up_embeddings():.2f}s")
+            except Exception as e:
+                print(f"Embedding模型预热失败: {e}")
+        games = access_stats.recent_games(cfg.PRELOAD_RETRIEVERS)
+        if games:
+            started_at = time.perf_counter()
+            loaded = langchain_manager.preload_retrievers(games, cfg.PRELOAD_MEMORY_BUDGET_MB)
+            print(f"已预加载 {len(loaded)} 个游戏的检索器 ({time.perf_counter() - started_at:.2f}s): {', '.join(loaded)}")
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+access_stats = GameAccessStats(cfg.ACCESS_STATS_FILE or os.path.join(
+    os.path.dirname(cfg.PROCESSED_MODS_FILE), "game_access_stats.json"
+))
+atexit.register(access_stats.flush)
+# 游戏加载通知的准备结果 (按游戏单飞执行并缓存)
+loaded_games = SingleFlightCache()
+reindex_queue = ReindexQueue(_reindex_changed_rulebook)
+rulebook_watcher = RulebookWatcher(
+    cfg.EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY,
+    reindex_queue.submit,
+    backend=cfg.RULEBOOK_WATCHER,
+    debounce_seconds=cfg.RULEBOOK_WATCH_DEBOUNCE_SECONDS,
+    poll_interval=cfg.RULEBOOK_WATCH_POLL_INTERVAL,
+)
+
+def _cache_gauge(field):
+    """从缓存统计中取出某一项，按缓存名称作为标签"""
+    def read():
+        return {
+            labels(cache=name): stats.get(field, 0)
+            for name, stats in langchain_manager.get_cache_stats().items()
+        }
+    return read
+
+def _queue_depth():
+    depths = {labels(queue="rulebook_reindex"): reindex_queue.depth()}
+    if hasattr(langchain_manager.query_embeddings, "queue_depth"):
+        depths[labels(queue="query_embedding")] = langchain_manager.query_embeddings.queue_depth()
+    return depths
+
+METRICS.gauge("tts_loaded_retrievers", "内存中已加载的RAG检索器数", lambda: len(langchain_manager.game_retrievers))
+METRICS.gauge("tts_live_sessions", "当前的玩家会话数", langchain_manager.session_count)
+METRICS.gauge("tts_queue_depth", "各后台队列中等待处理的任务数", _queue_depth)
+METRICS.gauge("tts_cache_hit_ratio", "缓存命中率", _cache_gauge("hit_rate"))
+METRICS.gauge("tts_cache_entries", "缓存条目数", _cache_gauge("cache_size"))
+
+@app.before_request
+def _start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def _observe_request_duration(response):
+    started_at = getattr(g, "request_started_at", None)
+    if started_at is not None:
+        METRICS.histogram("tts_http_request_duration_seconds", "HTTP请求处理耗时").observe(
+            time.perf_counter() - started_at,
+            {"endpoint": request.endpoint or "unknown", "method": request.method, "status": str(response.status_code)},
+        )
+    return response
 
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -33,12 +159,23 @@ def ask():
     if isinstance(game_name, str):
         game_name = game_name.strip()
 
-    answer = langchain_manager.get_answer(question, game_name, player_id)
+    access_stats.record(game_name)
+    trace = RequestTrace("ask")
+    with profiler.profile("ask", game_name=game_name):
+        answer, citations = langchain_manager.get_answer_with_citations(question, game_name, player_id, trace=trace)
     # import json as std_json
     # manual_json_string = std_json.dumps(answer, ensure_ascii=False)
     # print(f"9. Manual JSON string with std_json.dumps(ensure_ascii=False) (repr): {repr(manual_json_string)}")
     # return Response(manual_json_string, mimetype='application/json; charset=utf-8')
-    return jsonify({"answer": answer, "player_id": player_id})
+    with trace.span("json_serialize"):
+        response = jsonify({
+            "answer": answer,
+            "player_id": player_id,
+            "citations": citations,
+            "citation_text": format_citations(citations),
+        })
+    METRICS.observe_trace(trace)
+    return response
 
 @app.route('/rulebook', methods=['GET'])
 def get_rulebooks():
@@ -76,40 +213,32 @@ def reset_session():
         langchain_manager.clear_game_state(game_name)
         return jsonify({"status": "success", "message": f"已重置 {game_name} 的所有会话和RAG状态"})
 
-@app.route('/api/game/loaded', methods=['POST'])
-def game_loaded():
-    """处理游戏加载通知"""
-    data = request.json
-    game_name = data.get('game_name')
-    
-    if not game_name:
-        return jsonify({"error": "缺少游戏名称"}), 400
-
-    # 清理 game_name
-    cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
-    
+def _prepare_loaded_game(cleaned_game_name):
+    """游戏加载后的准备工作: 建立或加载RAG索引、创建默认规则书条目、提取PDF文本"""
     auto_rag_processed_from_md = False
     
     # 1. 检查是否有单个规则书 .md 文件可以自动处理成RAG索引
     rulebook_info_for_md_processing = workshop_manager.check_auto_load_rulebook(cleaned_game_name)
     
     if rulebook_info_for_md_processing and os.path.exists(rulebook_info_for_md_processing['editable_text_path']):
-        file_size = os.path.getsize(rulebook_info_for_md_processing['editable_text_path'])
-        # 假设模板内容小于100字节 (或者可以检查是否与预定义模板完全相同)
-        if file_size > 100: 
+        editable_text_path = rulebook_info_for_md_processing['editable_text_path']
+        if not workshop_manager.rulebook_manager.is_template_content(editable_text_path, cleaned_game_name):
             try:
                 print(f"Game loaded: Found rulebook .md for '{cleaned_game_name}', attempting to process into RAG.")
-                langchain_manager.add_rulebook_text(
-                    rulebook_info_for_md_processing['editable_text_path'], 
-                    cleaned_game_name
-                )
-                # 更新 WorkshopManager 中的状态
                 pdf_key = rulebook_info_for_md_processing.get('pdf_identifier_key') or \
                           workshop_manager.get_identifier_key_by_path(
                               cleaned_game_name, 
-                              rulebook_info_for_md_processing['editable_text_path']
+                              editable_text_path
                           )
-                if pdf_key:
+                # 索引清单中的内容哈希与文件一致时不重新计算Embedding
+                rebuilt = langchain_manager.add_rulebook_text(
+                    editable_text_path,
+                    cleaned_game_name,
+                    skip_if_unchanged=True,
+                    rulebook_id=workshop_manager.get_rulebook_display_id(cleaned_game_name, pdf_key),
+                )
+                # 更新 WorkshopManager 中的状态
+                if pdf_key and rebuilt:
                      workshop_manager.update_rulebook_status(
                          cleaned_game_name, 
                          pdf_key, 
@@ -131,12 +260,62 @@ def game_loaded():
     if not workshop_manager.has_game(cleaned_game_name):
         print(f"Game loaded: First time loading '{cleaned_game_name}', creating default rulebook entry.")
         workshop_manager.create_default_rulebook_entry(cleaned_game_name)
+
+    # 4. 游戏加载后TTS已缓存其中的PDF，提取尚未提取的规则书文本
+    _extract_rulebook_texts_in_background(cleaned_game_name)
     
-    return jsonify({
+    return {
         "status": "success", 
         "message": f"游戏 {cleaned_game_name} 已加载", 
         "auto_rag_loaded": final_auto_rag_loaded_status
-    })
+    }
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except (OSError, TypeError):
+        return None
+
+def _loaded_game_version(cleaned_game_name):
+    """
+    决定游戏准备结果是否仍然有效的版本: 自动加载的规则书文件、磁盘上的索引清单、
+    游戏是否已记录、检索器是否仍在内存中 (重置游戏会清除)。只读取元数据，开销为微秒级。
+    """
+    rulebook_info = workshop_manager.check_auto_load_rulebook(cleaned_game_name)
+    return (
+        _file_version(rulebook_info.get('editable_text_path')) if rulebook_info else None,
+        _file_version(os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}", INDEX_MANIFEST_FILENAME)),
+        workshop_manager.has_game(cleaned_game_name),
+        cleaned_game_name in langchain_manager.game_retrievers,
+    )
+
+@app.route('/api/game/loaded', methods=['POST'])
+def game_loaded():
+    """
+    处理游戏加载通知。
+    同一游戏的并发通知只执行一次准备工作，其余等待并共享结果；
+    之后的通知在规则书文件和索引未变化时直接返回缓存的结果。
+    """
+    data = request.json
+    game_name = data.get('game_name')
+    
+    if not game_name:
+        return jsonify({"error": "缺少游戏名称"}), 400
+
+    # 清理 game_name
+    cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
+    access_stats.record(cleaned_game_name)
+
+    result, source = loaded_games.get(
+        cleaned_game_name,
+        lambda: _prepare_loaded_game(cleaned_game_name),
+        lambda: _loaded_game_version(cleaned_game_name),
+    )
+    METRICS.counter("tts_game_loaded_total", "游戏加载通知数 (按结果来源: computed/shared/cached)").inc(
+        labels={"source": source}
+    )
+    return jsonify(result)
 
 @app.route('/api/rulebook/refresh_rag_from_cache', methods=['POST'])
 def refresh_rag_from_cache():
@@ -160,17 +339,61 @@ def refresh_rag_from_cache():
         return jsonify({"error": f"规则书文件不存在: {rulebook_path}"}), 404
     
     try:
-        langchain_manager.add_rulebook_text(rulebook_path, game_name)
-        pdf_identifier_key = workshop_manager.get_identifier_key_by_path(game_name, rulebook_path)
+        with profiler.profile("refresh_rag_from_cache", game_name=game_name, rulebook=os.path.basename(rulebook_path)):
+            pdf_identifier_key = workshop_manager.get_identifier_key_by_path(game_name, rulebook_path)
+            langchain_manager.add_rulebook_text(
+                rulebook_path, game_name,
+                rulebook_id=workshop_manager.get_rulebook_display_id(game_name, pdf_identifier_key),
+            )
         if pdf_identifier_key:
             workshop_manager.update_rulebook_status(game_name, pdf_identifier_key, "processed_into_rag")
         return jsonify({"status": "success", "message": f"成功从 {os.path.basename(rulebook_path)} 更新RAG索引"})
     except Exception as e:
         return jsonify({"error": f"更新RAG索引失败: {str(e)}"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(METRICS.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """列出已保存的慢请求性能分析结果"""
+    return jsonify({"mode": profiler.mode, "profiles": profiler.list_profiles()})
+
+@app.route('/api/profiles/<path:filename>', methods=['GET'])
+def get_profile(filename):
+    """下载一份性能分析结果 (.prof 可用 pstats/snakeviz 打开，.txt 为文本摘要)"""
+    path = profiler.resolve_file(filename)
+    if not path:
+        return jsonify({"error": f"找不到性能分析结果: {filename}"}), 404
+    return send_file(path, as_attachment=filename.endswith(".prof"))
+
+@app.route('/api/stats/cache', methods=['GET'])
+def cache_stats():
+    """查询Embedding缓存和重排序缓存的命中统计"""
+    return jsonify(langchain_manager.get_cache_stats())
+
 if __name__ == '__main__':
-    # 启动时扫描TTS数据目录
-    workshop_manager.scan_all_tts_data()
+    # 旧版本按随机哈希命名的规则书文件改为确定的文件名，并合并重复文件
+    workshop_manager.migrate_rulebook_filenames()
+
+    # 启动时扫描TTS数据目录 (只解析上次扫描后新增或变化的Mod)
+    workshop_manager.scan_workshop_changes()
+
+    # 监视工坊清单，运行期间新订阅的Mod无需重启即可识别
+    workshop_watcher = workshop_manager.create_watcher(cfg.WORKSHOP_WATCHER, cfg.WORKSHOP_WATCH_POLL_INTERVAL)
+    if workshop_watcher and workshop_watcher.start():
+        print(f"工坊清单监视已启动 ({workshop_watcher.active_backend}): {workshop_watcher.directory}")
+
+    # 监视可编辑规则书目录，保存后自动重建索引
+    rulebook_watcher.start()
+
+    # 预热Embedding模型并预加载最近使用的游戏的检索器
+    _warm_up_in_background()
+
+    # 从已缓存的规则书PDF中提取文本 (在监视启动之后，提取结果会被自动索引)
+    _extract_rulebook_texts_in_background()
     
     # 启动Flask应用
     app.run(host=cfg.HOST, port=cfg.PORT) 
\ No newline at end of file
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TTSAssistantServer 性能与质量基准测试包
+在 TTSAssistantServer 目录下以模块方式运行，例如:
+    python -m benchmarks.retrieval_quality
+"""
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 共享Embedding服务基准
+模拟多个服务进程同时计算查询Embedding: 每个进程各自持有模型 (进程内) 与所有进程通过
+共享Embedding服务 (EMBEDDING_PROVIDER=service) 对比吞吐量和延迟。
+模型用带延迟的 HashingEmbeddings 模拟: 每次调用 (一批) 有固定开销 --latency-ms，每条文本另加 --per-text-latency-ms，
+调用期间占用一个所有进程共享的 "CPU核" (--cores 个)，与真实模型在CPU上推理时互相争用一样。
+进程内模型每个查询单独推理; 共享服务把并发的查询合并为一批，固定开销被分摊。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.embedding_service
+    python -m benchmarks.embedding_service --workers 4 --threads 8 --requests 50 --cores 4 --json results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import _percentile
+from services.embedding_service import EmbeddingService, EmbeddingServiceClient
+from services.fake_providers import HashingEmbeddings
+
+
+class _CpuBoundEmbeddings(HashingEmbeddings):
+    """模拟的CPU推理: 调用期间占用一个共享的CPU核 (进程间信号量)"""
+
+    def __init__(self, cores, latency_ms: float, per_text_latency_ms: float):
+        super().__init__(latency_ms=latency_ms, per_text_latency_ms=per_text_latency_ms)
+        self.cores = cores
+
+    def embed_documents(self, texts):
+        with self.cores:
+            return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        with self.cores:
+            return super().embed_query(text)
+
+
+def _worker(mode: str, socket_path: str, threads: int, requests: int, model_args: tuple, worker_id: int, results):
+    if mode == "service":
+        embeddings = EmbeddingServiceClient(socket_path, connect_timeout=10)
+    else:
+        embeddings = _CpuBoundEmbeddings(*model_args)
+
+    def ask(index):
+        start = time.perf_counter()
+        embeddings.embed_query(f"进程{worker_id} 问题{index}: 回合结束时手牌上限是多少？")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results.extend(list(executor.map(ask, range(threads * requests))))
+
+
+def run(mode: str, workers: int, threads: int, requests: int, cores: int, latency_ms: float,
+        per_text_latency_ms: float) -> dict:
+    """mode: in_process (每个进程各自的模型) / service (共享Embedding服务)"""
+    work_dir = tempfile.mkdtemp(prefix="tts_bench_embedding_service_")
+    socket_path = os.path.join(work_dir, "embeddings.sock")
+    context = multiprocessing.get_context("fork")
+    model_args = (context.Semaphore(cores), latency_ms, per_text_latency_ms)
+    service = None
+    if mode == "service":
+        service = EmbeddingService(_CpuBoundEmbeddings(*model_args), socket_path, max_batch_size=64).start()
+    try:
+        with context.Manager() as manager:
+            latencies = manager.list()
+            processes = [
+                context.Process(target=_worker, args=(mode, socket_path, threads, requests, model_args, i, latencies))
+                for i in range(workers)
+            ]
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            seconds = time.perf_counter() - start
+            latencies = list(latencies)
+    finally:
+        if service is not None:
+            service.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "mode": mode,
+        "model_copies": 1 if mode == "service" else workers,
+        "queries": len(latencies),
+        "queries_per_second": round(len(latencies) / seconds, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享Embedding服务与进程内模型的吞吐量对比 (模拟模型)")
+    parser.add_argument("--workers", type=int, default=4, help="服务进程数")
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的并发请求数")
+    parser.add_argument("--requests", type=int, default=20, help="每个并发请求依次发送的查询数")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="模拟推理可用的CPU核数")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="模拟模型每次调用 (一批) 的固定推理时间")
+    parser.add_argument("--per-text-latency-ms", type=float, default=1.0, help="模拟模型每条文本的额外推理时间")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = [run(mode, args.workers, args.threads, args.requests, args.cores, args.latency_ms,
+                   args.per_text_latency_ms)
+               for mode in ("in_process", "service")]
+
+    print(f"{args.workers} 个进程 x {args.threads} 个并发请求, {args.cores} 个CPU核, "
+          f"模拟推理 {args.latency_ms:g}ms/批 + {args.per_text_latency_ms:g}ms/条")
+    print(f"{'方式':<12}{'模型副本':>8}{'查询/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for result in results:
+        print(f"{result['mode']:<12}{result['model_copies']:>8}{result['queries_per_second']:>10.1f}"
+              f"{result['latency_ms']['p50']:>10.2f}{result['latency_ms']['p95']:>10.2f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - /api/game/loaded 并发负载测试
+模拟多张桌子同时加载同一个热门Mod: 同时发出大量同一游戏的加载通知，
+检查准备工作 (索引检查/加载、默认条目、PDF提取) 只执行一次，并测量之后已准备好的游戏的响应时间。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.game_loaded
+    python -m benchmarks.game_loaded --concurrency 100 --sections 100 --json results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import BENCHMARK_GAME, _benchmark_config, _percentile, _quiet
+from benchmarks.synthetic_data import generate_rulebook
+
+
+def _latency_summary(latencies):
+    return {
+        "mean": round(statistics.mean(latencies) * 1e6, 1),
+        "p50": round(_percentile(latencies, 0.50) * 1e6, 1),
+        "p95": round(_percentile(latencies, 0.95) * 1e6, 1),
+        "max": round(max(latencies) * 1e6, 1),
+    }
+
+
+def run(concurrency: int, sections: int, cached_requests: int, seed: int, quiet: bool) -> dict:
+    from services.langchain_manager import LangchainManager
+    from services.single_flight import SingleFlightCache
+    from services.workshop_manager import WorkshopManager
+    import app as app_module
+
+    with _quiet(quiet):
+        app_module.langchain_manager = LangchainManager()
+        app_module.workshop_manager = WorkshopManager()
+        app_module.loaded_games = SingleFlightCache()
+        # 游戏只有一本已填写的规则书，第一次通知会建立索引
+        app_module.workshop_manager.create_default_rulebook_entry(BENCHMARK_GAME)
+        rulebook = app_module.workshop_manager.check_auto_load_rulebook(BENCHMARK_GAME)
+        with open(rulebook["editable_text_path"], "w", encoding="utf-8") as f:
+            f.write(generate_rulebook(sections, seed=seed))
+
+    prepare_calls = []
+    prepare = app_module._prepare_loaded_game
+
+    def counting_prepare(game_name):
+        prepare_calls.append(game_name)
+        return prepare(game_name)
+
+    barrier = threading.Barrier(concurrency)
+
+    def notify(_):
+        client = app_module.app.test_client()
+        barrier.wait()
+        start = time.perf_counter()
+        response = client.post("/api/game/loaded", json={"game_name": BENCHMARK_GAME})
+        return time.perf_counter() - start, response.status_code
+
+    with patch.object(app_module, "_prepare_loaded_game", counting_prepare), _quiet(quiet):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            burst = list(executor.map(notify, range(concurrency)))
+        burst_seconds = time.perf_counter() - start
+
+        # 已准备好的游戏: 通过HTTP处理函数和直接查询缓存各测一次
+        client = app_module.app.test_client()
+        http_latencies, cache_latencies = [], []
+        for _ in range(cached_requests):
+            start = time.perf_counter()
+            client.post("/api/game/loaded", json={"game_name": BENCHMARK_GAME})
+            http_latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            app_module.loaded_games.get(
+                BENCHMARK_GAME,
+                lambda: app_module._prepare_loaded_game(BENCHMARK_GAME),
+                lambda: app_module._loaded_game_version(BENCHMARK_GAME),
+            )
+            cache_latencies.append(time.perf_counter() - start)
+
+    return {
+        "concurrency": concurrency,
+        "prepare_calls": len(prepare_calls),
+        "errors": sum(status != 200 for _, status in burst),
+        "burst_seconds": round(burst_seconds, 4),
+        "burst_latency_us": _latency_summary([seconds for seconds, _ in burst]),
+        "cached_http_latency_us": _latency_summary(http_latencies),
+        "cached_lookup_latency_us": _latency_summary(cache_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/game/loaded 并发负载测试 (模拟LLM/Embedding)")
+    parser.add_argument("--concurrency", type=int, default=100, help="同时发出的加载通知数")
+    parser.add_argument("--sections", type=int, default=100, help="合成规则书的章节数")
+    parser.add_argument("--cached-requests", type=int, default=1000, help="准备完成后测量的通知数")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="模拟Embedding每次调用的延迟")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+    args.llm_latency_ms = 0.0
+    args.llm_per_token_latency_ms = 0.0
+
+    work_dir = tempfile.mkdtemp(prefix="tts_bench_game_loaded_")
+    try:
+        with _benchmark_config(work_dir, args):
+            result = run(args.concurrency, args.sections, args.cached_requests, args.seed, not args.verbose)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    burst, http, lookup = result["burst_latency_us"], result["cached_http_latency_us"], result["cached_lookup_latency_us"]
+    print(f"{result['concurrency']} 个并发通知: 准备工作执行 {result['prepare_calls']} 次，错误 {result['errors']}，"
+          f"总耗时 {result['burst_seconds']:.3f}s (p50 {burst['p50'] / 1000:.1f}ms, 最大 {burst['max'] / 1000:.1f}ms)")
+    print(f"已准备好的游戏: HTTP p50 {http['p50']:.0f}us / p95 {http['p95']:.0f}us，"
+          f"缓存查询 p50 {lookup['p50']:.1f}us / p95 {lookup['p95']:.1f}us")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"结果已写入 {args.json}")
+    if result["prepare_calls"] != 1 or result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
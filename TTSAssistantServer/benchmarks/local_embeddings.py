@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 本地Embedding后端基准
+比较 sentence_transformers 提供商的各个后端 (SENTENCE_TRANSFORMER_BACKEND):
+建立索引的吞吐量 (块/秒)、单条查询延迟、模型加载时间，以及与 torch 后端向量的余弦相似度。
+需要安装对应后端的依赖，未安装的后端会被跳过。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.local_embeddings
+    python -m benchmarks.local_embeddings --backends torch,onnx_int8 --threads 4 --chunks 2000 --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import config as cfg
+from benchmarks.run_benchmarks import _percentile
+from benchmarks.synthetic_data import generate_rulebook
+from services.local_embeddings import LOCAL_BACKENDS, create_local_embeddings
+from services.markdown_chunker import MarkdownSectionSplitter
+
+QUESTIONS = ["每位玩家起始有多少金币？", "回合结束时手牌上限是多少？", "如何获得胜利？", "交易阶段可以做什么？"]
+
+
+def _create(backend: str, model_name: str, threads: int, batch_size: int):
+    if backend == "torch":
+        try:
+            import torch
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+        except ImportError:
+            raise ImportError("未安装sentence-transformers库，请使用pip install sentence-transformers安装")
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': batch_size},
+        )
+    return create_local_embeddings(model_name, backend, cfg.ONNX_MODEL_DIRECTORY, threads=threads,
+                                   max_batch_size=batch_size)
+
+
+def run_backend(backend: str, model_name: str, chunks: List[str], queries: int, threads: int,
+                batch_size: int) -> Optional[Dict]:
+    """测量一个后端，依赖未安装时返回None"""
+    start = time.perf_counter()
+    try:
+        embeddings = _create(backend, model_name, threads, batch_size)
+    except ImportError as e:
+        print(f"跳过 {backend}: {e}")
+        return None
+    load_seconds = time.perf_counter() - start
+    embeddings.embed_query("预热")
+
+    start = time.perf_counter()
+    vectors = np.array(embeddings.embed_documents(chunks), dtype=np.float32)
+    index_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        # 每次使用不同的文本，不受任何缓存影响
+        question = f"{QUESTIONS[i % len(QUESTIONS)]} ({i})"
+        start = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "chunks_per_second": round(len(chunks) / index_seconds, 1),
+        "query_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+        },
+        "vectors": vectors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较本地Embedding后端的吞吐量和查询延迟")
+    parser.add_argument("--backends", default=",".join(("torch",) + LOCAL_BACKENDS), help="要比较的后端，逗号分隔")
+    parser.add_argument("--model", default=cfg.SENTENCE_TRANSFORMER_MODEL, help="SentenceTransformer 模型名")
+    parser.add_argument("--chunks", type=int, default=1000, help="建立索引的文档块数")
+    parser.add_argument("--queries", type=int, default=200, help="测量单条查询延迟的次数")
+    parser.add_argument("--threads", type=int, default=0, help="推理线程数 (0 表示CPU核数)")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批的文本数")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    documents, _ = MarkdownSectionSplitter().split_text(
+        generate_rulebook(max(args.chunks // 3, 1), seed=args.seed), {"source": "rulebook"}
+    )
+    chunks = [doc.page_content for doc in documents][:args.chunks]
+    print(f"模型 {args.model}, {len(chunks)} 个文档块, 推理线程 {args.threads or os.cpu_count()}")
+
+    results = []
+    for backend in [name.strip() for name in args.backends.split(",") if name.strip()]:
+        result = run_backend(backend, args.model, chunks, args.queries, args.threads, args.batch_size)
+        if result is not None:
+            results.append(result)
+    if not results:
+        print("没有可用的后端")
+        sys.exit(1)
+
+    # 以 torch 后端 (未测量时以第一个后端) 为基准比较向量
+    vectors = {result["backend"]: result.pop("vectors") for result in results}
+    baseline = next((result for result in results if result["backend"] == "torch"), results[0])
+    print(f"{'后端':<12}{'加载(s)':>9}{'块/秒':>10}{'加速':>8}{'查询p50(ms)':>13}{'查询p95(ms)':>13}{'余弦相似度':>12}")
+    for result in results:
+        # 向量已归一化，点积即余弦相似度
+        similarity = np.sum(vectors[result["backend"]] * vectors[baseline["backend"]], axis=1)
+        result["cosine_to_baseline"] = round(float(np.mean(similarity)), 4)
+        result["speedup"] = round(result["chunks_per_second"] / baseline["chunks_per_second"], 2)
+        print(f"{result['backend']:<12}{result['load_seconds']:>9.2f}{result['chunks_per_second']:>10.1f}"
+              f"{result['speedup']:>7.2f}x{result['query_ms']['p50']:>13.2f}{result['query_ms']['p95']:>13.2f}"
+              f"{result['cosine_to_baseline']:>12.4f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则书PDF文本提取基准
+生成合成的多页PDF规则书，比较不同进程数和每任务页数下的提取速度 (页/秒) 和内存峰值。
+
+用法 (在 TTSAssistantServer 目录下，需要 pip install pypdf):
+    python -m benchmarks.pdf_extraction
+    python -m benchmarks.pdf_extraction --pages 300 --workers 1,2,4 --pages-per-task 10,20,50
+    python -m benchmarks.pdf_extraction --json results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_data import generate_pdf
+from services.pdf_extractor import PdfTextExtractor, pypdf_available
+
+
+def _children_max_rss_mb():
+    """已结束的子进程中最大的常驻内存 (MB，Linux 上 ru_maxrss 单位为KB)，无法获取时返回None"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0, 1)
+
+
+def run_case(pdf_path: str, output_path: str, pages: int, workers: int, pages_per_task: int) -> dict:
+    extractor = PdfTextExtractor(max_workers=workers, pages_per_task=pages_per_task)
+    started_at = time.perf_counter()
+    result = extractor.extract(pdf_path, output_path)
+    seconds = time.perf_counter() - started_at
+    if result["error"]:
+        raise RuntimeError(result["error"])
+    # tracemalloc 会显著拖慢提取，内存峰值在单独一轮中测量
+    tracemalloc.start()
+    extractor.extract(pdf_path, output_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "workers": workers,
+        "pages_per_task": pages_per_task,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 1),
+        # 单进程时为提取过程的Python内存峰值，多进程时主进程只负责拼接文件
+        "main_process_peak_mb": round(peak / 1024 / 1024, 1),
+        "worker_max_rss_mb": _children_max_rss_mb() if workers > 1 else None,
+        "output_mb": round(os.path.getsize(output_path) / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则书PDF文本提取基准")
+    parser.add_argument("--pages", type=int, default=300, help="合成PDF的页数")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="逗号分隔的进程数")
+    parser.add_argument("--pages-per-task", default="20", help="逗号分隔的每任务页数")
+    parser.add_argument("--seed", type=int, default=0, help="合成PDF的随机种子")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    if not pypdf_available():
+        parser.error("未安装pypdf库，请使用pip install pypdf安装")
+
+    worker_counts = sorted({int(value) for value in args.workers.split(",") if value.strip()})
+    task_sizes = sorted({int(value) for value in args.pages_per_task.split(",") if value.strip()})
+
+    temp_dir = tempfile.mkdtemp(prefix="tts_pdf_bench_")
+    try:
+        pdf_path = os.path.join(temp_dir, "rulebook.pdf")
+        generate_pdf(pdf_path, args.pages, seed=args.seed)
+        print(f"合成PDF: {args.pages} 页，{os.path.getsize(pdf_path) / 1024 / 1024:.2f} MB，CPU核数 {os.cpu_count()}")
+        print(f"{'进程数':>6} {'每任务页数':>10} {'耗时(s)':>9} {'页/秒':>8} {'主进程峰值(MB)':>15} {'工作进程RSS(MB)':>16}")
+
+        results = []
+        for workers in worker_counts:
+            for pages_per_task in task_sizes:
+                case = run_case(pdf_path, os.path.join(temp_dir, "rulebook.md"), args.pages, workers, pages_per_task)
+                results.append(case)
+                worker_rss = f"{case['worker_max_rss_mb']:.1f}" if case["worker_max_rss_mb"] is not None else "-"
+                print(f"{workers:>6} {pages_per_task:>10} {case['seconds']:>9.2f} {case['pages_per_second']:>8.1f} "
+                      f"{case['main_process_peak_mb']:>15.1f} {worker_rss:>16}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"pages": args.pages, "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+        print(f"结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
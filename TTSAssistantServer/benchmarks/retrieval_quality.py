@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 离线检索质量基准
+用已知的 问题 -> 章节 对评估不同分块策略的检索命中率，不需要LLM或Embedding服务。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.retrieval_quality
+    python -m benchmarks.retrieval_quality --k 3 --json results.json
+    python -m benchmarks.retrieval_quality --rulebook my_rules.md --qa my_rules_qa.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from services.fake_providers import HashingEmbeddings
+from services.context_builder import build_context, expand_to_parents
+from services.markdown_chunker import MarkdownSectionSplitter, SECTION_PATH_SEPARATOR, section_spans
+from services.reranker import LexicalOverlapReranker
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_RULEBOOK = os.path.join(DATA_DIR, "sample_rulebook.md")
+DEFAULT_QA = os.path.join(DATA_DIR, "sample_rulebook_qa.json")
+
+
+def _covers(section_path: str, expected: str) -> bool:
+    """检索到的章节是期望章节本身或其子章节"""
+    return section_path == expected or section_path.startswith(expected + SECTION_PATH_SEPARATOR)
+
+
+def _sections_of_range(spans: List[Tuple[str, int, int]], start: int, end: int) -> List[str]:
+    """字符区间 [start, end) 覆盖到的所有章节"""
+    return [path for path, span_start, span_end in spans if span_start < end and start < span_end]
+
+
+class Strategy:
+    """一种分块 + 检索方式"""
+
+    def __init__(self, name: str, build: Callable[[str], Tuple[List[Document], Dict[str, Document]]],
+                 small_to_big: bool = False, rerank_candidates: int = 0, rerank_top_n: int = 0):
+        self.name = name
+        self.build = build
+        self.small_to_big = small_to_big
+        # rerank_candidates > 0 时先检索这么多候选块，再用 lexical 重排序保留 rerank_top_n 块
+        self.rerank_candidates = rerank_candidates
+        self.rerank_top_n = rerank_top_n
+
+
+def _recursive(text: str):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    return splitter.create_documents([text], metadatas=[{"source": "rulebook"}]), {}
+
+
+def _markdown(text: str):
+    children, parents = MarkdownSectionSplitter().split_text(text, {"source": "rulebook"})
+    return children, {doc.metadata["parent_id"]: doc for doc in parents}
+
+
+STRATEGIES = [
+    Strategy("recursive_1000_200", _recursive),
+    Strategy("markdown_sections", _markdown),
+    Strategy("markdown_small_to_big", _markdown, small_to_big=True),
+    Strategy("markdown_rerank_30_to_3", _markdown, small_to_big=True, rerank_candidates=30, rerank_top_n=3),
+]
+
+
+def evaluate(strategy: Strategy, text: str, qa_pairs: List[Dict], k: int, context_budget: int) -> Dict:
+    """评估一种策略，返回命中率、MRR和上下文大小"""
+    spans = section_spans(text)
+    chunks, parents = strategy.build(text)
+    store = FAISS.from_documents(chunks, HashingEmbeddings())
+    reranker = LexicalOverlapReranker() if strategy.rerank_candidates else None
+
+    hits = 0
+    reciprocal_rank_total = 0.0
+    context_chars_total = 0
+    context_tokens_total = 0
+    misses = []
+    for pair in qa_pairs:
+        if reranker is not None:
+            docs = store.similarity_search(pair["question"], k=max(k, strategy.rerank_candidates))
+            docs = reranker.rerank(pair["question"], docs, min(k, strategy.rerank_top_n))
+        else:
+            docs = store.similarity_search(pair["question"], k=k)
+        if strategy.small_to_big:
+            docs = expand_to_parents(docs, parents)
+
+        rank = None
+        for position, doc in enumerate(docs, start=1):
+            if "section_path" in doc.metadata:
+                sections = [doc.metadata["section_path"]]
+            else:
+                start = doc.metadata.get("start_index", 0)
+                sections = _sections_of_range(spans, start, start + len(doc.page_content))
+            if any(_covers(section, pair["section"]) for section in sections):
+                rank = position
+                break
+        if rank is not None:
+            hits += 1
+            reciprocal_rank_total += 1.0 / rank
+        else:
+            misses.append(pair["question"])
+
+        context_docs, context_tokens = build_context(docs, context_budget)
+        context_chars_total += sum(len(doc.page_content) for doc in context_docs)
+        context_tokens_total += context_tokens
+
+    count = len(qa_pairs) or 1
+    return {
+        "strategy": strategy.name,
+        "chunks": len(chunks),
+        "k": k,
+        f"hit_at_{k}": round(hits / count, 3),
+        "mrr": round(reciprocal_rank_total / count, 3),
+        "avg_context_chars": round(context_chars_total / count),
+        "avg_context_tokens": round(context_tokens_total / count),
+        "misses": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线评估规则书分块策略的检索质量")
+    parser.add_argument("--rulebook", default=DEFAULT_RULEBOOK, help="Markdown规则书路径")
+    parser.add_argument("--qa", default=DEFAULT_QA, help="问题->章节 对的JSON文件")
+    parser.add_argument("--k", type=int, default=5, help="每个问题检索的块数")
+    parser.add_argument("--context-budget", type=int, default=2000, help="上下文token预算")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    with open(args.rulebook, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(args.qa, "r", encoding="utf-8") as f:
+        qa_pairs = json.load(f)
+
+    results = [evaluate(strategy, text, qa_pairs, args.k, args.context_budget) for strategy in STRATEGIES]
+
+    print(f"规则书: {args.rulebook} ({len(qa_pairs)} 个问题, k={args.k})")
+    print(f"{'策略':<26}{'块数':>6}{'命中率':>8}{'MRR':>8}{'上下文字符':>12}{'上下文tokens':>14}")
+    for result in results:
+        print(f"{result['strategy']:<26}{result['chunks']:>6}{result[f'hit_at_{args.k}']:>8.3f}"
+              f"{result['mrr']:>8.3f}{result['avg_context_chars']:>12}{result['avg_context_tokens']:>14}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
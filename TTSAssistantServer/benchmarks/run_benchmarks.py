@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 性能基准测试
+使用确定性的模拟LLM/Embedding (LLM_PROVIDER=fake) 和合成数据，测量:
+    scan            WorkshopManager.scan_all_tts_data() 扫描合成工坊库
+    index_build     LangchainManager.add_rulebook_text() 构建规则书索引
+    retriever_load  从磁盘冷加载检索器 / 内存中热加载
+    ask             通过 Flask 测试客户端并发调用 /ask 的吞吐量和延迟
+并记录各阶段的进程内存，结果写入JSON，便于在版本之间比较。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.run_benchmarks --sizes small,medium --output bench.json
+    python -m benchmarks.run_benchmarks --llm-latency-ms 300 --embedding-latency-ms 30
+    python -m benchmarks.run_benchmarks --output new.json --compare bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config as cfg
+from benchmarks.synthetic_data import generate_rulebook
+from benchmarks.synthetic_library import generate_library
+
+# 各规模对应的合成数据大小
+SIZES = {
+    "small": {"mods": 20, "rulebook_sections": 20},
+    "medium": {"mods": 200, "rulebook_sections": 100},
+    "large": {"mods": 1000, "rulebook_sections": 400},
+    "xlarge": {"mods": 10000, "rulebook_sections": 1000},
+}
+
+BENCHMARK_GAME = "Benchmark Game"
+
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存 (MB)"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以KB为单位
+        return usage / (1024.0 * 1024.0) if sys.platform == "darwin" else usage / 1024.0
+    except (ImportError, OSError):
+        return 0.0
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool = True) -> Iterator[None]:
+    """屏蔽被测代码的 print 输出，避免终端输出影响计时"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def _benchmark_config(work_dir: str, args: argparse.Namespace) -> Iterator[None]:
+    """把数据目录指向临时目录，并使用模拟提供商"""
+    overrides = {
+        "TTS_DATA_DIRECTORY": os.path.join(work_dir, "tts"),
+        "EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY": os.path.join(work_dir, "cache", "editable_rulebook_texts"),
+        "VECTOR_STORE_DIRECTORY": os.path.join(work_dir, "cache", "vector_stores"),
+        "PROCESSED_MODS_FILE": os.path.join(work_dir, "processed_mods.json"),
+        "PROFILES_DIRECTORY": os.path.join(work_dir, "profiles"),
+        "LLM_PROVIDER": "fake",
+        "EMBEDDING_PROVIDER": "fake",
+        "CONDENSE_LLM_MODEL": "",
+        "FAKE_LLM_LATENCY_MS": args.llm_latency_ms,
+        "FAKE_LLM_PER_TOKEN_LATENCY_MS": args.llm_per_token_latency_ms,
+        "FAKE_EMBEDDING_LATENCY_MS": args.embedding_latency_ms,
+        "DEBUG": False,
+    }
+    with contextlib.ExitStack() as stack:
+        for name, value in overrides.items():
+            stack.enter_context(patch.object(cfg, name, value))
+        yield
+
+
+def bench_scan(mods: int, seed: int, quiet: bool) -> Dict:
+    """生成合成工坊库并测量完整扫描耗时"""
+    from services.workshop_manager import WorkshopManager
+
+    library = generate_library(cfg.TTS_DATA_DIRECTORY, mods, seed=seed)
+    rss_before = _rss_mb()
+    with _quiet(quiet):
+        manager = WorkshopManager()
+        start = time.perf_counter()
+        manager.scan_all_tts_data()
+        seconds = time.perf_counter() - start
+    return {
+        "mods": mods,
+        "pdf_objects": library["pdf_objects"],
+        "broken_entries": sum(library["broken"].values()),
+        "library_mb": round(library["bytes"] / (1024 * 1024), 2),
+        "games_recorded": len(manager.processed_mods),
+        "seconds": round(seconds, 4),
+        "mods_per_second": round(mods / seconds, 1) if seconds else None,
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def bench_index_build(sections: int, seed: int, quiet: bool) -> Dict:
+    """生成合成规则书并测量索引构建耗时"""
+    from services.langchain_manager import LangchainManager
+
+    rulebook_path = os.path.join(cfg.EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY, "benchmark_rulebook.md")
+    os.makedirs(os.path.dirname(rulebook_path), exist_ok=True)
+    text = generate_rulebook(sections, seed=seed)
+    with open(rulebook_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    rss_before = _rss_mb()
+    with _quiet(quiet):
+        manager = LangchainManager()
+        start = time.perf_counter()
+        manager.add_rulebook_text(rulebook_path, BENCHMARK_GAME)
+        seconds = time.perf_counter() - start
+    vector_store = manager.game_retrievers[BENCHMARK_GAME].vectorstore
+    return {
+        "rulebook_chars": len(text),
+        "chunks": vector_store.index.ntotal,
+        "seconds": round(seconds, 4),
+        "chars_per_second": round(len(text) / seconds) if seconds else None,
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def bench_retriever_load(quiet: bool) -> Dict:
+    """新的管理器从磁盘冷加载检索器，再测一次内存中的热加载"""
+    from services.langchain_manager import LangchainManager
+
+    with _quiet(quiet):
+        manager = LangchainManager()
+        start = time.perf_counter()
+        retriever = manager.load_or_get_retriever(BENCHMARK_GAME)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        manager.load_or_get_retriever(BENCHMARK_GAME)
+        warm = time.perf_counter() - start
+    return {
+        "loaded": retriever is not None,
+        "cold_ms": round(cold * 1000, 3),
+        "warm_ms": round(warm * 1000, 3),
+    }
+
+
+def bench_first_question(sections: int, quiet: bool) -> Dict:
+    """重启后的第一个问题: 冷启动、预热并预加载检索器之后，与之后的稳定状态比较"""
+    from services.langchain_manager import LangchainManager
+
+    # 稳定状态使用另一个问题，避免命中查询Embedding缓存
+    first_question, next_question = _questions(max(2, sections), 2)
+
+    def first_and_next(preload: bool):
+        with _quiet(quiet):
+            manager = LangchainManager()
+            if preload:
+                manager.warm_up_embeddings()
+                manager.preload_retrievers([BENCHMARK_GAME], memory_budget_mb=0)
+            start = time.perf_counter()
+            manager.get_answer(first_question, BENCHMARK_GAME, "first")
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            manager.get_answer(next_question, BENCHMARK_GAME, "next")
+            steady = time.perf_counter() - start
+        return first, steady
+
+    cold, steady = first_and_next(preload=False)
+    preloaded, _ = first_and_next(preload=True)
+    return {
+        "cold_ms": round(cold * 1000, 3),
+        "preloaded_ms": round(preloaded * 1000, 3),
+        "steady_ms": round(steady * 1000, 3),
+    }
+
+
+def _questions(sections: int, count: int) -> List[str]:
+    return [f"第{(i % sections) + 1}章的玩家行动规则是什么？" for i in range(count)]
+
+
+def bench_ask(sections: int, requests: int, concurrency: int, quiet: bool) -> Dict:
+    """通过 Flask 测试客户端并发调用 /ask"""
+    from services.langchain_manager import LangchainManager
+    from services.workshop_manager import WorkshopManager
+    import app as app_module
+
+    with _quiet(quiet):
+        app_module.langchain_manager = LangchainManager()
+        app_module.workshop_manager = WorkshopManager()
+
+    questions = _questions(sections, requests)
+    latencies: List[float] = []
+    errors = 0
+
+    def call(index: int):
+        client = app_module.app.test_client()
+        payload = {
+            "question": questions[index],
+            "game_name": BENCHMARK_GAME,
+            "player_info": {"player_id": f"player_{index % max(1, concurrency)}"},
+        }
+        start = time.perf_counter()
+        response = client.post("/ask", json=payload)
+        return time.perf_counter() - start, response.status_code
+
+    rss_before = _rss_mb()
+    with _quiet(quiet):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for seconds, status in executor.map(call, range(requests)):
+                latencies.append(seconds)
+                errors += status != 200
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(requests / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+        },
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+        "cache_stats": app_module.langchain_manager.get_cache_stats(),
+    }
+
+
+def run_size(size: str, args: argparse.Namespace) -> Dict:
+    """在独立的临时目录中运行一个规模的全部基准"""
+    spec = SIZES[size]
+    work_dir = tempfile.mkdtemp(prefix=f"tts_bench_{size}_")
+    try:
+        with _benchmark_config(work_dir, args):
+            results = {"size": spec, "rss_start_mb": round(_rss_mb(), 1)}
+            results["scan"] = bench_scan(spec["mods"], args.seed, not args.verbose)
+            results["index_build"] = bench_index_build(spec["rulebook_sections"], args.seed, not args.verbose)
+            results["retriever_load"] = bench_retriever_load(not args.verbose)
+            results["first_question"] = bench_first_question(spec["rulebook_sections"], not args.verbose)
+            results["ask"] = bench_ask(spec["rulebook_sections"], args.ask_requests, args.ask_concurrency,
+                                       not args.verbose)
+            results["rss_end_mb"] = round(_rss_mb(), 1)
+            return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _flatten(data, prefix: str = "") -> Dict[str, float]:
+    """把嵌套结果展开为 {"small.scan.seconds": 0.12} 形式的数值字典"""
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = float(data)
+    return flat
+
+
+def compare(old: Dict, new: Dict) -> List[str]:
+    """逐项比较两次基准结果中的数值，返回可打印的行"""
+    old_flat = _flatten(old.get("results", {}))
+    new_flat = _flatten(new.get("results", {}))
+    lines = [f"{'指标':<52}{'旧':>12}{'新':>12}{'变化':>10}"]
+    for key in sorted(set(old_flat) & set(new_flat)):
+        before, after = old_flat[key], new_flat[key]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        lines.append(f"{key:<52}{before:>12.4g}{after:>12.4g}{change:>10}")
+    return lines
+
+
+def _print_summary(size: str, results: Dict):
+    scan, index, load, ask = results["scan"], results["index_build"], results["retriever_load"], results["ask"]
+    print(f"[{size}] 扫描 {scan['mods']} 个Mod: {scan['seconds']:.3f}s ({scan['mods_per_second']} mods/s)")
+    print(f"[{size}] 索引构建 {index['rulebook_chars']} 字符 -> {index['chunks']} 块: {index['seconds']:.3f}s")
+    print(f"[{size}] 检索器加载: 冷 {load['cold_ms']:.1f}ms / 热 {load['warm_ms']:.3f}ms")
+    first = results["first_question"]
+    print(f"[{size}] 重启后第一个问题: 冷启动 {first['cold_ms']:.1f}ms / 预加载后 {first['preloaded_ms']:.1f}ms / "
+          f"稳定 {first['steady_ms']:.1f}ms")
+    print(f"[{size}] /ask x{ask['requests']} (并发 {ask['concurrency']}): {ask['requests_per_second']} req/s, "
+          f"p50 {ask['latency_ms']['p50']}ms, p95 {ask['latency_ms']['p95']}ms, 错误 {ask['errors']}")
+    print(f"[{size}] 内存: {results['rss_start_mb']}MB -> {results['rss_end_mb']}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTSAssistantServer 性能基准测试 (模拟LLM/Embedding)")
+    parser.add_argument("--sizes", default="small,medium", help=f"逗号分隔的规模: {', '.join(SIZES)}")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="模拟LLM每次调用的延迟")
+    parser.add_argument("--llm-per-token-latency-ms", type=float, default=0.0, help="模拟LLM每个输出字符的延迟")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="模拟Embedding每次调用的延迟")
+    parser.add_argument("--ask-requests", type=int, default=50, help="/ask 请求总数")
+    parser.add_argument("--ask-concurrency", type=int, default=4, help="/ask 并发数")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--compare", help="与之前的结果JSON比较")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的日志输出")
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"未知的规模: {', '.join(unknown)}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for size in sizes:
+        results = run_size(size, args)
+        report["results"][size] = results
+        _print_summary(size, results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report)))
+
+
+if __name__ == "__main__":
+    main()
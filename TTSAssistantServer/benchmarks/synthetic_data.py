@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 基准测试用的合成数据
+按给定规模和随机种子生成确定性的规则书 (Markdown 和 PDF)，相同参数总是生成相同内容。
+合成的TTS工坊库见 benchmarks/synthetic_library.py。
+"""
+
+import random
+
+# 规则书正文的词汇表
+_NOUNS = ["玩家", "卡牌", "金币", "版图", "骰子", "回合", "行动", "资源", "建筑", "单位",
+          "货物", "事件", "星港", "声望", "手牌", "牌堆", "标记", "区域", "阶段", "设施"]
+_VERBS = ["抽取", "打出", "支付", "获得", "移动", "放置", "弃掉", "翻开", "结算", "交换"]
+_QUANTIFIERS = ["一张", "两张", "三个", "任意数量的", "最多两个", "每个", "至少一枚", "全部"]
+_CONDITIONS = ["如果", "当", "在", "除非", "每当"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return (f"{rng.choice(_CONDITIONS)}{rng.choice(_NOUNS)}{rng.choice(_VERBS)}{rng.choice(_QUANTIFIERS)}"
+            f"{rng.choice(_NOUNS)}时，{rng.choice(_NOUNS)}{rng.choice(_VERBS)}{rng.choice(_QUANTIFIERS)}"
+            f"{rng.choice(_NOUNS)}。")
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return "".join(_sentence(rng) for _ in range(sentences))
+
+
+def generate_rulebook(sections: int, seed: int = 0, title: str = "合成游戏") -> str:
+    """
+    生成Markdown规则书: sections 个二级章节，每个章节包含段落、三级小节，
+    并穿插表格和列表，结构接近真实规则书。
+    """
+    rng = random.Random(seed)
+    lines = [f"# {title} 规则书", "", _paragraph(rng, 3), ""]
+    for index in range(1, sections + 1):
+        lines += [f"## 第{index}章 {rng.choice(_NOUNS)}{rng.choice(_VERBS)}规则", "", _paragraph(rng, rng.randint(2, 5)), ""]
+        for sub_index in range(1, rng.randint(1, 3) + 1):
+            lines += [f"### {index}.{sub_index} {rng.choice(_NOUNS)}的{rng.choice(_VERBS)}", "",
+                      _paragraph(rng, rng.randint(2, 6)), ""]
+        if index % 4 == 0:
+            lines += ["| 人数 | 起始金币 | 起始手牌 |", "| --- | --- | --- |"]
+            lines += [f"| {players} | {rng.randint(3, 10)} | {rng.randint(2, 6)} |" for players in range(2, 6)]
+            lines.append("")
+        if index % 3 == 0:
+            lines += [f"{item}. {_sentence(rng)}" for item in range(1, rng.randint(3, 6))]
+            lines.append("")
+    return "\n".join(lines)
+
+
+# PDF规则书使用的英文词汇 (标准Type1字体只能显示ASCII字符)
+_PDF_WORDS = ["player", "card", "coin", "board", "dice", "turn", "action", "resource", "building", "unit",
+              "draw", "play", "pay", "gain", "move", "place", "discard", "reveal", "score", "trade",
+              "each", "any", "two", "three", "up", "to", "the", "a", "when", "if", "during", "phase"]
+
+
+def _pdf_line(rng: random.Random) -> str:
+    return " ".join(rng.choice(_PDF_WORDS) for _ in range(rng.randint(8, 14))).capitalize() + "."
+
+
+def generate_pdf(path: str, pages: int, seed: int = 0, lines_per_page: int = 45):
+    """
+    生成包含文本的多页PDF (不依赖PDF库，直接写出对象和交叉引用表)，
+    每页带有章节标题和若干行规则文本，用于PDF文本提取的测试和基准测试。
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # 页面树，等所有页面对象编号确定后再生成
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(1, pages + 1):
+        lines = [f"Chapter {page}: {rng.choice(_PDF_WORDS).capitalize()} rules"]
+        lines += [_pdf_line(rng) for _ in range(lines_per_page)]
+        text_ops = " ".join(f"({line}) '" for line in lines)
+        content = f"BT /F1 10 Tf 12 TL 50 770 Td {text_ops} ET".encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
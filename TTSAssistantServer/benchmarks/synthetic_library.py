@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 合成TTS工坊库生成器
+生成 Mods/Workshop/WorkshopFileInfos.json 和 N 个Mod存档JSON，用于对
+WorkshopManager 的扫描、规则书引用处理和元数据持久化做规模测试。
+
+生成的库尽量接近真实的订阅库:
+    - Mod大小呈长尾分布: 多数Mod几十到几百个对象，少数有数千个对象和很长的Lua脚本
+    - 背包/牌堆通过 ContainedObjects 多层嵌套，部分规则书PDF放在背包里
+    - Custom_PDF 的链接分别出现在 PDFUrl、FileURL 和旧格式的 URL 字段，
+      并混有大小写不同的扩展名、带查询参数的链接、非PDF链接、空链接和跨Mod重复的链接
+    - 少量损坏条目: 截断的JSON、非UTF-8内容、空文件、清单中存在但文件缺失、缺少名称等
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.synthetic_library --mods 1000 --output /tmp/tts_library
+    python -m benchmarks.synthetic_library --mods 10000 --output /tmp/tts_10k --broken-ratio 0.05 --seed 7
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import string
+import sys
+from typing import Dict, List, Optional
+
+MIN_MODS = 10
+MAX_MODS = 10_000
+
+# 损坏条目的种类
+BROKEN_KINDS = ("truncated_json", "invalid_utf8", "empty_file", "missing_file", "missing_name",
+                "directory_without_json", "object_states_not_list")
+
+_GAME_WORDS = ["Star", "Port", "Kingdom", "Dungeon", "Harbor", "Empire", "Forest", "Dragon", "Trade",
+               "Quest", "Castle", "Legends", "Frontier", "Colony", "Rails", "Spirit", "Islands", "Tactics"]
+_CJK_GAME_WORDS = ["星港", "王国", "地下城", "贸易", "龙", "城堡", "传说", "殖民地", "铁路", "群岛"]
+_OBJECT_NAMES = ["Card", "Deck", "Bag", "Custom_Model", "Custom_Tile", "Custom_Token", "Die_6", "Figurine_Custom",
+                 "Custom_Board", "Notecard", "Counter", "Infinite_Bag"]
+_CONTAINER_NAMES = ("Bag", "Deck", "Infinite_Bag")
+_PDF_HOSTS = ["https://steamusercontent-a.akamaihd.net/ugc", "http://cloud-3.steamusercontent.com/ugc",
+              "https://www.dropbox.com/s", "https://drive.google.com/uc?export=download&id="]
+
+
+class LibraryGenerator:
+    """按随机种子确定性地生成一个工坊库"""
+
+    def __init__(self, root: str, mods: int, seed: int = 0, pdf_ratio: float = 0.6, broken_ratio: float = 0.02,
+                 nested_pdf_ratio: float = 0.25, duplicate_pdf_ratio: float = 0.05):
+        if not MIN_MODS <= mods <= MAX_MODS:
+            raise ValueError(f"Mod数量必须在 {MIN_MODS} 到 {MAX_MODS} 之间: {mods}")
+        self.root = root
+        self.mods = mods
+        self.rng = random.Random(seed)
+        self.pdf_ratio = pdf_ratio
+        self.broken_ratio = broken_ratio
+        self.nested_pdf_ratio = nested_pdf_ratio
+        self.duplicate_pdf_ratio = duplicate_pdf_ratio
+        self.workshop_dir = os.path.join(root, "Mods", "Workshop")
+        self._guid_counter = 0
+        self._shared_pdf_urls: List[str] = []
+        self.stats: Dict = {
+            "mods": mods,
+            "bytes": 0,
+            "objects": 0,
+            "max_depth": 0,
+            "pdf_objects": 0,
+            "pdf_objects_top_level": 0,
+            "pdf_objects_nested": 0,
+            "pdf_fields": {"PDFUrl": 0, "FileURL": 0, "URL": 0},
+            "pdf_url_kinds": {},
+            "broken": {kind: 0 for kind in BROKEN_KINDS},
+            "largest_mod_bytes": 0,
+        }
+
+    # ---- 基本构件 ----
+
+    def _guid(self) -> str:
+        self._guid_counter += 1
+        return f"{self._guid_counter:06x}"
+
+    def _game_name(self, index: int) -> str:
+        words = self.rng.sample(_GAME_WORDS, self.rng.randint(1, 3))
+        name = " ".join(words)
+        if self.rng.random() < 0.15:
+            name = f"{self.rng.choice(_CJK_GAME_WORDS)}{self.rng.choice(_CJK_GAME_WORDS)} {name}"
+        if self.rng.random() < 0.1:
+            name = f"  {name} [Scripted]  "  # 真实库中常见的多余空白和后缀
+        return f"{name} #{index}"
+
+    def _object_count(self) -> int:
+        """对象数的长尾分布: 中位数约60，少数Mod有数千个对象"""
+        return max(1, min(5000, int(math.exp(self.rng.gauss(4.1, 1.0)))))
+
+    def _lua_script(self) -> str:
+        if self.rng.random() < 0.7:
+            return ""
+        # 少数Mod带很长的脚本，是文件体积长尾的主要来源
+        length = int(min(200_000, math.exp(self.rng.gauss(7.5, 1.5))))
+        return "".join(self.rng.choices(string.ascii_letters + " \n()=.,", k=length))
+
+    def _transform(self) -> Dict:
+        return {
+            "posX": round(self.rng.uniform(-30, 30), 3), "posY": round(self.rng.uniform(0, 5), 3),
+            "posZ": round(self.rng.uniform(-30, 30), 3), "rotX": 0.0, "rotY": round(self.rng.uniform(0, 360), 1),
+            "rotZ": 0.0, "scaleX": 1.0, "scaleY": 1.0, "scaleZ": 1.0,
+        }
+
+    def _plain_object(self) -> Dict:
+        name = self.rng.choice(_OBJECT_NAMES)
+        obj = {"GUID": self._guid(), "Name": name, "Nickname": self.rng.choice(_GAME_WORDS),
+               "Transform": self._transform(), "Locked": self.rng.random() < 0.2}
+        if name in ("Custom_Model", "Figurine_Custom", "Custom_Tile"):
+            obj["CustomImage"] = {"ImageURL": f"http://cloud-3.steamusercontent.com/ugc/{self.rng.getrandbits(48)}/"}
+        self.stats["objects"] += 1
+        return obj
+
+    # ---- 规则书PDF ----
+
+    def _pdf_url(self, workshop_id: str, index: int) -> str:
+        """生成各种形式的PDF链接，并记录种类"""
+        if self._shared_pdf_urls and self.rng.random() < self.duplicate_pdf_ratio:
+            kind, url = "duplicate", self.rng.choice(self._shared_pdf_urls)
+        else:
+            roll = self.rng.random()
+            host = self.rng.choices(_PDF_HOSTS, weights=[0.55, 0.25, 0.1, 0.1])[0]
+            if host.endswith("id="):
+                kind, url = "no_pdf_extension", f"{host}{self.rng.getrandbits(64):x}"
+            elif roll < 0.6:
+                kind, url = "plain", f"{host}/{workshop_id}/{self.rng.getrandbits(40):x}/rules_{index}.pdf"
+            elif roll < 0.7:
+                kind, url = "uppercase_extension", f"{host}/{workshop_id}/Rulebook_{index}.PDF"
+            elif roll < 0.8:
+                kind, url = "query_string", f"{host}/{workshop_id}/rules_{index}.pdf?dl=1"
+            elif roll < 0.9:
+                kind, url = "empty", ""
+            else:
+                kind, url = "plain", f"{host}/{workshop_id}/{self.rng.choice(_CJK_GAME_WORDS)}规则_{index}.pdf"
+            if url and kind == "plain":
+                self._shared_pdf_urls.append(url)
+        self.stats["pdf_url_kinds"][kind] = self.stats["pdf_url_kinds"].get(kind, 0) + 1
+        return url
+
+    def _pdf_object(self, workshop_id: str, index: int, nested: bool) -> Dict:
+        field = self.rng.choices(["PDFUrl", "FileURL", "URL"], weights=[0.7, 0.2, 0.1])[0]
+        self.stats["pdf_fields"][field] += 1
+        self.stats["pdf_objects"] += 1
+        self.stats["pdf_objects_nested" if nested else "pdf_objects_top_level"] += 1
+        self.stats["objects"] += 1
+        return {
+            "GUID": self._guid(), "Name": "Custom_PDF", "Nickname": self.rng.choice(["Rules", "Rulebook", "规则书", ""]),
+            "Transform": self._transform(),
+            "CustomPDF": {field: self._pdf_url(workshop_id, index), "PDFPassword": "", "PDFPage": 0, "PDFPageOffset": 0},
+        }
+
+    # ---- 嵌套容器 ----
+
+    def _container(self, depth: int, budget: List[int], pending_pdfs: List[Dict]) -> Dict:
+        """生成一个背包/牌堆，可能继续嵌套；budget[0] 是剩余可用的对象数"""
+        self.stats["max_depth"] = max(self.stats["max_depth"], depth)
+        container = self._plain_object()
+        container["Name"] = self.rng.choice(_CONTAINER_NAMES)
+        contained = []
+        for _ in range(min(budget[0], self.rng.randint(1, 30))):
+            if budget[0] <= 0:
+                break
+            budget[0] -= 1
+            if depth < 8 and self.rng.random() < 0.12:
+                contained.append(self._container(depth + 1, budget, pending_pdfs))
+            else:
+                contained.append(self._plain_object())
+        if pending_pdfs and self.rng.random() < 0.5:
+            contained.append(pending_pdfs.pop())
+        container["ContainedObjects"] = contained
+        return container
+
+    def _mod_document(self, workshop_id: str, name: str) -> Dict:
+        budget = [self._object_count()]
+        pdfs_top, pdfs_nested = [], []
+        if self.rng.random() < self.pdf_ratio:
+            for index in range(self.rng.choices([1, 2, 3, 4], weights=[0.7, 0.2, 0.07, 0.03])[0]):
+                nested = self.rng.random() < self.nested_pdf_ratio
+                (pdfs_nested if nested else pdfs_top).append(self._pdf_object(workshop_id, index, nested))
+
+        object_states = []
+        while budget[0] > 0:
+            budget[0] -= 1
+            if self.rng.random() < 0.15:
+                object_states.append(self._container(1, budget, pdfs_nested))
+            else:
+                object_states.append(self._plain_object())
+        # 没有放进容器的嵌套PDF放进一个专门的背包
+        if pdfs_nested:
+            bag = self._plain_object()
+            bag["Name"] = "Bag"
+            bag["ContainedObjects"] = pdfs_nested
+            object_states.append(bag)
+            self.stats["max_depth"] = max(self.stats["max_depth"], 1)
+        object_states[self.rng.randint(0, len(object_states)):0] = pdfs_top
+
+        return {
+            "SaveName": name.strip(), "GameMode": name.strip(), "Date": "1/1/2024 12:00:00 PM",
+            "VersionNumber": "v13.2.2", "LuaScript": self._lua_script(), "XmlUI": "",
+            "Notebook": [], "ObjectStates": object_states,
+        }
+
+    # ---- 写文件 ----
+
+    def _write_broken(self, kind: str, index: int, workshop_id: str, name: str) -> Optional[Dict]:
+        """写入一个损坏的条目，返回它在 WorkshopFileInfos.json 中的记录 (None 表示不列入清单)"""
+        self.stats["broken"][kind] += 1
+        path = os.path.join(self.workshop_dir, f"{workshop_id}.json")
+        info = {"Directory": path, "Name": name, "UpdateTime": 1_600_000_000 + index}
+        if kind == "truncated_json":
+            text = json.dumps(self._mod_document(workshop_id, name), ensure_ascii=False)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text[:max(1, len(text) // 2)])
+        elif kind == "invalid_utf8":
+            with open(path, "wb") as f:
+                f.write(b'{"SaveName": "\xff\xfe broken", "ObjectStates": []}')
+        elif kind == "empty_file":
+            open(path, "w").close()
+        elif kind == "missing_file":
+            pass
+        elif kind == "missing_name":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self._mod_document(workshop_id, name), f, ensure_ascii=False)
+            info.pop("Name")
+        elif kind == "directory_without_json":
+            os.makedirs(os.path.join(self.workshop_dir, workshop_id), exist_ok=True)
+            info["Directory"] = os.path.join(self.workshop_dir, workshop_id)
+        elif kind == "object_states_not_list":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"SaveName": name, "ObjectStates": {"oops": True}}, f)
+        return info
+
+    def generate(self) -> Dict:
+        """生成整个库，返回统计信息"""
+        os.makedirs(self.workshop_dir, exist_ok=True)
+        file_infos = []
+        for index in range(self.mods):
+            workshop_id = str(1_000_000_000 + self.rng.getrandbits(31))
+            while os.path.exists(os.path.join(self.workshop_dir, f"{workshop_id}.json")):
+                workshop_id = str(int(workshop_id) + 1)
+            name = self._game_name(index)
+            if self.rng.random() < self.broken_ratio:
+                file_infos.append(self._write_broken(self.rng.choice(BROKEN_KINDS), index, workshop_id, name))
+                continue
+
+            text = json.dumps(self._mod_document(workshop_id, name), ensure_ascii=False, indent=2)
+            path = os.path.join(self.workshop_dir, f"{workshop_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            size = len(text.encode("utf-8"))
+            self.stats["bytes"] += size
+            self.stats["largest_mod_bytes"] = max(self.stats["largest_mod_bytes"], size)
+            # TTS 的清单中 Directory 通常是完整的json路径，少数旧条目省略了扩展名
+            directory = path if self.rng.random() > 0.05 else path[:-len(".json")]
+            file_infos.append({"Directory": directory, "Name": name, "UpdateTime": 1_600_000_000 + index})
+
+        with open(os.path.join(self.workshop_dir, "WorkshopFileInfos.json"), "w", encoding="utf-8") as f:
+            json.dump(file_infos, f, ensure_ascii=False, indent=2)
+        return self.stats
+
+
+def generate_library(root: str, mods: int, seed: int = 0, **kwargs) -> Dict:
+    """在 root 下生成合成工坊库 (参数见 LibraryGenerator)，返回统计信息"""
+    return LibraryGenerator(root, mods, seed=seed, **kwargs).generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的TTS工坊库")
+    parser.add_argument("--mods", type=int, default=100, help=f"Mod数量 ({MIN_MODS}-{MAX_MODS})")
+    parser.add_argument("--output", required=True, help="输出目录 (作为 TTS_DATA_DIRECTORY)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--pdf-ratio", type=float, default=0.6, help="包含规则书PDF的Mod比例")
+    parser.add_argument("--nested-pdf-ratio", type=float, default=0.25, help="放在背包/牌堆中的PDF比例")
+    parser.add_argument("--broken-ratio", type=float, default=0.02, help="损坏条目的比例")
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.output, "Mods", "Workshop", "WorkshopFileInfos.json")):
+        print(f"错误: {args.output} 中已存在工坊库，请指定空目录")
+        sys.exit(1)
+    try:
+        stats = generate_library(args.output, args.mods, seed=args.seed, pdf_ratio=args.pdf_ratio,
+                                 nested_pdf_ratio=args.nested_pdf_ratio, broken_ratio=args.broken_ratio)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    print(f"已生成 {args.mods} 个Mod到 {args.output}，可设置 TTS_DATA_DIRECTORY={args.output} 后运行扫描")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 向量压缩基准
+比较不同向量压缩方式 (VECTOR_COMPRESSION) 及精确重排序 (VECTOR_RESCORE_FACTOR) 下
+索引的大小、相对float32精确检索的召回率、示例规则书问题的命中率和检索延迟。
+
+使用确定性的 HashingEmbeddings，不需要Embedding服务; 真实模型的向量分布不同，
+召回率的绝对值仅供参考，不同压缩方式之间的差距更有意义。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m benchmarks.vector_compression
+    python -m benchmarks.vector_compression --dim 1536 --sections 100,1000 --rescore-factor 4 --json results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.retrieval_quality import DEFAULT_QA, DEFAULT_RULEBOOK, _covers
+from benchmarks.synthetic_data import generate_rulebook
+from services.fake_providers import HashingEmbeddings
+from services.markdown_chunker import MarkdownSectionSplitter
+from services.vector_compression import (
+    COMPRESSION_MODES, RescoringFAISS, compress_index, load_rescore_vectors, save_rescore_vectors,
+)
+
+
+def _index_bytes(index) -> int:
+    import faiss
+    return len(faiss.serialize_index(index))
+
+
+def _build_base_store(chunks: List[Document], embeddings: HashingEmbeddings) -> FAISS:
+    vectors = embeddings.embed_documents([doc.page_content for doc in chunks])
+    return FAISS.from_embeddings(
+        list(zip([doc.page_content for doc in chunks], vectors)),
+        embeddings,
+        metadatas=[doc.metadata for doc in chunks],
+    )
+
+
+def _variant(base: FAISS, mode: str, rescore_factor: int, pq_m: int, work_dir: str) -> Tuple[FAISS, str, int]:
+    """建立一种压缩配置的向量存储，共享基准存储的文档库。返回 (向量存储, 实际压缩方式, 原始向量文件大小)"""
+    index, used = compress_index(base.index, mode, pq_m)
+    store = FAISS(
+        embedding_function=base.embedding_function,
+        index=index,
+        docstore=base.docstore,
+        index_to_docstore_id=base.index_to_docstore_id,
+    )
+    if rescore_factor <= 0 or used == "none":
+        return store, used, 0
+    path = save_rescore_vectors(base.index, work_dir)
+    return RescoringFAISS.from_store(store, load_rescore_vectors(work_dir), rescore_factor), used, os.path.getsize(path)
+
+
+def _search_ids(store: FAISS, query_vectors: List[List[float]], k: int) -> Tuple[List[List[Document]], List[float]]:
+    """每个查询返回的文档块和检索耗时"""
+    results, latencies = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        docs = store.similarity_search_with_score_by_vector(vector, k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc for doc, _ in docs])
+    return results, latencies
+
+
+def _recall(results: List[List[Document]], exact: List[List[Document]], k: int) -> float:
+    total = 0.0
+    for found, expected in zip(results, exact):
+        expected_ids = {id(doc) for doc in expected[:k]}
+        total += len(expected_ids & {id(doc) for doc in found[:k]}) / max(len(expected_ids), 1)
+    return total / max(len(exact), 1)
+
+
+def _hit_rate(results: List[List[Document]], qa_pairs: List[Dict]) -> float:
+    hits = sum(
+        any(_covers(doc.metadata.get("section_path", ""), pair["section"]) for doc in docs)
+        for docs, pair in zip(results, qa_pairs)
+    )
+    return hits / max(len(qa_pairs), 1)
+
+
+def evaluate_dataset(name: str, chunks: List[Document], queries: List[str], dim: int, k: int,
+                     rescore_factor: int, pq_m: int, qa_pairs: Optional[List[Dict]] = None) -> List[Dict]:
+    """对一组文档块评估所有压缩方式，qa_pairs 不为空时同时计算问题命中率"""
+    embeddings = HashingEmbeddings(size=dim)
+    base = _build_base_store(chunks, embeddings)
+    query_vectors = embeddings.embed_documents(queries)
+    exact, _ = _search_ids(base, query_vectors, k)
+    flat_bytes = _index_bytes(base.index)
+
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="tts_bench_vectors_")
+    try:
+        for mode in COMPRESSION_MODES:
+            for factor in ([0] if mode == "none" else [0, rescore_factor]):
+                store, used, rescore_bytes = _variant(base, mode, factor, pq_m, work_dir)
+                results, latencies = _search_ids(store, query_vectors, k)
+                index_bytes = _index_bytes(store.index)
+                row = {
+                    "dataset": name,
+                    "vectors": base.index.ntotal,
+                    "dim": dim,
+                    "mode": mode,
+                    "used": used,
+                    "rescore_factor": factor,
+                    "index_bytes": index_bytes,
+                    "rescore_bytes": rescore_bytes,
+                    "memory_saved": round(1 - index_bytes / flat_bytes, 3),
+                    f"recall_at_{k}": round(_recall(results, exact, k), 3),
+                    "mean_latency_us": round(statistics.mean(latencies) * 1e6, 1),
+                }
+                if qa_pairs:
+                    row[f"hit_at_{k}"] = round(_hit_rate(results, qa_pairs), 3)
+                rows.append(row)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return rows
+
+
+def _synthetic_dataset(sections: int, query_count: int, seed: int) -> Tuple[List[Document], List[str]]:
+    """合成规则书的文档块，查询为随机文档块的第一句话"""
+    chunks, _ = MarkdownSectionSplitter().split_text(generate_rulebook(sections, seed=seed), {"source": "rulebook"})
+    rng = random.Random(seed)
+    sampled = rng.sample(chunks, min(query_count, len(chunks)))
+    queries = [doc.page_content.split("\n")[-1].split("。")[0] for doc in sampled]
+    return chunks, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较向量压缩方式的索引大小、召回率和检索延迟")
+    parser.add_argument("--rulebook", default=DEFAULT_RULEBOOK, help="带问题集的Markdown规则书路径")
+    parser.add_argument("--qa", default=DEFAULT_QA, help="问题->章节 对的JSON文件")
+    parser.add_argument("--sections", default="100,1000", help="合成规则书的章节数，逗号分隔")
+    parser.add_argument("--queries", type=int, default=200, help="每本合成规则书的查询数")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度 (Gemini为768，OpenAI为1536)")
+    parser.add_argument("--k", type=int, default=5, help="每个查询检索的块数")
+    parser.add_argument("--rescore-factor", type=int, default=4, help="精确重排序的候选倍数")
+    parser.add_argument("--pq-subquantizers", type=int, default=0, help="PQ子量化器数 (0 表示自动)")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    with open(args.rulebook, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(args.qa, "r", encoding="utf-8") as f:
+        qa_pairs = json.load(f)
+    chunks, _ = MarkdownSectionSplitter().split_text(text, {"source": "rulebook"})
+
+    results = evaluate_dataset(os.path.basename(args.rulebook), chunks, [pair["question"] for pair in qa_pairs],
+                               args.dim, args.k, args.rescore_factor, args.pq_subquantizers, qa_pairs)
+    for sections in [int(value) for value in args.sections.split(",") if value.strip()]:
+        chunks, queries = _synthetic_dataset(sections, args.queries, args.seed)
+        results += evaluate_dataset(f"合成{sections}章", chunks, queries, args.dim, args.k,
+                                    args.rescore_factor, args.pq_subquantizers)
+
+    recall_key, hit_key = f"recall_at_{args.k}", f"hit_at_{args.k}"
+    print(f"向量维度 {args.dim}, k={args.k} (召回率相对float32精确检索)")
+    print(f"{'数据':<24}{'向量数':>7}{'压缩':>10}{'重排序':>7}{'索引大小':>11}{'节省':>8}"
+          f"{'召回率':>8}{'命中率':>8}{'延迟(us)':>10}")
+    for row in results:
+        mode = row["mode"] if row["used"] == row["mode"] else f"{row['mode']}->{row['used']}"
+        hit = f"{row[hit_key]:.3f}" if hit_key in row else "-"
+        rescore = f"x{row['rescore_factor']}" if row["rescore_factor"] else "-"
+        print(f"{row['dataset']:<24}{row['vectors']:>7}{mode:>10}{rescore:>7}{row['index_bytes'] / 1024:>9.1f}KB"
+              f"{row['memory_saved']:>8.1%}{row[recall_key]:>8.3f}{hit:>8}{row['mean_latency_us']:>10.1f}")
+    print("启用重排序时磁盘上另有一份float32原始向量 (内存映射，只读取候选行)，不计入索引大小")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
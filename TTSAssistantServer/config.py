@@ -43,6 +43,12 @@ PROCESSED_MODS_FILE = os.getenv(
     str(BASE_DIR / "data" / "processed_mods.json")
 )
 
+# 工坊增量扫描状态文件 (记录上次扫描时 WorkshopFileInfos.json 的条目)，为空时放在 PROCESSED_MODS_FILE 旁边
+WORKSHOP_SCAN_STATE_FILE = os.getenv('WORKSHOP_SCAN_STATE_FILE', '')
+
+# 游戏访问统计文件 (记录各游戏最近的提问/加载时间)，为空时放在 PROCESSED_MODS_FILE 旁边
+ACCESS_STATS_FILE = os.getenv('ACCESS_STATS_FILE', '')
+
 # LLM 配置
 LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')  # 可选: gemini, ollama, openai等
 
@@ -59,12 +65,30 @@ OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
 
+# 模拟提供商 (LLM_PROVIDER=fake / EMBEDDING_PROVIDER=fake) 的人为延迟，用于基准测试和离线压测
+FAKE_LLM_LATENCY_MS = float(os.getenv('FAKE_LLM_LATENCY_MS', '0'))
+FAKE_LLM_PER_TOKEN_LATENCY_MS = float(os.getenv('FAKE_LLM_PER_TOKEN_LATENCY_MS', '0'))
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv('FAKE_EMBEDDING_LATENCY_MS', '0'))
+
 # Embedding模型配置
 EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'default')  # default使用与LLM相同的提供商
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', '')  # 自定义Embedding模型名称
 
 # Sentence Transformers配置
 SENTENCE_TRANSFORMER_MODEL = os.getenv('SENTENCE_TRANSFORMER_MODEL', 'all-MiniLM-L6-v2')
+# 推理后端: torch (HuggingFaceEmbeddings); onnx / onnx_int8 (需要 pip install onnxruntime tokenizers，首次使用导出模型还需要 optimum[onnxruntime]);
+# torch_int8 (线性层动态量化)。除 torch 外的后端共用一个推理线程，按长度排序动态分批
+SENTENCE_TRANSFORMER_BACKEND = os.getenv('SENTENCE_TRANSFORMER_BACKEND', 'torch').lower()
+ONNX_MODEL_DIRECTORY = os.getenv('ONNX_MODEL_DIRECTORY', str(BASE_DIR / "data" / "cache" / "onnx_models"))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))  # 推理线程数 (<=0 表示CPU核数)
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))  # 每批最多的文本数
+EMBEDDING_MAX_BATCH_CHARS = int(os.getenv('EMBEDDING_MAX_BATCH_CHARS', '16000'))  # 每批填充后的最大字符数
+EMBEDDING_QUEUE_SIZE = int(os.getenv('EMBEDDING_QUEUE_SIZE', '256'))  # 等待推理的文本数上限，队列满时调用方等待
+
+# 共享Embedding服务: 运行 python -m services.embedding_service 在独立进程中加载一次 sentence-transformers 模型，
+# 服务进程设置 EMBEDDING_PROVIDER=service 通过Unix套接字访问 (不支持Windows)
+EMBEDDING_SERVICE_SOCKET = os.getenv('EMBEDDING_SERVICE_SOCKET', str(BASE_DIR / "data" / "embedding_service.sock"))
+EMBEDDING_SERVICE_CONNECT_TIMEOUT = float(os.getenv('EMBEDDING_SERVICE_CONNECT_TIMEOUT', '30'))  # 等待服务启动的秒数
 
 # HTTP代理
 HTTP_PROXY = os.getenv('HTTP_PROXY', '')
@@ -79,4 +103,111 @@ DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 CUSTOM_CONDENSE_QUESTION_PROMPT_TEMPLATE = os.getenv('CUSTOM_CONDENSE_QUESTION_PROMPT_TEMPLATE', None)
 
 # {context} 和 {question} 是 qa_prompt (combine_docs_chain) 的可用变量
-CUSTOM_QA_PROMPT_TEMPLATE = os.getenv('CUSTOM_QA_PROMPT_TEMPLATE', None) 
\ No newline at end of file
+CUSTOM_QA_PROMPT_TEMPLATE = os.getenv('CUSTOM_QA_PROMPT_TEMPLATE', None) 
+
+# 问题改写 (condense) 策略
+# always: 只要有对话历史就调用LLM改写问题 (Langchain默认行为)
+# auto: 无历史或问题本身已完整时跳过改写，省去一次LLM调用
+# never: 从不改写，直接使用原问题检索
+CONDENSE_QUESTION_MODE = os.getenv('CONDENSE_QUESTION_MODE', 'auto').lower()
+
+# 问题改写使用的独立模型 (可选，通常选择更小更快的模型)
+# 未设置 CONDENSE_LLM_MODEL 时使用主LLM
+CONDENSE_LLM_PROVIDER = os.getenv('CONDENSE_LLM_PROVIDER', '')  # 为空时与 LLM_PROVIDER 相同
+CONDENSE_LLM_MODEL = os.getenv('CONDENSE_LLM_MODEL', '')
+
+# 推测检索: 需要改写的后续问题在LLM改写的同时用原问题执行检索管线；
+# 改写后问题的向量检索候选块中至少有 SPECULATIVE_RETRIEVAL_MIN_OVERLAP 比例出现在推测结果中时直接复用，
+# 省去重排序等步骤，否则照常处理改写后的问题
+SPECULATIVE_RETRIEVAL = os.getenv('SPECULATIVE_RETRIEVAL', 'False').lower() == 'true'
+SPECULATIVE_RETRIEVAL_MIN_OVERLAP = float(os.getenv('SPECULATIVE_RETRIEVAL_MIN_OVERLAP', '0.6'))
+
+# 上下文token预算: 检索结果合并重叠块后，按相关度填充不超过该预算的规则片段 (<=0 表示不限制)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '2000'))
+
+# 对话历史token预算: 按token数而非轮数截取最近的对话 (<=0 时退回保留最近5轮)
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '800'))
+
+# 对话记忆模式
+# budget: 按 HISTORY_TOKEN_BUDGET 截取最近的对话，更早的对话被丢弃
+# summary: 保留最近 HISTORY_SUMMARY_RECENT_TURNS 轮原文，更早的对话在回答返回后由LLM在后台合并为滚动摘要
+#          (使用问题改写模型，未设置时使用主LLM)，提示词长度不随会话变长而增长
+HISTORY_MEMORY_MODE = os.getenv('HISTORY_MEMORY_MODE', 'budget').lower()
+HISTORY_SUMMARY_RECENT_TURNS = int(os.getenv('HISTORY_SUMMARY_RECENT_TURNS', '2'))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv('HISTORY_SUMMARY_MAX_TOKENS', '300'))  # 摘要的最大长度
+
+# 规则书分块策略
+# markdown: 按标题结构分块，保留章节路径，表格和列表保持完整
+# recursive: 按字符数分块 (chunk_size=1000, chunk_overlap=200)
+CHUNKING_STRATEGY = os.getenv('CHUNKING_STRATEGY', 'markdown').lower()
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '600'))  # markdown 分块的检索子块大小 (字符)
+PARENT_CHUNK_SIZE = int(os.getenv('PARENT_CHUNK_SIZE', '3000'))  # 父章节块的最大大小 (字符)
+
+# 小块检索、返回所属父章节 (small-to-big)，仅对 markdown 分块生效
+SMALL_TO_BIG_RETRIEVAL = os.getenv('SMALL_TO_BIG_RETRIEVAL', 'True').lower() == 'true'
+
+# 回答附带规则书出处 (例如 "规则书2 第14页")，页码来自PDF提取时写入的页码标记，没有页码时显示章节
+ANSWER_CITATIONS = os.getenv('ANSWER_CITATIONS', 'True').lower() == 'true'
+ANSWER_CITATIONS_MAX = int(os.getenv('ANSWER_CITATIONS_MAX', '3'))  # 每个回答最多显示的出处数
+
+# 向量压缩: 减少索引的磁盘和内存占用，代价是检索召回率略有下降 (修改后会重建索引)
+# none: 保存float32原始向量; fp16 / int8: 标量量化 (每维2 / 1字节); pq: 乘积量化 (每个向量 PQ_SUBQUANTIZERS 字节)
+VECTOR_COMPRESSION = os.getenv('VECTOR_COMPRESSION', 'none').lower()
+PQ_SUBQUANTIZERS = int(os.getenv('PQ_SUBQUANTIZERS', '0'))  # 必须整除向量维度 (0 表示自动，约每8维一个)
+# 精确重排序: 压缩索引取 k*该倍数 个候选，再用原始float32向量 (内存映射，磁盘上仍保留一份) 重新排序 (0 表示关闭，可同时节省磁盘)
+VECTOR_RESCORE_FACTOR = int(os.getenv('VECTOR_RESCORE_FACTOR', '4'))
+# 共享索引段: 规则书内容和索引配置完全相同的游戏 (同一游戏的重新上传或变体) 共用一份索引
+# (保存在 VECTOR_STORE_DIRECTORY/_segments 下，按引用计数删除)，只计算一次Embedding，磁盘和内存中只有一份
+SHARED_INDEX_SEGMENTS = os.getenv('SHARED_INDEX_SEGMENTS', 'False').lower() == 'true'
+
+# 检索结果重排序 (可选)
+# none: 不重排序，直接使用向量检索的前5块
+# lexical: 按查询词覆盖率重排序，无额外依赖
+# cross_encoder: 使用本地CPU上的CrossEncoder模型 (需要 pip install sentence-transformers)
+RERANKER = os.getenv('RERANKER', 'none').lower()
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'BAAI/bge-reranker-base')  # cross_encoder 使用的模型
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', '30'))  # 向量检索的候选块数
+RERANK_TOP_N = int(os.getenv('RERANK_TOP_N', '3'))  # 重排序后交给LLM的块数
+RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', '16'))
+RERANK_CACHE_SIZE = int(os.getenv('RERANK_CACHE_SIZE', '4096'))  # 按 (查询, 文档块) 缓存的分数条数
+
+# 查询Embedding缓存: 相同的问题不再重复请求Embedding服务 (<=0 表示关闭)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '2048'))
+# 微批处理窗口 (毫秒): 窗口内到达的多个查询合并为一次批量请求 (仅对支持批量查询的提供商生效)
+QUERY_EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('QUERY_EMBEDDING_BATCH_WINDOW_MS', '5'))
+
+# 可编辑规则书监视: 保存 .md 文件后自动在后台重建对应游戏的索引
+# auto: 已安装 watchdog 时使用系统文件事件 (Linux 上为 inotify)，否则定期轮询
+# watchdog / polling: 指定监视方式; off: 关闭
+RULEBOOK_WATCHER = os.getenv('RULEBOOK_WATCHER', 'auto').lower()
+RULEBOOK_WATCH_DEBOUNCE_SECONDS = float(os.getenv('RULEBOOK_WATCH_DEBOUNCE_SECONDS', '2'))  # 最后一次保存后等待的秒数
+RULEBOOK_WATCH_POLL_INTERVAL = float(os.getenv('RULEBOOK_WATCH_POLL_INTERVAL', '2'))  # 轮询间隔 (秒)
+
+# 工坊清单监视: WorkshopFileInfos.json 变化时在后台增量扫描新订阅或更新的Mod，取值同 RULEBOOK_WATCHER
+WORKSHOP_WATCHER = os.getenv('WORKSHOP_WATCHER', 'auto').lower()
+WORKSHOP_WATCH_POLL_INTERVAL = float(os.getenv('WORKSHOP_WATCH_POLL_INTERVAL', '5'))  # 轮询间隔 (秒)
+
+# 规则书PDF文本提取: 从TTS缓存的PDF (Mods/PDF) 中提取文本写入可编辑规则书文件 (需要 pip install pypdf)
+# 用户编辑过的规则书文件不会被覆盖
+PDF_TEXT_EXTRACTION = os.getenv('PDF_TEXT_EXTRACTION', 'True').lower() == 'true'
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', '0'))  # 提取进程数 (<=0 表示CPU核数)
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '20'))  # 每个进程任务处理的页数
+
+# 启动预热: 在后台预热Embedding模型，并预加载最近访问的游戏的检索器，使重启后的第一个问题不必冷加载
+PRELOAD_RETRIEVERS = int(os.getenv('PRELOAD_RETRIEVERS', '3'))  # 预加载的游戏数 (0 表示不预加载)
+PRELOAD_MEMORY_BUDGET_MB = float(os.getenv('PRELOAD_MEMORY_BUDGET_MB', '512'))  # 已加载索引的总大小上限 (<=0 表示不限制)
+EMBEDDING_WARMUP = os.getenv('EMBEDDING_WARMUP', 'True').lower() == 'true'
+
+# 慢请求性能分析 (cProfile)，作用于 /ask 和 /api/rulebook/refresh_rag_from_cache
+# off: 关闭
+# threshold: 分析每个请求，只保存耗时超过 PROFILING_THRESHOLD_MS 的
+# sample: 每 PROFILING_SAMPLE_EVERY 个请求分析并保存一个
+# both: 同时使用以上两种规则
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'off').lower()
+PROFILING_THRESHOLD_MS = float(os.getenv('PROFILING_THRESHOLD_MS', '5000'))
+PROFILING_SAMPLE_EVERY = int(os.getenv('PROFILING_SAMPLE_EVERY', '100'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', '50'))  # 轮转保留的分析结果数
+PROFILES_DIRECTORY = os.getenv(
+    'PROFILES_DIRECTORY',
+    str(BASE_DIR / "data" / "profiles")
+)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 游戏访问统计
+记录每个游戏最近被提问/加载的时间和次数并保存到磁盘，
+服务重启后据此预加载最近常用游戏的检索器，避免第一个问题承担冷加载开销。
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class GameAccessStats:
+    """每个游戏的访问统计 {game_name: {"last_access": 时间戳, "count": 次数}}，按间隔写入磁盘"""
+
+    def __init__(self, path: str, save_interval: float = 30.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = self._load()
+        self._dirty = False
+        self._last_saved_at = 0.0
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"警告: 游戏访问统计 {self.path} 解析失败: {e}")
+            return {}
+
+    def record(self, game_name: str, now: Optional[float] = None):
+        """记录一次访问。新游戏立即保存，其余访问距上次保存超过 save_interval 时才写盘"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._stats.get(game_name)
+            is_new = entry is None
+            if is_new:
+                entry = self._stats[game_name] = {"last_access": now, "count": 0}
+            entry["last_access"] = max(entry.get("last_access", 0), now)
+            entry["count"] = entry.get("count", 0) + 1
+            self._dirty = True
+            if is_new or time.monotonic() - self._last_saved_at >= self.save_interval:
+                self._save_locked()
+
+    def flush(self):
+        """把尚未保存的统计写入磁盘"""
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    def _save_locked(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stats, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+            self._last_saved_at = time.monotonic()
+        except OSError as e:
+            print(f"警告: 保存游戏访问统计 {self.path} 失败: {e}")
+
+    def recent_games(self, limit: int) -> List[str]:
+        """最近访问的游戏 (最近访问在前，时间相同时访问次数多的在前)"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            ranked = sorted(
+                self._stats.items(),
+                key=lambda item: (item[1].get("last_access", 0), item[1].get("count", 0)),
+                reverse=True,
+            )
+        return [game_name for game_name, _ in ranked[:limit]]
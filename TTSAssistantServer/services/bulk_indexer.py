@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 批量建立规则书索引
+离线遍历 processed_mods.json 中所有已填写内容的规则书 (.md)，用进程池并行建立或更新各游戏的向量索引。
+工作进程的Embedding通过一个共享Embedding服务计算 (见 services.embedding_service): 模型只加载一次，
+各进程的文档块在服务端合并分批; 分割、建立FAISS索引、压缩和保存在各工作进程中并行执行。
+索引清单与当前内容和配置一致的游戏会被跳过，中断后重新运行即从未完成的游戏继续。
+
+用法 (在项目根目录下，或在 TTSAssistantServer 目录下运行 python -m services.bulk_indexer):
+    python index_rulebooks.py
+    python index_rulebooks.py --workers 4 --game "Terraforming Mars" --force
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import config as cfg
+
+# 批量建立索引不需要检索相关的组件，工作进程不加载重排序模型、不建立查询缓存
+INDEXING_OVERRIDES = {"RERANKER": "none", "QUERY_EMBEDDING_CACHE_SIZE": 0}
+
+_worker_manager = None
+
+
+def collect_index_jobs(workshop_manager, games: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    列出需要建立索引的规则书: 每个游戏一个 (每个游戏只有一个向量索引)。
+    只包含文件存在且已填写内容 (不是模板) 的 .md; 一个游戏有多个时使用最近修改的一个，与规则书监视器一致。
+    """
+    jobs = []
+    for game_name, game_data in list(workshop_manager.processed_mods.items()):
+        if games and game_name not in games:
+            continue
+        candidates = []
+        for pdf_key, info in list(game_data.get("rulebooks", {}).items()):
+            path = info.get("editable_text_path")
+            if not path or not os.path.exists(path):
+                continue
+            if workshop_manager.rulebook_manager.is_template_content(path, game_name):
+                continue
+            candidates.append((os.path.getmtime(path), pdf_key, path, info))
+        if not candidates:
+            continue
+        _, pdf_key, path, info = max(candidates, key=lambda candidate: candidate[0])
+        if len(candidates) > 1:
+            print(f"游戏 '{game_name}' 有 {len(candidates)} 本已填写的规则书，使用最近修改的 {os.path.basename(path)}")
+        jobs.append({
+            "game_name": game_name,
+            "pdf_key": pdf_key,
+            "path": path,
+            "rulebook_id": info.get("display_id"),
+            "status": info.get("status"),
+            "size": os.path.getsize(path),
+        })
+    return jobs
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class IndexProgress:
+    """统计批量建立索引的吞吐量，按剩余规则书的字节数估算剩余时间"""
+
+    def __init__(self, jobs: List[Dict[str, Any]]):
+        self.total = len(jobs)
+        self.total_bytes = sum(job["size"] for job in jobs)
+        self.done = 0
+        self.done_bytes = 0
+        self.chunks = 0
+        self.started_at = time.perf_counter()
+
+    def update(self, job: Dict[str, Any], chunks: int) -> str:
+        """记录完成一个规则书，返回进度行"""
+        self.done += 1
+        self.done_bytes += job["size"]
+        self.chunks += chunks
+        elapsed = max(time.perf_counter() - self.started_at, 1e-6)
+        remaining_bytes = self.total_bytes - self.done_bytes
+        eta = remaining_bytes / self.done_bytes * elapsed if self.done_bytes else 0.0
+        return (
+            f"[{self.done}/{self.total}] {job['game_name']}: {chunks} 块 | "
+            f"{self.chunks / elapsed:.1f} 块/秒, {self.done_bytes / 1024 / elapsed:.1f} KB/秒, "
+            f"已用 {_format_duration(elapsed)}, 剩余约 {_format_duration(eta)}"
+        )
+
+
+def _config_snapshot() -> Dict[str, Any]:
+    """当前进程的全部配置项，工作进程使用相同的配置 (包括命令行和测试中的修改)"""
+    return {name: value for name, value in vars(cfg).items() if name.isupper()}
+
+
+def _init_worker(settings: Dict[str, Any], quiet: bool):
+    global _worker_manager
+    for name, value in settings.items():
+        setattr(cfg, name, value)
+    if quiet:
+        # 进度由主进程输出，工作进程的建立索引日志会与进度行交错
+        sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    from services.langchain_manager import LangchainManager
+    _worker_manager = LangchainManager()
+
+
+def _build_index(job: Dict[str, Any], force: bool) -> Dict[str, Any]:
+    """在工作进程中建立一个游戏的索引"""
+    started_at = time.perf_counter()
+    game_name = job["game_name"].strip()
+    rebuilt = _worker_manager.add_rulebook_text(
+        job["path"], game_name, skip_if_unchanged=not force, rulebook_id=job["rulebook_id"]
+    )
+    # 工作进程不回答问题，不保留检索器
+    _worker_manager.game_retrievers.pop(game_name, None)
+    _worker_manager.game_parent_chunks.pop(game_name, None)
+    manifest = _worker_manager._load_index_manifest(os.path.join(cfg.VECTOR_STORE_DIRECTORY, game_name)) or {}
+    return {"rebuilt": rebuilt, "chunks": manifest.get("chunks", 0), "seconds": time.perf_counter() - started_at}
+
+
+def _start_shared_embeddings(manager, work_dir: str):
+    """
+    为工作进程启动共享Embedding服务，返回 (服务, 工作进程的配置覆盖)。
+    已配置 EMBEDDING_PROVIDER=service 时工作进程直接使用该服务; 不支持Unix套接字时各工作进程自行加载模型。
+    """
+    if cfg.EMBEDDING_PROVIDER == "service":
+        return None, {}
+    if not hasattr(socket, "AF_UNIX"):
+        print("当前系统不支持Unix套接字，各工作进程分别加载Embedding模型")
+        return None, {}
+    from services.embedding_service import EmbeddingService
+    socket_path = os.path.join(work_dir, "embeddings.sock")
+    service = EmbeddingService(
+        manager.embeddings, socket_path, cfg.EMBEDDING_BATCH_SIZE, cfg.EMBEDDING_MAX_BATCH_CHARS,
+        cfg.EMBEDDING_QUEUE_SIZE,
+    ).start()
+    return service, {"EMBEDDING_PROVIDER": "service", "EMBEDDING_SERVICE_SOCKET": socket_path}
+
+
+def run_bulk_index(workshop_manager, manager, workers: int = 0, force: bool = False,
+                   games: Optional[List[str]] = None, quiet: bool = True) -> Dict[str, Any]:
+    """
+    并行建立所有规则书的索引。
+    Args:
+        manager: 主进程的 LangchainManager，用于判断索引是否最新，其Embedding模型由工作进程共享
+        workers: 工作进程数，0 表示CPU核数
+        force: 为True时忽略索引清单，全部重建
+    Returns:
+        统计: built / skipped / failed 的游戏数、文档块数、耗时
+    """
+    jobs = collect_index_jobs(workshop_manager, games)
+    pending = []
+    skipped = 0
+    for job in jobs:
+        if not force and manager.is_index_current(job["path"], job["game_name"], job["rulebook_id"]):
+            skipped += 1
+            if job["status"] != "processed_into_rag":
+                workshop_manager.update_rulebook_status(job["game_name"], job["pdf_key"], "processed_into_rag")
+        else:
+            pending.append(job)
+    summary = {"built": 0, "skipped": skipped, "failed": 0, "chunks": 0, "seconds": 0.0, "interrupted": False}
+    print(f"共 {len(jobs)} 个游戏有已填写的规则书，{skipped} 个索引已是最新，{len(pending)} 个需要建立")
+    if not pending:
+        return summary
+
+    workers = min(workers if workers > 0 else (os.cpu_count() or 1), len(pending))
+    work_dir = tempfile.mkdtemp(prefix="tts_index_")
+    service, overrides = _start_shared_embeddings(manager, work_dir)
+    settings = {**_config_snapshot(), **INDEXING_OVERRIDES, **overrides}
+    # 大的规则书先开始，减少最后只剩一个进程在工作的时间
+    pending.sort(key=lambda job: job["size"], reverse=True)
+    progress = IndexProgress(pending)
+    print(f"使用 {workers} 个工作进程" + ("，共享Embedding服务" if overrides else ""))
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(settings, quiet),
+    )
+    try:
+        futures = {executor.submit(_build_index, job, force): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"建立 '{job['game_name']}' 的索引失败: {type(e).__name__}: {e}")
+                continue
+            summary["built"] += 1
+            summary["chunks"] += result["chunks"]
+            workshop_manager.update_rulebook_status(job["game_name"], job["pdf_key"], "processed_into_rag")
+            print(progress.update(job, result["chunks"]))
+    except KeyboardInterrupt:
+        summary["interrupted"] = True
+        print(f"\n已中断: 完成 {summary['built']}/{len(pending)} 个，重新运行将从未完成的游戏继续")
+    finally:
+        executor.shutdown(wait=not summary["interrupted"], cancel_futures=True)
+        if service is not None:
+            service.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    summary["seconds"] = round(time.perf_counter() - progress.started_at, 2)
+    return summary
+
+
+def main():
+    from services.langchain_manager import LangchainManager
+    from services.workshop_manager import WorkshopManager
+
+    parser = argparse.ArgumentParser(description="并行建立或更新所有已填写规则书的向量索引")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数 (0 表示CPU核数)")
+    parser.add_argument("--game", action="append", dest="games", help="只处理指定的游戏，可重复")
+    parser.add_argument("--force", action="store_true", help="忽略索引清单，全部重建")
+    parser.add_argument("--verbose", action="store_true", help="输出工作进程的建立索引日志")
+    args = parser.parse_args()
+
+    for name, value in INDEXING_OVERRIDES.items():
+        setattr(cfg, name, value)
+    summary = run_bulk_index(WorkshopManager(), LangchainManager(), args.workers, args.force, args.games,
+                             quiet=not args.verbose)
+    if summary["built"] or summary["failed"]:
+        rate = summary["chunks"] / summary["seconds"] if summary["seconds"] else 0.0
+        print(f"完成: 建立 {summary['built']} 个，跳过 {summary['skipped']} 个，失败 {summary['failed']} 个，"
+              f"{summary['chunks']} 块，用时 {_format_duration(summary['seconds'])} ({rate:.1f} 块/秒)")
+    if summary["interrupted"]:
+        sys.exit(130)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
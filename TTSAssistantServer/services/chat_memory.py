@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 对话记忆
+按token预算 (而非固定轮数) 截取最近的对话历史，或保留最近几轮原文加较早对话的滚动摘要
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from services.condense_policy import format_chat_history
+from services.token_counter import estimate_tokens, truncate_to_tokens
+
+# 更新滚动摘要的提示词
+SUMMARY_PROMPT_TEMPLATE = (
+    "下面是玩家与桌游规则助手的对话。请把新的对话并入已有摘要，"
+    "保留已确认的规则结论、提到的卡牌/阶段/术语名称和玩家尚未解决的疑问，省略寒暄。"
+    "只输出更新后的中文摘要，不超过{max_tokens}字。\n\n"
+    "已有摘要:\n{summary}\n\n新的对话:\n{conversation}\n\n更新后的摘要:"
+)
+SUMMARY_PREFIX = "此前对话摘要: "
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """
+    保留完整对话历史，但只把最近的、总token数不超过预算的消息交给链使用。
+    最近一条消息总是保留，即使它本身超出预算。
+    """
+
+    memory_key: str = "chat_history"
+    max_token_limit: int = 800
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def buffer_as_messages(self) -> List[BaseMessage]:
+        """预算内的最近消息"""
+        kept: List[BaseMessage] = []
+        used = 0
+        for message in reversed(self.chat_memory.messages):
+            tokens = estimate_tokens(str(message.content))
+            if kept and used + tokens > self.max_token_limit:
+                break
+            kept.append(message)
+            used += tokens
+        kept.reverse()
+        # 不以孤立的AI回答开头，保证历史从一个完整的问答轮次开始
+        while len(kept) > 1 and kept[0].type == "ai":
+            kept.pop(0)
+        return kept
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.buffer_as_messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {
+            self.memory_key: get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+
+class RollingSummaryMemory(BaseChatMemory):
+    """
+    只把最近 recent_turns 轮对话原文和较早对话的滚动摘要交给链使用，提示词长度不随会话变长而增长。
+    摘要在保存对话后由后台线程调用LLM更新，不占用请求的响应时间；
+    并入摘要的消息从历史中删除。摘要更新失败时保留这些消息，下次保存对话时重试。
+    """
+
+    memory_key: str = "chat_history"
+    recent_turns: int = 2
+    max_summary_tokens: int = 300
+    # 生成摘要的LLM (需要 invoke 方法)
+    summarizer: Any = None
+    summary: str = ""
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _worker: Optional[threading.Thread] = PrivateAttr(default=None)
+    # clear() 时递增，丢弃清空前开始的摘要更新
+    _generation: int = PrivateAttr(default=0)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def buffer_as_messages(self) -> List[BaseMessage]:
+        """摘要 (作为系统消息) 和最近几轮的消息"""
+        with self._lock:
+            messages = list(self.chat_memory.messages)
+            summary = self.summary
+        kept = messages[-2 * self.recent_turns:] if self.recent_turns > 0 else []
+        # 不以孤立的AI回答开头，保证历史从一个完整的问答轮次开始
+        while kept and kept[0].type == "ai":
+            kept.pop(0)
+        if summary:
+            kept.insert(0, SystemMessage(content=f"{SUMMARY_PREFIX}{summary}"))
+        return kept
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.buffer_as_messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {
+            self.memory_key: get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        with self._lock:
+            super().save_context(inputs, outputs)
+        self._schedule_summary()
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self.summary = ""
+            self._generation += 1
+
+    def _pending_messages(self) -> List[BaseMessage]:
+        """超出最近几轮、尚未并入摘要的消息 (调用方持有锁)"""
+        messages = self.chat_memory.messages
+        return list(messages[:max(0, len(messages) - 2 * self.recent_turns)])
+
+    def _schedule_summary(self):
+        """有需要并入摘要的消息时启动后台更新，已在更新时由其完成后继续处理"""
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if self._worker is not None or not self._pending_messages():
+                return
+            self._worker = threading.Thread(target=self._update_summary, name="history-summary", daemon=True)
+            worker = self._worker
+        worker.start()
+
+    def _update_summary(self):
+        while True:
+            with self._lock:
+                pending = self._pending_messages()
+                if not pending:
+                    self._worker = None
+                    return
+                summary, generation = self.summary, self._generation
+            try:
+                new_summary = self._summarize(summary, pending)
+            except Exception as e:
+                print(f"更新对话摘要失败: {e}")
+                with self._lock:
+                    self._worker = None
+                return
+            with self._lock:
+                # 更新期间对话被清空时丢弃结果，按清空后的历史重新判断
+                if generation != self._generation:
+                    continue
+                self.summary = new_summary
+                # 新消息只会追加在末尾，删除开头已并入摘要的消息
+                del self.chat_memory.messages[:len(pending)]
+
+    def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(
+            max_tokens=self.max_summary_tokens,
+            summary=summary or "(无)",
+            conversation=format_chat_history(messages),
+        )
+        result = self.summarizer.invoke(prompt)
+        text = str(getattr(result, "content", result))
+        text = re.sub(r"<think>.*?</think>\n?", "", text, flags=re.DOTALL).strip()
+        return truncate_to_tokens(text, self.max_summary_tokens)
+
+    def wait_for_summary(self, timeout: Optional[float] = None):
+        """等待正在进行的摘要更新完成 (用于测试和关闭服务前)"""
+        with self._lock:
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则出处
+根据规则书中的页码标记 (<!-- page N -->，由PDF文本提取写入) 为文档块标注页码，
+并把回答所依据的文档块整理成简短的出处，例如 "规则书2 第14页"。
+"""
+
+import bisect
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+PAGE_MARKER_PATTERN = re.compile(r"<!--\s*page\s+(\d+)\s*-->", re.IGNORECASE)
+
+
+class PageIndex:
+    """规则书文本中页码标记的位置，用于按字符位置查询所在页"""
+
+    def __init__(self, text: str):
+        self.offsets: List[int] = []
+        self.pages: List[int] = []
+        for match in PAGE_MARKER_PATTERN.finditer(text):
+            self.offsets.append(match.start())
+            self.pages.append(int(match.group(1)))
+
+    def __bool__(self) -> bool:
+        return bool(self.offsets)
+
+    def page_at(self, offset: int) -> Optional[int]:
+        """位置所在的页 (该位置之前最后一个页码标记)，在第一个标记之前时返回None"""
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        return self.pages[index] if index >= 0 else None
+
+    def page_range(self, start: int, end: int) -> Tuple[Optional[int], Optional[int]]:
+        """[start, end) 范围覆盖的首页和末页"""
+        first = self.page_at(start)
+        last = self.page_at(max(start, end - 1))
+        return (first if first is not None else last), last
+
+
+def set_page_metadata(metadata: Dict, first: Optional[int], last: Optional[int]):
+    """写入 page (首页)，跨页时再写入 page_end"""
+    if first is None:
+        return
+    metadata["page"] = first
+    if last is not None and last != first:
+        metadata["page_end"] = last
+
+
+def annotate_pages(docs: List[Document], text: str):
+    """为带有 start_index 元数据的文档块 (按字符分块的结果) 标注页码"""
+    page_index = PageIndex(text)
+    if not page_index:
+        return
+    for doc in docs:
+        start = doc.metadata.get("start_index")
+        if isinstance(start, int) and start >= 0:
+            set_page_metadata(doc.metadata, *page_index.page_range(start, start + len(doc.page_content)))
+
+
+def collect_citations(docs: List[Document], max_items: int = 3) -> List[Dict]:
+    """
+    按相关度顺序整理文档块的出处，相同出处只保留一次
+    Returns:
+        [{"rulebook_id", "section", "page", "page_end"}] (缺少的字段为None)
+    """
+    citations: List[Dict] = []
+    seen = set()
+    for doc in docs:
+        metadata = doc.metadata
+        citation = {
+            "rulebook_id": metadata.get("rulebook_id"),
+            "section": metadata.get("section_path") or None,
+            "page": metadata.get("page"),
+            "page_end": metadata.get("page_end"),
+        }
+        if citation["page"] is None and citation["section"] is None:
+            continue
+        # 有页码时按页码去重，否则按章节去重
+        key = (citation["rulebook_id"], citation["page"], citation["page_end"]) if citation["page"] is not None \
+            else (citation["rulebook_id"], citation["section"])
+        if key in seen:
+            continue
+        seen.add(key)
+        citations.append(citation)
+        if len(citations) >= max_items:
+            break
+    return citations
+
+
+def format_citation(citation: Dict) -> str:
+    """单个出处的简短文本: 规则书2 第14页 / 规则书2 第14-15页 / 规则书1「准备阶段 > 选牌」"""
+    text = f"规则书{citation['rulebook_id']}" if citation.get("rulebook_id") else ""
+    if citation.get("page") is not None:
+        page_end = citation.get("page_end")
+        pages = f"{citation['page']}-{page_end}" if page_end is not None else f"{citation['page']}"
+        text = f"{text} 第{pages}页".strip()
+    elif citation.get("section"):
+        text += f"「{citation['section']}」"
+    return text
+
+
+def format_citations(citations: List[Dict]) -> str:
+    """一行显示的出处，例如 "规则书2 第14页; 规则书2 第20-21页"，没有出处时返回空字符串"""
+    return "; ".join(text for text in (format_citation(citation) for citation in citations) if text)
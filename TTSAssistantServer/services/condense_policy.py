@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 问题改写策略
+决定后续问题是否需要结合对话历史改写 (condense) 成独立问题
+"""
+
+import re
+from typing import List, Tuple
+
+from langchain.schema.messages import BaseMessage
+
+# 改写模式
+CONDENSE_MODE_ALWAYS = "always"  # 只要有历史就改写 (Langchain默认行为)
+CONDENSE_MODE_AUTO = "auto"      # 无历史或问题本身已完整时跳过改写
+CONDENSE_MODE_NEVER = "never"    # 从不改写，直接用原问题检索
+
+# 改写路径标签，记录在请求计时中
+PATH_NO_HISTORY = "no_history"
+PATH_SELF_CONTAINED = "self_contained"
+PATH_DISABLED = "disabled"
+PATH_CONDENSE = "condense"
+
+# 指代上文的词语，出现时通常需要结合历史才能理解
+_ZH_REFERENCE_MARKERS = (
+    "它", "他们", "她们", "它们", "这个", "那个", "这张", "那张", "这些", "那些",
+    "这种", "那种", "这样", "那样", "上面", "上述", "刚才", "之前", "前面",
+    "同样", "还有", "另外", "那么", "那如果", "如果是",
+)
+_EN_REFERENCE_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "his", "her", "one", "ones", "same", "also", "else", "above",
+    "previous", "again",
+}
+_EN_REFERENCE_PREFIXES = ("what about", "how about", "and if", "and what", "and how", "then")
+
+# 过短的问题 (例如 "为什么？"、"那呢") 通常依赖上文
+_MIN_SELF_CONTAINED_CJK_CHARS = 6
+_MIN_SELF_CONTAINED_WORDS = 4
+
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+_WORD_PATTERN = re.compile(r"[a-zA-Z']+")
+
+
+def looks_self_contained(question: str) -> bool:
+    """启发式判断问题是否无需上文即可理解"""
+    text = question.strip()
+    lowered = text.lower()
+
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    words = _WORD_PATTERN.findall(lowered)
+
+    if cjk_count:
+        if cjk_count < _MIN_SELF_CONTAINED_CJK_CHARS:
+            return False
+        # 以"呢"结尾的追问，例如"那弃牌阶段呢？"
+        if re.search(r"呢[？?。.!！\s]*$", text):
+            return False
+        if any(marker in text for marker in _ZH_REFERENCE_MARKERS):
+            return False
+    elif len(words) < _MIN_SELF_CONTAINED_WORDS:
+        return False
+
+    if lowered.startswith(_EN_REFERENCE_PREFIXES):
+        return False
+    if any(word in _EN_REFERENCE_WORDS for word in words):
+        return False
+    return True
+
+
+def decide_condense(question: str, history: List[BaseMessage], mode: str) -> Tuple[bool, str]:
+    """
+    决定本次请求是否执行问题改写。
+    Returns:
+        (是否改写, 路径标签)
+    """
+    if not history:
+        return False, PATH_NO_HISTORY
+    if mode == CONDENSE_MODE_NEVER:
+        return False, PATH_DISABLED
+    if mode == CONDENSE_MODE_AUTO and looks_self_contained(question):
+        return False, PATH_SELF_CONTAINED
+    return True, PATH_CONDENSE
+
+
+def format_chat_history(history: List[BaseMessage]) -> str:
+    """将对话历史格式化为改写提示词使用的文本"""
+    lines = []
+    for message in history:
+        if not message.content:
+            continue
+        if message.type == "human":
+            prefix = "Human: "
+        elif message.type == "ai":
+            prefix = "Assistant: "
+        else:
+            prefix = f"{message.type}: "
+        lines.append(f"{prefix}{message.content}")
+    return "\n".join(lines)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 上下文构建
+合并检索结果中相邻或重叠的文档块，并按相关度顺序填充token预算
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from services.token_counter import estimate_tokens, truncate_to_tokens
+
+# 无 start_index 元数据时，判定两个块文本重叠所需的最少重叠字符数
+MIN_TEXT_OVERLAP = 20
+# 文本重叠检测的最大长度 (与分割器的 chunk_overlap 对应，留出余量)
+MAX_TEXT_OVERLAP = 400
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """返回 left 的后缀与 right 的前缀之间的最长重叠长度，不足 MIN_TEXT_OVERLAP 时返回0"""
+    max_len = min(len(left), len(right), MAX_TEXT_OVERLAP)
+    for size in range(max_len, MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class _Span:
+    """合并过程中的一段连续文本"""
+
+    def __init__(self, doc: Document, rank: int):
+        self.text = doc.page_content
+        self.metadata = dict(doc.metadata)
+        self.source = doc.metadata.get("source")
+        self.rank = rank
+        start = doc.metadata.get("start_index")
+        self.start: Optional[int] = start if isinstance(start, int) and start >= 0 else None
+
+    @property
+    def end(self) -> Optional[int]:
+        return self.start + len(self.text) if self.start is not None else None
+
+    def try_merge(self, other: "_Span") -> bool:
+        """尝试把 other 合并进来，成功返回True"""
+        if self.source != other.source:
+            return False
+
+        if self.start is not None and other.start is not None:
+            first, second = (self, other) if self.start <= other.start else (other, self)
+            if second.start > first.end:
+                return False
+            # 首尾相接的块只在同一章节内合并，避免丢失各自的章节元数据
+            if second.start == first.end and first.metadata.get("section_path") != second.metadata.get("section_path"):
+                return False
+            overlap = first.end - second.start
+            text = first.text + second.text[overlap:] if second.end > first.end else first.text
+            start = first.start
+        else:
+            overlap = _text_overlap(self.text, other.text)
+            if overlap:
+                text = self.text + other.text[overlap:]
+            else:
+                overlap = _text_overlap(other.text, self.text)
+                if not overlap:
+                    return False
+                text = other.text + self.text[overlap:]
+            start = None
+
+        self.text = text
+        self.start = start
+        self.rank = min(self.rank, other.rank)
+        if start is not None:
+            self.metadata["start_index"] = start
+        return True
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.text, metadata=self.metadata)
+
+
+def merge_overlapping_chunks(docs: List[Document]) -> List[Document]:
+    """
+    合并同一来源中相邻或重叠的文档块，去除重复的重叠文本。
+    合并后的块按其成员中最高的相关度 (原始顺序) 排序。
+    """
+    spans: List[_Span] = []
+    for rank, doc in enumerate(docs):
+        span = _Span(doc, rank)
+        # 新块可能同时连接两个已有块，循环直到不能再合并
+        merged = True
+        while merged:
+            merged = False
+            for existing in spans:
+                if existing.try_merge(span):
+                    spans.remove(existing)
+                    span = existing
+                    merged = True
+                    break
+        spans.append(span)
+    spans.sort(key=lambda span: span.rank)
+    return [span.to_document() for span in spans]
+
+
+def expand_to_parents(docs: List[Document], parent_chunks: Dict[str, Document]) -> List[Document]:
+    """
+    小块检索、大块返回: 把命中的子块替换为其所属的父章节块，同一父块只保留一次。
+    找不到父块的文档原样保留。
+    """
+    expanded: List[Document] = []
+    seen_parents = set()
+    for doc in docs:
+        parent_id = doc.metadata.get("parent_id")
+        parent = parent_chunks.get(parent_id) if parent_id else None
+        if parent is None:
+            expanded.append(doc)
+        elif parent_id not in seen_parents:
+            seen_parents.add(parent_id)
+            expanded.append(parent)
+    return expanded
+
+
+def build_context(docs: List[Document], token_budget: int) -> Tuple[List[Document], int]:
+    """
+    合并重叠块后按相关度顺序填充token预算。
+    Args:
+        docs: 按相关度排序的检索结果
+        token_budget: 上下文token预算，<=0 表示不限制
+    Returns:
+        (选中的文档列表, 估算的上下文token数)
+    """
+    merged = merge_overlapping_chunks(docs)
+    selected: List[Document] = []
+    used = 0
+    for doc in merged:
+        tokens = estimate_tokens(doc.page_content)
+        if token_budget <= 0 or used + tokens <= token_budget:
+            selected.append(doc)
+            used += tokens
+        elif not selected:
+            # 最相关的块本身就超出预算时截断它，保证至少有一段上下文
+            text = truncate_to_tokens(doc.page_content, token_budget)
+            selected.append(Document(page_content=text, metadata=doc.metadata))
+            used += estimate_tokens(text)
+        # 放不下的块跳过，继续尝试更小的后续块填满剩余预算
+    return selected, used
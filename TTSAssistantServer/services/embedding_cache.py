@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 查询Embedding缓存
+包装Embedding提供商，为检索查询提供进程内LRU缓存和微批处理:
+    - 相同的 (模型, 规范化文本) 只计算一次，重复的问题直接命中缓存
+    - 正在计算中的相同查询不会重复请求，后来者等待同一个结果
+    - 几毫秒内先后到达的不同查询合并为一次批量请求 (提供商支持批量查询时)
+文档Embedding (建立索引) 不经过缓存，直接交给底层提供商。
+"""
+
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+# 查询与文档Embedding相同、可以直接用 embed_documents 批量计算查询的提供商
+_SYMMETRIC_PROVIDERS = {
+    "OpenAIEmbeddings", "HuggingFaceEmbeddings", "LocalEmbeddings", "EmbeddingServiceClient",
+    "HashingEmbeddings", "FakeEmbeddings",
+}
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本: 全角半角统一 (NFKC)、去除首尾空白、合并连续空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embedding_model_key(embeddings: Embeddings) -> str:
+    """Embedding提供商和模型的标识，作为缓存键的一部分"""
+    # 共享Embedding服务的客户端使用服务端模型的标识，与进程内加载同一模型时一致
+    served_model_key = getattr(embeddings, "served_model_key", None)
+    if isinstance(served_model_key, str) and served_model_key:
+        return served_model_key
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or ""
+    return f"{type(embeddings).__name__}:{model}"
+
+
+def _query_batch_function(embeddings: Embeddings) -> Optional[Callable[[List[str]], List[List[float]]]]:
+    """
+    返回一次计算多条查询Embedding的函数，提供商不支持时返回None (逐条调用 embed_query)。
+    Gemini 的查询和文档使用不同的 task_type；Ollama 的 embed_query 会加查询前缀且本身逐条请求，
+    所以只对已知对称的提供商使用 embed_documents。
+    """
+    name = type(embeddings).__name__
+    if name == "GoogleGenerativeAIEmbeddings":
+        return lambda texts: embeddings.embed_documents(texts, task_type="retrieval_query")
+    if name in _SYMMETRIC_PROVIDERS:
+        return embeddings.embed_documents
+    return None
+
+
+class _PendingQuery:
+    """正在计算中的查询，等待者共享同一个结果"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.done = threading.Event()
+        self.vector: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """带LRU缓存和微批处理的查询Embedding包装器"""
+
+    def __init__(self, embeddings: Embeddings, cache_size: int = 2048, batch_window_ms: float = 5.0,
+                 max_batch_size: int = 32):
+        self.embeddings = embeddings
+        self.model_key = embedding_model_key(embeddings)
+        self.cache_size = cache_size
+        self.batch_window = max(batch_window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._batch_function = _query_batch_function(embeddings)
+
+        self._lock = threading.Lock()
+        # LRU缓存 {(model_key, 规范化文本): 向量}
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, ...]]" = OrderedDict()
+        # 正在计算中的查询 {缓存键: _PendingQuery}
+        self._in_flight: Dict[Tuple[str, str], _PendingQuery] = {}
+        # 等待批量计算的查询
+        self._queue: List[Tuple[Tuple[str, str], _PendingQuery]] = []
+        self._batch_leader_active = False
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_queries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model_key, normalize_query(text))
+        # 当前线程的角色: wait (等待他人的结果) / single (单独计算) / batch (负责批量计算)
+        role = "wait"
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(cached)
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                pending = _PendingQuery(key[1])
+                self._in_flight[key] = pending
+                if self._batch_function is None:
+                    role = "single"
+                else:
+                    self._queue.append((key, pending))
+                    if not self._batch_leader_active:
+                        self._batch_leader_active = True
+                        role = "batch"
+
+        if role == "single":
+            self._run_single(key, pending)
+        elif role == "batch":
+            self._run_batches()
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return list(pending.vector)
+
+    def _run_single(self, key: Tuple[str, str], pending: _PendingQuery) -> None:
+        try:
+            vector = self.embeddings.embed_query(pending.text)
+            self._finish([(key, pending)], [vector])
+        except BaseException as e:
+            self._fail([(key, pending)], e)
+
+    def _run_batches(self) -> None:
+        """批次负责人: 等待一个很短的窗口收集并发查询，然后分批计算直到队列清空"""
+        if self.batch_window > 0:
+            time.sleep(self.batch_window)
+        while True:
+            with self._lock:
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                if not batch:
+                    self._batch_leader_active = False
+                    return
+                self.batches += 1
+                self.batched_queries += len(batch)
+            try:
+                vectors = self._batch_function([pending.text for _, pending in batch])
+                if len(vectors) != len(batch):
+                    raise ValueError(f"批量查询Embedding返回了 {len(vectors)} 个向量，期望 {len(batch)} 个")
+                self._finish(batch, vectors)
+            except BaseException as e:
+                self._fail(batch, e)
+
+    def _finish(self, batch, vectors) -> None:
+        with self._lock:
+            for (key, pending), vector in zip(batch, vectors):
+                pending.vector = list(vector)
+                self._in_flight.pop(key, None)
+                if self.cache_size > 0:
+                    self._cache[key] = tuple(pending.vector)
+                    self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for _, pending in batch:
+            pending.done.set()
+
+    def _fail(self, batch, error: BaseException) -> None:
+        with self._lock:
+            for key, pending in batch:
+                pending.error = error
+                self._in_flight.pop(key, None)
+        for _, pending in batch:
+            pending.done.set()
+
+    def queue_depth(self) -> int:
+        """正在计算或等待批量计算的查询数"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def clear(self) -> None:
+        """清空缓存 (统计保留)"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """缓存和批处理统计"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "model": self.model_key,
+                "cache_size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "batches": self.batches,
+                "avg_batch_size": self.batched_queries / self.batches if self.batches else 0.0,
+            }
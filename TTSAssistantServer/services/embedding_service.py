@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 共享Embedding服务
+在独立进程中加载一次本地 sentence-transformers 模型，通过Unix套接字为所有服务进程计算Embedding，
+每个服务进程不必各自加载几百MB的模型; 来自不同进程、不同请求的文本在服务端合并分批计算。
+服务进程使用 EMBEDDING_PROVIDER=service，通过 EmbeddingServiceClient 访问。
+
+启动服务 (在 TTSAssistantServer 目录下，模型和后端使用 SENTENCE_TRANSFORMER_* 配置):
+    python -m services.embedding_service
+    python -m services.embedding_service --socket /tmp/tts_embeddings.sock
+
+协议: 每帧为4字节大端长度 + 内容。请求为JSON ({"op": "embed", "texts": [...]} 或 {"op": "info"})，
+embed 的响应为JSON头 {"count": n, "dim": d} 加一帧 float32 向量数据，出错时只有JSON头 {"error": "..."}。
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from services.embedding_cache import embedding_model_key
+from services.local_embeddings import EmbeddingBatcher, LocalEmbeddings
+
+_FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+# Windows 等系统没有Unix套接字 (也没有 ThreadingUnixStreamServer)，不能使用共享Embedding服务
+UNIX_SOCKETS_SUPPORTED = hasattr(socket, "AF_UNIX")
+
+if UNIX_SOCKETS_SUPPORTED:
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class EmbeddingServiceError(RuntimeError):
+    """服务端计算Embedding失败"""
+
+
+def _require_unix_sockets():
+    if not UNIX_SOCKETS_SUPPORTED:
+        raise ConnectionError("当前系统不支持Unix套接字，无法使用共享Embedding服务，请改用其他 EMBEDDING_PROVIDER")
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Embedding服务连接已关闭")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _FRAME_HEADER.unpack(_recv_exactly(sock, _FRAME_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Embedding服务帧过大: {size} 字节")
+    return _recv_exactly(sock, size)
+
+
+class EmbeddingService:
+    """通过Unix套接字提供 embeddings 的批量计算，同时处理的请求在一个推理线程中合并分批"""
+
+    def __init__(self, embeddings: Embeddings, socket_path: str, max_batch_size: int = 32,
+                 max_batch_chars: int = 16000, queue_size: int = 256):
+        self.socket_path = socket_path
+        self.model_key = embedding_model_key(embeddings)
+        if isinstance(embeddings, LocalEmbeddings):
+            # 本地后端自带有界队列和动态分批
+            self._embed: Callable[[List[str]], List[List[float]]] = embeddings.embed_documents
+        else:
+            batcher = EmbeddingBatcher(
+                lambda texts: np.asarray(embeddings.embed_documents(texts), dtype=np.float32),
+                max_batch_size, max_batch_chars, queue_size,
+            )
+            self._embed = batcher.embed
+        self._server = None
+
+    def _handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if request.get("op") == "info":
+            return {"model_key": self.model_key}
+        if request.get("op") == "embed":
+            return {"vectors": np.asarray(self._embed(request.get("texts") or []), dtype=np.float32)}
+        return {"error": f"未知的请求: {request.get('op')}"}
+
+    def _make_handler(self):
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # 一个连接上可以依次发送多个请求
+                while True:
+                    try:
+                        request = json.loads(recv_frame(self.request).decode("utf-8"))
+                    except (ConnectionError, OSError):
+                        return
+                    try:
+                        response = service._handle(request)
+                    except Exception as e:
+                        response = {"error": f"{type(e).__name__}: {e}"}
+                    vectors = response.pop("vectors", None)
+                    if vectors is not None:
+                        vectors = vectors.reshape(len(vectors), -1)
+                        response = {"count": int(vectors.shape[0]), "dim": int(vectors.shape[1])}
+                    send_frame(self.request, json.dumps(response).encode("utf-8"))
+                    if vectors is not None:
+                        send_frame(self.request, vectors.tobytes())
+
+        return Handler
+
+    def start(self) -> "EmbeddingService":
+        """在后台线程中开始监听"""
+        _require_unix_sockets()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        self._server = _UnixServer(self.socket_path, self._make_handler())
+        # 只允许同一用户的进程连接
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._server.serve_forever, name="embedding-service", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class EmbeddingServiceClient(Embeddings):
+    """共享Embedding服务的客户端，并发调用各自从连接池中取用一条连接"""
+
+    def __init__(self, socket_path: str, connect_timeout: float = 30.0, max_connections: int = 8):
+        """
+        Args:
+            connect_timeout: 等待Embedding服务启动的秒数 (与Embedding服务同时启动时)，超时抛出 ConnectionError
+        """
+        _require_unix_sockets()
+        self.socket_path = socket_path
+        self._pool: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=max(1, max_connections))
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                info = self._request({"op": "info"})
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(
+                        f"无法连接Embedding服务 {socket_path}，请先运行 python -m services.embedding_service"
+                    )
+                time.sleep(0.2)
+        # 索引清单使用服务端模型的标识: 与在进程内加载同一模型时相同，切换不会触发重建
+        self.served_model_key = info["model_key"]
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _exchange(self, sock: socket.socket, request: Dict[str, Any]):
+        send_frame(sock, json.dumps(request, ensure_ascii=False).encode("utf-8"))
+        response = json.loads(recv_frame(sock).decode("utf-8"))
+        if "error" in response or "count" not in response:
+            return response, None
+        data = recv_frame(sock)
+        vectors = np.frombuffer(data, dtype=np.float32).reshape(response["count"], response["dim"])
+        return response, vectors
+
+    def _request(self, request: Dict[str, Any]):
+        try:
+            sock = self._pool.get_nowait()
+            reused = True
+        except queue.Empty:
+            sock, reused = self._connect(), False
+        try:
+            response, vectors = self._exchange(sock, request)
+        except OSError:
+            sock.close()
+            if not reused:
+                raise
+            # 池中的连接可能已被服务端关闭 (例如服务重启)，重新连接一次
+            sock = self._connect()
+            try:
+                response, vectors = self._exchange(sock, request)
+            except OSError:
+                sock.close()
+                raise
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+        if "error" in response:
+            raise EmbeddingServiceError(response["error"])
+        return vectors if vectors is not None else response
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._request({"op": "embed", "texts": list(texts)}).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def main():
+    import config as cfg
+    from services.local_embeddings import create_sentence_transformer_embeddings
+
+    parser = argparse.ArgumentParser(description="共享Embedding服务 (Unix套接字)")
+    parser.add_argument("--socket", default=cfg.EMBEDDING_SERVICE_SOCKET, help="监听的Unix套接字路径")
+    args = parser.parse_args()
+
+    try:
+        embeddings = create_sentence_transformer_embeddings(
+            cfg.SENTENCE_TRANSFORMER_MODEL,
+            cfg.SENTENCE_TRANSFORMER_BACKEND,
+            cfg.ONNX_MODEL_DIRECTORY,
+            threads=cfg.EMBEDDING_THREADS,
+            max_batch_size=cfg.EMBEDDING_BATCH_SIZE,
+            max_batch_chars=cfg.EMBEDDING_MAX_BATCH_CHARS,
+            queue_size=cfg.EMBEDDING_QUEUE_SIZE,
+        )
+    except ImportError as e:
+        print(e)
+        sys.exit(1)
+    try:
+        service = EmbeddingService(
+            embeddings, args.socket, cfg.EMBEDDING_BATCH_SIZE, cfg.EMBEDDING_MAX_BATCH_CHARS, cfg.EMBEDDING_QUEUE_SIZE
+        ).start()
+    except ConnectionError as e:
+        print(e)
+        sys.exit(1)
+    print(f"共享Embedding服务已启动: {args.socket} ({service.model_key})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("正在停止共享Embedding服务")
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
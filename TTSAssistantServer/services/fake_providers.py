@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 模拟LLM和Embedding提供商
+LLM_PROVIDER=fake / EMBEDDING_PROVIDER=fake 时使用。
+输出是确定性的，并可配置人为延迟，用于基准测试和离线压测，
+使计时不受真实模型和网络波动的影响。
+"""
+
+import hashlib
+import math
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+
+_CJK_RUN_PATTERN = re.compile(r"[\u4e00-\u9fff]+")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# 问题改写提示词中追问所在的位置 (Langchain 默认 condense 提示词)
+_FOLLOW_UP_PATTERN = re.compile(r"Follow Up Input:\s*(.+?)\s*(?:\n|Standalone question:|$)", re.DOTALL)
+
+
+def _features(text: str) -> List[str]:
+    lowered = text.lower()
+    features = _WORD_PATTERN.findall(lowered)
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            features.append(run)
+        features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+def _sleep_ms(milliseconds: float):
+    if milliseconds > 0:
+        time.sleep(milliseconds / 1000.0)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    按特征哈希计算的确定性Embedding: 把中文字二元组和英文单词哈希到固定维度
+    (进程无关，使用md5而非内置hash)。检索效果接近词袋模型，足以评估分块和检索流程。
+    """
+
+    def __init__(self, size: int = 512, latency_ms: float = 0.0, per_text_latency_ms: float = 0.0):
+        self.size = size
+        self.model = f"hashing-{size}"
+        # 每次调用的固定延迟和每条文本的额外延迟，模拟远程Embedding服务
+        self.latency_ms = latency_ms
+        self.per_text_latency_ms = per_text_latency_ms
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for feature in _features(text):
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        _sleep_ms(self.latency_ms + self.per_text_latency_ms * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        _sleep_ms(self.latency_ms + self.per_text_latency_ms)
+        return self._embed(text)
+
+
+class FakeRulebookLLM(LLM):
+    """
+    确定性的模拟LLM:
+        - 问题改写提示词: 原样返回追问 (保证检索仍然有意义)
+        - 其他提示词: 返回包含提示词摘要的固定格式回答
+    """
+
+    # 每次调用的固定延迟 (毫秒)
+    latency_ms: float = 0.0
+    # 每个 "输出token" 的延迟 (毫秒)，模拟生成速度
+    per_token_latency_ms: float = 0.0
+    # 模拟回答的长度 (字符)
+    answer_chars: int = 80
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake_rulebook"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        follow_up = _FOLLOW_UP_PATTERN.search(prompt)
+        if follow_up:
+            answer = follow_up.group(1).strip()
+        else:
+            digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+            body = f"模拟回答 {digest}: 根据规则书，" + "规则说明" * self.answer_chars
+            answer = body[:self.answer_chars]
+        _sleep_ms(self.latency_ms + self.per_token_latency_ms * len(answer))
+        return answer
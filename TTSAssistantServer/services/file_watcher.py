@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 文件监视
+监视目录中符合条件的文件，合并短时间内的多次变化 (去抖) 后回调。
+规则书文本和工坊清单的监视都基于它。
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class FileWatcher:
+    """
+    监视目录中 match(path) 为真的文件，去抖后对每个变化的文件调用一次 on_change(path)。
+    coalesce 为True时所有文件共用一个去抖计时，一批变化只回调一次 on_change(directory)。
+    后端:
+        watchdog: 使用 watchdog 库的系统文件事件 (Linux 上为 inotify)
+        polling: 定期比较文件的修改时间和大小，无额外依赖
+        auto: 已安装 watchdog 时使用它，否则退回 polling
+    """
+
+    def __init__(self, directory: str, on_change: Callable[[str], None], match: Callable[[str], bool],
+                 backend: str = "auto", debounce_seconds: float = 2.0, poll_interval: float = 2.0,
+                 recursive: bool = True, name: str = "file-watcher", coalesce: bool = False):
+        self.directory = directory
+        self.on_change = on_change
+        self.match = match
+        self.backend = backend
+        self.debounce_seconds = max(0.0, debounce_seconds)
+        self.poll_interval = max(0.1, poll_interval)
+        self.recursive = recursive
+        self.name = name
+        self.coalesce = coalesce
+        self.active_backend: Optional[str] = None
+        # 等待去抖的文件 {path: 触发时间} (coalesce 时只有监视目录一项)
+        self._pending: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._observer = None
+        self._snapshot: Dict[str, Tuple[float, int]] = {}
+
+    def start(self) -> Optional[str]:
+        """启动监视，返回实际使用的后端 (off 时返回None)"""
+        if self.backend == "off" or self.active_backend:
+            return self.active_backend
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopped.clear()
+        if self.backend in ("auto", "watchdog") and self._start_watchdog():
+            self.active_backend = "watchdog"
+        else:
+            if self.backend not in ("auto", "watchdog", "polling"):
+                print(f"警告: 未知的文件监视方式 '{self.backend}'，使用 polling")
+            self._snapshot = self._scan()
+            self._spawn(self._poll_loop, f"{self.name}-poll")
+            self.active_backend = "polling"
+        self._spawn(self._debounce_loop, f"{self.name}-debounce")
+        return self.active_backend
+
+    def stop(self):
+        """停止监视，尚未到期的变化被丢弃"""
+        self._stopped.set()
+        with self._condition:
+            self._pending.clear()
+            self._condition.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self.active_backend = None
+
+    def notify(self, path: str):
+        """记录一次文件变化，去抖时间内的再次变化会推迟回调"""
+        if not self.match(path):
+            return
+        with self._condition:
+            key = os.path.abspath(self.directory if self.coalesce else path)
+            self._pending[key] = time.monotonic() + self.debounce_seconds
+            self._condition.notify_all()
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _spawn(self, target: Callable[[], None], name: str):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _start_watchdog(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            if self.backend == "watchdog":
+                print("未安装watchdog库，请使用pip install watchdog安装，文件监视退回轮询方式")
+            return False
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory or event.event_type not in ("created", "modified", "moved", "closed"):
+                    return
+                watcher.notify(getattr(event, "dest_path", "") or event.src_path)
+
+        try:
+            observer = Observer()
+            observer.schedule(_Handler(), self.directory, recursive=self.recursive)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            print(f"警告: 启动watchdog监视失败 ({e})，文件监视退回轮询方式")
+            return False
+        self._observer = observer
+        return True
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """当前所有被监视文件的 (修改时间, 大小)"""
+        snapshot = {}
+        for root, dirs, files in os.walk(self.directory):
+            if not self.recursive:
+                dirs.clear()
+            for name in files:
+                path = os.path.join(root, name)
+                if not self.match(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[os.path.abspath(path)] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def _poll_loop(self):
+        while not self._stopped.wait(self.poll_interval):
+            current = self._scan()
+            for path, signature in current.items():
+                if self._snapshot.get(path) != signature:
+                    self.notify(path)
+            self._snapshot = current
+
+    def _debounce_loop(self):
+        while not self._stopped.is_set():
+            with self._condition:
+                now = time.monotonic()
+                due = [path for path, deadline in self._pending.items() if deadline <= now]
+                for path in due:
+                    del self._pending[path]
+                if not due:
+                    timeout = min(self._pending.values()) - now if self._pending else None
+                    self._condition.wait(timeout)
+                    continue
+            for path in due:
+                try:
+                    self.on_change(path)
+                except Exception as e:
+                    print(f"处理文件变化 {path} 时出错: {e}")
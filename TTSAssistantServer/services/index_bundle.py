@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 索引包导出/导入
+把一个游戏的向量索引 (FAISS索引、文档块元数据、父章节块、索引清单) 和规则书文本打包为一个压缩文件，
+在性能较好的机器上建立索引后分发到其他服务端，导入时不需要重新计算Embedding。
+
+导入时校验每个文件的SHA-256、规则书内容哈希，以及Embedding模型和分块等配置与本地一致
+(不一致时导入的索引在游戏加载时会被重建，因此拒绝导入)。
+索引中的文档块元数据以 pickle 保存，只导入可信来源的索引包。
+
+用法 (在 TTSAssistantServer 目录下):
+    python -m services.index_bundle export "Terraforming Mars" tm.ttsindex.tar.gz
+    python -m services.index_bundle import tm.ttsindex.tar.gz
+    python -m services.index_bundle import tm.ttsindex.tar.gz --game "Terraforming Mars (中文)"
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import config as cfg
+from services.embedding_cache import embedding_model_key
+from services.langchain_manager import INDEX_DATA_FILES, INDEX_MANIFEST_FILENAME, PARENT_CHUNKS_FILENAME
+from services.pdf_extractor import file_sha256
+
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_METADATA_FILENAME = "bundle.json"
+BUNDLE_RULEBOOK_FILENAME = "rulebook.md"
+# 索引目录中打包的文件，导入时只接受这些文件
+INDEX_FILES = INDEX_DATA_FILES + (INDEX_MANIFEST_FILENAME,)
+
+
+class IndexBundleError(RuntimeError):
+    """索引包无法导出或导入"""
+
+
+def _index_dimension(index_path: str) -> int:
+    import faiss
+    return int(faiss.read_index(index_path).d)
+
+
+def export_index_bundle(manager, workshop_manager, game_name: str, output_path: str) -> Dict[str, Any]:
+    """
+    导出游戏的索引包。
+    Returns:
+        包的元数据 (bundle.json 的内容)
+    """
+    game_name = game_name.strip()
+    vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, game_name)
+    manifest = manager._load_index_manifest(vector_store_path)
+    # 启用共享索引段时索引数据在段目录中，游戏目录中只有索引清单
+    data_path = manager._index_data_path(game_name)
+    if not manifest or not os.path.exists(os.path.join(data_path, "index.faiss")):
+        raise IndexBundleError(f"游戏 '{game_name}' 没有已建立的索引: {vector_store_path}")
+
+    found = workshop_manager.find_rulebook_by_path(manifest.get("source_path", ""))
+    if not found or found[0] != game_name:
+        raise IndexBundleError(f"找不到建立 '{game_name}' 索引所用的规则书: {manifest.get('source_path')}")
+    pdf_key = found[1]
+    info = workshop_manager.processed_mods[game_name]["rulebooks"][pdf_key]
+    rulebook_path = info["editable_text_path"]
+    if file_sha256(rulebook_path) != manifest.get("content_sha256"):
+        raise IndexBundleError(f"规则书 {os.path.basename(rulebook_path)} 在建立索引后被修改，请先重建索引")
+
+    manifest = {key: value for key, value in manifest.items() if key != "segment"}
+    files = {f"index/{name}": os.path.join(data_path, name)
+             for name in INDEX_DATA_FILES if os.path.exists(os.path.join(data_path, name))}
+    files[f"index/{INDEX_MANIFEST_FILENAME}"] = os.path.join(vector_store_path, INDEX_MANIFEST_FILENAME)
+    files[BUNDLE_RULEBOOK_FILENAME] = rulebook_path
+    metadata = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "game_name": game_name,
+        "pdf_key": pdf_key,
+        "rulebook": {key: info.get(key) for key in ("display_id", "normalized_filename", "original_source")},
+        "manifest": manifest,
+        "embedding_dim": _index_dimension(os.path.join(data_path, "index.faiss")),
+        "files": {name: {"sha256": file_sha256(path), "size": os.path.getsize(path)} for name, path in files.items()},
+        "exported_at": time.time(),
+    }
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        with tarfile.open(temp_path, "w:gz") as tar:
+            data = json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8")
+            member = tarfile.TarInfo(BUNDLE_METADATA_FILENAME)
+            member.size, member.mtime = len(data), int(metadata["exported_at"])
+            tar.addfile(member, io.BytesIO(data))
+            for name, path in files.items():
+                tar.add(path, arcname=name, recursive=False)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return metadata
+
+
+def _extract_bundle(bundle_path: str, target_dir: str) -> Dict[str, Any]:
+    """把索引包解压到 target_dir 并校验文件，返回包的元数据"""
+    allowed = {BUNDLE_METADATA_FILENAME, BUNDLE_RULEBOOK_FILENAME} | {f"index/{name}" for name in INDEX_FILES}
+    try:
+        with tarfile.open(bundle_path, "r:*") as tar:
+            for member in tar:
+                # 只按白名单写入普通文件，不使用包中的路径，避免写到目标目录之外
+                if member.name not in allowed or not member.isfile():
+                    raise IndexBundleError(f"索引包中有无法识别的条目: {member.name}")
+                destination = os.path.join(target_dir, *member.name.split("/"))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                with tar.extractfile(member) as source, open(destination, "wb") as f:
+                    shutil.copyfileobj(source, f)
+    except (tarfile.TarError, OSError) as e:
+        raise IndexBundleError(f"无法读取索引包 {bundle_path}: {e}")
+
+    metadata_path = os.path.join(target_dir, BUNDLE_METADATA_FILENAME)
+    if not os.path.exists(metadata_path):
+        raise IndexBundleError("索引包缺少 bundle.json")
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    if metadata.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise IndexBundleError(f"不支持的索引包格式版本: {metadata.get('format_version')}")
+
+    files = metadata.get("files", {})
+    extracted = {name for name in allowed - {BUNDLE_METADATA_FILENAME}
+                 if os.path.exists(os.path.join(target_dir, *name.split("/")))}
+    if extracted != set(files):
+        raise IndexBundleError(f"索引包中的文件与清单不一致: {sorted(extracted ^ set(files))}")
+    for name, expected in files.items():
+        if file_sha256(os.path.join(target_dir, *name.split("/"))) != expected["sha256"]:
+            raise IndexBundleError(f"索引包中的 {name} 校验失败，文件已损坏")
+    for name in ("index/index.faiss", "index/index.pkl", BUNDLE_RULEBOOK_FILENAME):
+        if name not in files:
+            raise IndexBundleError(f"索引包缺少 {name}")
+    return metadata
+
+
+def _check_compatible(manager, metadata: Dict[str, Any], rulebook_path: str):
+    """Embedding模型和影响索引的配置必须与本地一致，否则导入的索引无法使用或会被重建"""
+    manifest = metadata["manifest"]
+    local_model = embedding_model_key(manager.embeddings)
+    if manifest.get("embedding_model") != local_model:
+        raise IndexBundleError(
+            f"Embedding模型不一致: 索引包使用 {manifest.get('embedding_model')}，本地使用 {local_model}"
+        )
+    fingerprint = manager._index_fingerprint(rulebook_path, metadata["rulebook"].get("display_id"))
+    mismatched = [
+        f"{key} (索引包 {manifest.get(key)!r}，本地 {value!r})"
+        for key, value in fingerprint.items() if key != "rulebook_id" and manifest.get(key) != value
+    ]
+    if mismatched:
+        raise IndexBundleError("索引配置与本地不一致: " + ", ".join(mismatched))
+
+
+def _relabel_rulebook_id(index_dir: str, rulebook_id: str):
+    """本地规则书编号与索引包中不同时，改写文档块元数据中的编号 (用于回答的出处)，不需要重新计算Embedding"""
+    index_pkl = os.path.join(index_dir, "index.pkl")
+    with open(index_pkl, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    for document in docstore._dict.values():
+        document.metadata["rulebook_id"] = rulebook_id
+    with open(index_pkl, "wb") as f:
+        pickle.dump((docstore, index_to_docstore_id), f)
+
+    parents_path = os.path.join(index_dir, PARENT_CHUNKS_FILENAME)
+    if os.path.exists(parents_path):
+        with open(parents_path, "r", encoding="utf-8") as f:
+            parents = json.load(f)
+        for item in parents:
+            item["metadata"]["rulebook_id"] = rulebook_id
+        with open(parents_path, "w", encoding="utf-8") as f:
+            json.dump(parents, f, ensure_ascii=False)
+
+
+def _write_rulebook(source_path: str, rulebook_path: str, game_name: str, workshop_manager):
+    """写入导入的规则书文本，本地已填写的不同内容备份为 .md.bak"""
+    if os.path.exists(rulebook_path) and file_sha256(rulebook_path) != file_sha256(source_path) \
+            and not workshop_manager.rulebook_manager.is_template_content(rulebook_path, game_name):
+        backup_path = f"{rulebook_path}.bak"
+        os.replace(rulebook_path, backup_path)
+        print(f"本地规则书 {os.path.basename(rulebook_path)} 的内容不同，已备份为 {os.path.basename(backup_path)}")
+    os.makedirs(os.path.dirname(rulebook_path), exist_ok=True)
+    temp_path = f"{rulebook_path}.{uuid.uuid4().hex}.tmp"
+    shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, rulebook_path)
+
+
+def import_index_bundle(manager, workshop_manager, bundle_path: str,
+                        game_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    导入索引包。先完整校验，校验通过后才修改本地文件。
+    Args:
+        game_name: 导入为的游戏名，为空时使用索引包中的游戏名
+    Returns:
+        {"game_name", "rulebook_path", "rulebook_id", "chunks"}
+    """
+    os.makedirs(cfg.VECTOR_STORE_DIRECTORY, exist_ok=True)
+    # 解压到向量存储目录下的临时目录，校验通过后改名即可替换，不跨文件系统复制
+    staging_dir = tempfile.mkdtemp(prefix=".import-", dir=cfg.VECTOR_STORE_DIRECTORY)
+    try:
+        metadata = _extract_bundle(bundle_path, staging_dir)
+        game_name = (game_name or metadata["game_name"]).strip()
+        staged_rulebook = os.path.join(staging_dir, BUNDLE_RULEBOOK_FILENAME)
+        staged_index = os.path.join(staging_dir, "index")
+        if file_sha256(staged_rulebook) != metadata["manifest"].get("content_sha256"):
+            raise IndexBundleError("索引包中的规则书与索引清单的内容哈希不一致")
+        if _index_dimension(os.path.join(staged_index, "index.faiss")) != metadata.get("embedding_dim"):
+            raise IndexBundleError("索引包中FAISS索引的维度与清单不一致")
+        _check_compatible(manager, metadata, staged_rulebook)
+
+        rulebook_path, rulebook_id = workshop_manager.plan_imported_rulebook(
+            game_name, metadata["pdf_key"], metadata["rulebook"]
+        )
+        manifest = dict(metadata["manifest"], source_path=os.path.abspath(rulebook_path))
+        if rulebook_id != manifest.get("rulebook_id"):
+            print(f"规则书编号由 {manifest.get('rulebook_id')} 改为本地的 {rulebook_id}")
+            _relabel_rulebook_id(staged_index, rulebook_id)
+            manifest["rulebook_id"] = rulebook_id
+
+        # 先安装索引再写入规则书文件: 规则书监视器看到新文件时索引已是最新，不会触发重建
+        fingerprint = manager._index_fingerprint(staged_rulebook, rulebook_id)
+        manager.install_index_directory(game_name, staged_index, fingerprint, manifest)
+        _write_rulebook(staged_rulebook, rulebook_path, game_name, workshop_manager)
+        # 索引和规则书都已写入后才登记，中途失败时游戏不会被标记为已建立索引
+        workshop_manager.register_imported_rulebook(
+            game_name, metadata["pdf_key"], metadata["rulebook"], rulebook_path, rulebook_id
+        )
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if not manager.is_index_current(rulebook_path, game_name, rulebook_id):
+        print(f"警告: 导入的 '{game_name}' 索引与规则书不一致，加载游戏时将重建")
+    return {"game_name": game_name, "rulebook_path": rulebook_path, "rulebook_id": rulebook_id,
+            "chunks": manifest.get("chunks", 0)}
+
+
+def main():
+    from services.langchain_manager import LangchainManager
+    from services.workshop_manager import WorkshopManager
+
+    parser = argparse.ArgumentParser(description="导出/导入游戏的预建索引包")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="把游戏的索引和规则书导出为索引包")
+    export_parser.add_argument("game", help="游戏名称")
+    export_parser.add_argument("output", help="索引包路径 (.tar.gz)")
+    import_parser = subparsers.add_parser("import", help="导入索引包")
+    import_parser.add_argument("bundle", help="索引包路径")
+    import_parser.add_argument("--game", help="导入为的游戏名 (默认使用包中的游戏名)")
+    args = parser.parse_args()
+
+    # 导出导入不需要检索组件
+    cfg.RERANKER = "none"
+    manager, workshop_manager = LangchainManager(), WorkshopManager()
+    try:
+        if args.command == "export":
+            metadata = export_index_bundle(manager, workshop_manager, args.game, args.output)
+            size_kb = os.path.getsize(args.output) / 1024
+            print(f"已导出 '{metadata['game_name']}' 的索引包: {args.output} ({size_kb:.1f} KB, "
+                  f"{metadata['manifest'].get('chunks', 0)} 块, {metadata['manifest'].get('embedding_model')})")
+        else:
+            result = import_index_bundle(manager, workshop_manager, args.bundle, args.game)
+            print(f"已导入 '{result['game_name']}' 的索引 ({result['chunks']} 块)，规则书: {result['rulebook_path']}")
+    except IndexBundleError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 按内容寻址的共享索引段
+许多工坊Mod是同一游戏的重新上传或变体，规则书文本完全相同。启用 SHARED_INDEX_SEGMENTS 时，
+索引数据 (FAISS索引、文档块、父章节块) 保存在以索引指纹 (内容哈希 + 影响索引的配置) 命名的段目录中，
+指纹相同的游戏共用一个段: 只计算一次Embedding，磁盘上只有一份，加载后内存中也只有一份。
+各游戏目录中只保留索引清单，清单的 "segment" 指向所用的段。
+
+段目录下的 refs/ 中每个引用该段的游戏有一个文件，删除最后一个引用时删除整个段。
+每个引用是一个独立文件，多个进程 (例如批量建立索引的工作进程) 同时增减引用不会互相覆盖。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List
+
+SEGMENTS_DIRNAME = "_segments"
+SEGMENT_REFS_DIRNAME = "refs"
+
+
+def segment_key(fingerprint: Dict[str, Any]) -> str:
+    """索引指纹的哈希，指纹相同的索引内容相同"""
+    data = json.dumps(fingerprint, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class SegmentStore:
+    """VECTOR_STORE_DIRECTORY/_segments 下的索引段及其引用"""
+
+    def __init__(self, vector_store_directory: str):
+        self.root = os.path.join(vector_store_directory, SEGMENTS_DIRNAME)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        """段是否已完整建立 (段目录只在建立完成后才改名到位)"""
+        return os.path.exists(os.path.join(self.path(key), "index.faiss"))
+
+    def staging_path(self) -> str:
+        """建立新段使用的临时目录，与段目录在同一文件系统上，完成后用 install 改名"""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".build-", dir=self.root)
+
+    def install(self, key: str, staging_path: str) -> bool:
+        """
+        把建立完成的临时目录改名为段目录。
+        Returns:
+            是否使用了该目录; 同一段已由其他线程或进程建立时删除临时目录，返回False
+        """
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            os.rename(staging_path, self.path(key))
+            return True
+        except OSError:
+            if not self.exists(key):
+                raise
+            shutil.rmtree(staging_path, ignore_errors=True)
+            return False
+
+    def _ref_path(self, key: str, game_name: str) -> str:
+        name = hashlib.sha1(game_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.path(key), SEGMENT_REFS_DIRNAME, name)
+
+    def add_ref(self, key: str, game_name: str):
+        ref_path = self._ref_path(key, game_name)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        with open(ref_path, "w", encoding="utf-8") as f:
+            f.write(game_name)
+
+    def refs(self, key: str) -> List[str]:
+        """引用该段的游戏"""
+        refs_dir = os.path.join(self.path(key), SEGMENT_REFS_DIRNAME)
+        if not os.path.isdir(refs_dir):
+            return []
+        games = []
+        for name in sorted(os.listdir(refs_dir)):
+            try:
+                with open(os.path.join(refs_dir, name), "r", encoding="utf-8") as f:
+                    games.append(f.read())
+            except OSError:
+                continue
+        return games
+
+    def release(self, key: str, game_name: str) -> bool:
+        """
+        删除游戏对段的引用，没有其他引用时删除段。
+        Returns:
+            是否删除了段
+        """
+        try:
+            os.remove(self._ref_path(key, game_name))
+        except FileNotFoundError:
+            pass
+        if not os.path.isdir(self.path(key)) or self.refs(key):
+            return False
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        return True
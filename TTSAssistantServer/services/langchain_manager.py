@@ -9,7 +9,11 @@ TabletopSimulatorCompanion (TTS Companion) - Langchain管理器
 import os
 import sys
 import re
-from typing import Dict, Any, Optional
+import json
+import hashlib
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
 import config as cfg
 import shutil
 
@@ -17,11 +21,28 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseChatMessageHistory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import BaseChatMessageHistory, Document
 from langchain.schema.messages import HumanMessage, AIMessage, BaseMessage
 from langchain_community.document_loaders import TextLoader
 from langchain.prompts import PromptTemplate
 
+from services.chat_memory import RollingSummaryMemory, TokenBudgetMemory
+from services.citations import annotate_pages, collect_citations
+from services.condense_policy import decide_condense, format_chat_history
+from services.embedding_cache import CachedQueryEmbeddings, embedding_model_key
+from services.index_segments import SEGMENTS_DIRNAME, SegmentStore, segment_key
+from services.markdown_chunker import MarkdownSectionSplitter
+from services.rag_retriever import PipelineRetriever
+from services.reranker import create_reranker
+from services.speculative_retrieval import SpeculativeRetrieval
+from services.metrics import REGISTRY as METRICS
+from services.request_trace import RequestTrace, TraceCallbackHandler
+from services.vector_compression import (
+    COMPRESSION_MODES, RESCORE_VECTORS_FILENAME, RescoringFAISS, compress_index,
+    load_rescore_vectors, save_rescore_vectors,
+)
+
 # 对话历史管理类
 class ChatMessageHistory(BaseChatMessageHistory):
     """管理对话历史的简单实现"""
@@ -53,6 +74,15 @@ class ChatMessageHistory(BaseChatMessageHistory):
         """获取所有消息"""
         return self.messages
 
+# 父章节块在向量存储目录中的文件名
+PARENT_CHUNKS_FILENAME = "parent_chunks.json"
+# 索引清单: 记录建立索引时规则书内容的哈希和分块/Embedding配置，用于判断索引是否需要重建
+INDEX_MANIFEST_FILENAME = "index_manifest.json"
+# 索引数据文件 (启用共享索引段时在段目录中，否则在游戏目录中)
+INDEX_DATA_FILES = ("index.faiss", "index.pkl", PARENT_CHUNKS_FILENAME, RESCORE_VECTORS_FILENAME)
+# 文档块元数据格式版本，元数据内容变化 (例如增加页码) 时递增，使旧索引被重建
+INDEX_METADATA_VERSION = 2
+
 class LangchainManager:
     """管理Langchain组件、RAG和LLM交互"""
     
@@ -63,28 +93,63 @@ class LangchainManager:
         
         # 游戏RAG索引 {game_name: retriever_object}
         self.game_retrievers = {}
+
+        # 游戏规则书的父章节块 {game_name: {parent_id: Document}}，用于小块检索、大块返回
+        self.game_parent_chunks = {}
+
+        # 每个游戏的索引构建锁，避免后台重建和HTTP请求同时构建同一个索引
+        self._index_locks: Dict[str, threading.Lock] = {}
+        self._index_locks_guard = threading.Lock()
+
+        # 已加载的共享索引段 {segment_key: {"retriever", "parent_chunks", "games": 使用该段的游戏}}，
+        # 规则书相同的游戏共用同一个检索器和父章节块
+        self.loaded_segments: Dict[str, Dict[str, Any]] = {}
+        # 游戏所用的已加载段 {game_name: segment_key}
+        self.game_segments: Dict[str, str] = {}
+        self._segments_lock = threading.Lock()
         
         # 配置LLM和Embedding模型
         self.llm = self._initialize_llm()
+        self.condense_llm = self._initialize_condense_llm()
         self.embeddings = self._initialize_embeddings()
+        # 检索查询使用带缓存的Embedding，建立索引仍直接使用 self.embeddings
+        self.query_embeddings = self._initialize_query_embeddings()
+        self.reranker = create_reranker(
+            cfg.RERANKER,
+            cfg.RERANK_MODEL,
+            batch_size=cfg.RERANK_BATCH_SIZE,
+            cache_size=cfg.RERANK_CACHE_SIZE,
+        )
         
         # 确保向量存储目录存在
         os.makedirs(cfg.VECTOR_STORE_DIRECTORY, exist_ok=True)
     
     def _initialize_llm(self):
         """初始化LLM模型"""
-        if cfg.LLM_PROVIDER == "gemini":
+        return self._create_llm(cfg.LLM_PROVIDER)
+
+    def _initialize_condense_llm(self):
+        """初始化问题改写使用的独立模型，未配置时返回None (使用主LLM)"""
+        if not cfg.CONDENSE_LLM_MODEL:
+            return None
+        provider = cfg.CONDENSE_LLM_PROVIDER or cfg.LLM_PROVIDER
+        print(f"问题改写使用独立模型: {provider}/{cfg.CONDENSE_LLM_MODEL}")
+        return self._create_llm(provider, cfg.CONDENSE_LLM_MODEL)
+
+    def _create_llm(self, provider: str, model: Optional[str] = None):
+        """按提供商创建LLM，model为空时使用该提供商的默认模型配置"""
+        if provider == "gemini":
             try:
                 from langchain_google_genai import ChatGoogleGenerativeAI
                 llm = ChatGoogleGenerativeAI(
-                    model=cfg.GEMINI_MODEL,
+                    model=model or cfg.GEMINI_MODEL,
                     google_api_key=cfg.GEMINI_API_KEY,
                 )
                 return llm
             except ImportError:
                 print("未安装langchain_google_genai库，请使用pip install langchain-google-genai安装")
                 sys.exit(1)
-        elif cfg.LLM_PROVIDER == "ollama":
+        elif provider == "ollama":
             try:
                 from langchain_community.llms import Ollama
                 base_url = cfg.OLLAMA_BASE_URL
@@ -92,18 +157,24 @@ class LangchainManager:
                     base_url = "http://127.0.0.1:11434"
                     print(f"Ollama LLM: Changed base_url to {base_url} to avoid localhost resolution issues.")
                 llm = Ollama(
-                    model=cfg.OLLAMA_MODEL,
+                    model=model or cfg.OLLAMA_MODEL,
                     base_url=base_url,
                 )
                 return llm
             except ImportError:
                 print("未安装langchain_community库，请使用pip install langchain-community安装")
                 sys.exit(1)
-        elif cfg.LLM_PROVIDER == "openai":
+        elif provider == "fake":
+            from services.fake_providers import FakeRulebookLLM
+            return FakeRulebookLLM(
+                latency_ms=cfg.FAKE_LLM_LATENCY_MS,
+                per_token_latency_ms=cfg.FAKE_LLM_PER_TOKEN_LATENCY_MS,
+            )
+        elif provider == "openai":
             try:
                 from langchain_openai import ChatOpenAI
                 llm = ChatOpenAI(
-                    model=cfg.OPENAI_MODEL,
+                    model=model or cfg.OPENAI_MODEL,
                     api_key=cfg.OPENAI_API_KEY,
                 )
                 return llm
@@ -111,8 +182,12 @@ class LangchainManager:
                 print("未安装langchain_openai库，请使用pip install langchain-openai安装")
                 sys.exit(1)
         else:
-            raise ValueError(f"不支持的LLM提供商: {cfg.LLM_PROVIDER}")
+            raise ValueError(f"不支持的LLM提供商: {provider}")
     
+    def _retrieval_k(self) -> int:
+        """向量检索返回的块数: 启用重排序时取更多候选块"""
+        return max(cfg.RERANK_CANDIDATES, 1) if self.reranker is not None else 5
+
     def _initialize_embeddings(self):
         """初始化Embedding模型"""
         embedding_provider = cfg.EMBEDDING_PROVIDER
@@ -182,21 +257,64 @@ class LangchainManager:
             except ImportError:
                 print("未安装langchain_openai库，请使用pip install langchain-openai安装")
                 sys.exit(1)
+        elif embedding_provider == "fake":
+            from services.fake_providers import HashingEmbeddings
+            return HashingEmbeddings(latency_ms=cfg.FAKE_EMBEDDING_LATENCY_MS)
         elif embedding_provider == "sentence_transformers":
+            return self._create_sentence_transformer_embeddings()
+        elif embedding_provider == "service":
+            from services.embedding_service import EmbeddingServiceClient
             try:
-                from langchain_community.embeddings import HuggingFaceEmbeddings
-                embeddings = HuggingFaceEmbeddings(
-                    model_name=cfg.SENTENCE_TRANSFORMER_MODEL,
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True}
+                embeddings = EmbeddingServiceClient(
+                    cfg.EMBEDDING_SERVICE_SOCKET,
+                    connect_timeout=cfg.EMBEDDING_SERVICE_CONNECT_TIMEOUT,
                 )
-                return embeddings
-            except ImportError:
-                print("未安装sentence-transformers库，请使用pip install sentence-transformers安装")
+            except ConnectionError as e:
+                print(e)
                 sys.exit(1)
+            print(f"共享Embedding服务: {cfg.EMBEDDING_SERVICE_SOCKET} ({embeddings.served_model_key})")
+            return embeddings
         else:
             raise ValueError(f"不支持的Embedding提供商: {embedding_provider}")
     
+    def _create_sentence_transformer_embeddings(self):
+        """本地 sentence-transformers 模型 (torch / ONNX / int8量化后端)，缺少依赖时退出"""
+        from services.local_embeddings import create_sentence_transformer_embeddings
+        try:
+            embeddings = create_sentence_transformer_embeddings(
+                cfg.SENTENCE_TRANSFORMER_MODEL,
+                cfg.SENTENCE_TRANSFORMER_BACKEND,
+                cfg.ONNX_MODEL_DIRECTORY,
+                threads=cfg.EMBEDDING_THREADS,
+                max_batch_size=cfg.EMBEDDING_BATCH_SIZE,
+                max_batch_chars=cfg.EMBEDDING_MAX_BATCH_CHARS,
+                queue_size=cfg.EMBEDDING_QUEUE_SIZE,
+            )
+        except ImportError as e:
+            print(e)
+            sys.exit(1)
+        print(f"本地Embedding: {cfg.SENTENCE_TRANSFORMER_MODEL} ({cfg.SENTENCE_TRANSFORMER_BACKEND})")
+        return embeddings
+
+    def _initialize_query_embeddings(self):
+        """为检索查询包装LRU缓存和微批处理，QUERY_EMBEDDING_CACHE_SIZE<=0 时直接使用原Embedding"""
+        if cfg.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+            return self.embeddings
+        return CachedQueryEmbeddings(
+            self.embeddings,
+            cache_size=cfg.QUERY_EMBEDDING_CACHE_SIZE,
+            batch_window_ms=cfg.QUERY_EMBEDDING_BATCH_WINDOW_MS,
+        )
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """查询Embedding缓存和重排序分数缓存的命中统计"""
+        stats = {}
+        if isinstance(self.query_embeddings, CachedQueryEmbeddings):
+            stats["query_embedding"] = self.query_embeddings.stats()
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.stats()
+        return stats
+
     def load_or_get_retriever(self, game_name: str) -> Optional[Any]:
         """
         获取内存中的RAG检索器，如果不存在则尝试从磁盘加载。
@@ -212,19 +330,35 @@ class LangchainManager:
             return self.game_retrievers[cleaned_game_name]
         
         vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
+        segment = self._manifest_segment(cleaned_game_name)
+        if segment:
+            with self._segments_lock:
+                loaded = self.loaded_segments.get(segment)
+            if loaded is not None:
+                print(f"Retriever for '{cleaned_game_name}' shares loaded index segment {segment}.")
+                return self._use_loaded_segment(cleaned_game_name, segment, loaded["retriever"], loaded["parent_chunks"])
+            vector_store_path = self._segment_store().path(segment)
         if os.path.exists(vector_store_path):
             try:
                 print(f"Attempting to load retriever for '{cleaned_game_name}' from disk: {vector_store_path}")
                 vector_store = FAISS.load_local(
                     vector_store_path, 
-                    self.embeddings, 
+                    self.query_embeddings, 
                     allow_dangerous_deserialization=True
                 )
+                rescore_vectors = load_rescore_vectors(vector_store_path) if cfg.VECTOR_RESCORE_FACTOR > 0 else None
+                if rescore_vectors is not None:
+                    vector_store = RescoringFAISS.from_store(vector_store, rescore_vectors, cfg.VECTOR_RESCORE_FACTOR)
                 retriever = vector_store.as_retriever(
                     search_type="similarity",
-                    search_kwargs={"k": 5}
+                    search_kwargs={"k": self._retrieval_k()}
                 )
-                self.game_retrievers[cleaned_game_name] = retriever
+                parent_chunks = self._load_parent_chunks(vector_store_path)
+                if segment:
+                    retriever = self._use_loaded_segment(cleaned_game_name, segment, retriever, parent_chunks)
+                else:
+                    self.game_retrievers[cleaned_game_name] = retriever
+                    self.game_parent_chunks[cleaned_game_name] = parent_chunks
                 print(f"Successfully loaded retriever for '{cleaned_game_name}' from disk.")
                 return retriever
             except Exception as e:
@@ -234,46 +368,411 @@ class LangchainManager:
             print(f"No pre-built RAG index found on disk for game '{cleaned_game_name}' at {vector_store_path}")
             return None
 
-    def add_rulebook_text(self, file_path: str, game_name: str):
-        """从文件加载规则书文本并构建RAG索引"""
+    def index_size_bytes(self, game_name: str) -> int:
+        """
+        磁盘上索引文件的总大小，用作加载后内存占用的估计，索引不存在时返回0。
+        不包含精确重排序用的原始向量: 它以内存映射方式打开，只有用到的行会被读入内存。
+        """
+        vector_store_path = self._index_data_path(game_name)
+        if not os.path.isdir(vector_store_path):
+            return 0
+        return sum(
+            entry.stat().st_size for entry in os.scandir(vector_store_path)
+            if entry.is_file() and entry.name != RESCORE_VECTORS_FILENAME
+        )
+
+    def preload_retrievers(self, game_names: List[str], memory_budget_mb: float) -> List[str]:
+        """
+        按顺序预加载游戏的检索器，已加载和预计加载后的索引总大小不超过 memory_budget_mb (<=0 表示不限制)。
+        共用同一索引段的游戏只计算一次大小。
+        Returns:
+            本次加载的游戏列表
+        """
+        budget_bytes = memory_budget_mb * 1024 * 1024
+        used_bytes = 0
+        counted_paths = set()
+        for name in list(self.game_retrievers):
+            data_path = self._index_data_path(name)
+            if data_path not in counted_paths:
+                counted_paths.add(data_path)
+                used_bytes += self.index_size_bytes(name)
+        loaded = []
+        for game_name in game_names:
+            if game_name in self.game_retrievers:
+                continue
+            size = self.index_size_bytes(game_name)
+            if size == 0:
+                continue
+            data_path = self._index_data_path(game_name)
+            if data_path in counted_paths:
+                size = 0
+            if budget_bytes > 0 and used_bytes + size > budget_bytes:
+                print(f"预加载: '{game_name}' 的索引 ({size / 1024 / 1024:.1f} MB) 超出内存预算，停止预加载")
+                break
+            if self.load_or_get_retriever(game_name) is not None:
+                used_bytes += size
+                counted_paths.add(data_path)
+                loaded.append(game_name)
+        return loaded
+
+    def warm_up_embeddings(self) -> float:
+        """用一个示例查询预热Embedding模型 (加载权重、建立连接)，返回耗时 (秒)"""
+        started_at = time.perf_counter()
+        self.embeddings.embed_query("预热: 这个游戏的规则是什么？")
+        return time.perf_counter() - started_at
+
+    def _index_lock(self, game_name: str) -> threading.Lock:
+        with self._index_locks_guard:
+            return self._index_locks.setdefault(game_name, threading.Lock())
+
+    def _segment_store(self) -> SegmentStore:
+        return SegmentStore(cfg.VECTOR_STORE_DIRECTORY)
+
+    def _segment_lock(self, segment: str) -> threading.Lock:
+        return self._index_lock(f"{SEGMENTS_DIRNAME}/{segment}")
+
+    def _manifest_segment(self, game_name: str) -> Optional[str]:
+        """游戏的索引清单指向的共享索引段，未使用共享段时返回None"""
+        manifest = self._load_index_manifest(os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{game_name}"))
+        segment = (manifest or {}).get("segment")
+        return segment if isinstance(segment, str) and segment else None
+
+    def _index_data_path(self, game_name: str) -> str:
+        """游戏的索引数据所在目录: 共享索引段，或 (未使用共享段时) 游戏目录"""
+        segment = self._manifest_segment(game_name)
+        if segment:
+            return self._segment_store().path(segment)
+        return os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{game_name}")
+
+    def _use_loaded_segment(self, game_name: str, segment: str, retriever: Any,
+                            parent_chunks: Dict[str, Document]) -> Any:
+        """让游戏使用已加载的段; 段已被其他游戏加载时使用那一份，返回游戏的检索器"""
+        with self._segments_lock:
+            loaded = self.loaded_segments.setdefault(
+                segment, {"retriever": retriever, "parent_chunks": parent_chunks, "games": set()}
+            )
+            loaded["games"].add(game_name)
+            self.game_segments[game_name] = segment
+        self.game_retrievers[game_name] = loaded["retriever"]
+        self.game_parent_chunks[game_name] = loaded["parent_chunks"]
+        return loaded["retriever"]
+
+    def _forget_loaded_index(self, game_name: str):
+        """从内存中移除游戏的检索器，已加载的段没有游戏使用时一并释放"""
+        self.game_retrievers.pop(game_name, None)
+        self.game_parent_chunks.pop(game_name, None)
+        with self._segments_lock:
+            segment = self.game_segments.pop(game_name, None)
+            loaded = self.loaded_segments.get(segment) if segment else None
+            if loaded is not None:
+                loaded["games"].discard(game_name)
+                if not loaded["games"]:
+                    del self.loaded_segments[segment]
+
+    def _link_segment(self, game_name: str, segment: str, manifest: Dict[str, Any]):
+        """登记游戏对段的引用，游戏目录中只保留指向该段的索引清单"""
+        vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{game_name}")
+        self._segment_store().add_ref(segment, game_name)
+        os.makedirs(vector_store_path, exist_ok=True)
+        # 之前未使用共享段时留在游戏目录中的索引文件
+        for name in INDEX_DATA_FILES:
+            path = os.path.join(vector_store_path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self._save_index_manifest(vector_store_path, {**manifest, "segment": segment})
+
+    def _release_segment(self, game_name: str, segment: str):
+        """删除游戏对段的引用，最后一个引用被删除时删除段"""
+        with self._segment_lock(segment):
+            if self._segment_store().release(segment, game_name):
+                print(f"索引段 {segment} 已不再被任何游戏使用，已删除")
+
+    def _index_fingerprint(self, file_path: str, rulebook_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        规则书内容哈希和影响索引结果的配置，任何一项变化都需要重建索引。
+        不包含文件路径: 规则书文件改名或移动后内容不变时不必重建。
+        """
+        with open(file_path, 'rb') as f:
+            content_sha256 = hashlib.sha256(f.read()).hexdigest()
+        compression = self._vector_compression()
+        return {
+            "content_sha256": content_sha256,
+            "embedding_model": embedding_model_key(self.embeddings),
+            "chunking_strategy": cfg.CHUNKING_STRATEGY,
+            "chunk_size": cfg.CHUNK_SIZE,
+            "parent_chunk_size": cfg.PARENT_CHUNK_SIZE,
+            "metadata_version": INDEX_METADATA_VERSION,
+            "rulebook_id": rulebook_id,
+            "vector_compression": compression,
+            "pq_subquantizers": cfg.PQ_SUBQUANTIZERS if compression == "pq" else 0,
+            "vector_rescore": compression != "none" and cfg.VECTOR_RESCORE_FACTOR > 0,
+        }
+
+    def _vector_compression(self) -> str:
+        """配置的向量压缩方式，无效的取值按 none 处理"""
+        if cfg.VECTOR_COMPRESSION not in COMPRESSION_MODES:
+            print(f"警告: 不支持的向量压缩方式 '{cfg.VECTOR_COMPRESSION}' (可选: {', '.join(COMPRESSION_MODES)})，不压缩")
+            return "none"
+        return cfg.VECTOR_COMPRESSION
+
+    def _compress_vector_store(self, vector_store: FAISS, vector_store_path: str, compression: str) -> FAISS:
+        """
+        按配置压缩新建向量存储的索引。启用精确重排序时先把原始向量保存到索引目录，
+        返回在压缩索引上重排序的向量存储；否则删除之前保存的原始向量。
+        """
+        rescore = compression != "none" and cfg.VECTOR_RESCORE_FACTOR > 0
+        rescore_path = os.path.join(vector_store_path, RESCORE_VECTORS_FILENAME)
+        if rescore:
+            save_rescore_vectors(vector_store.index, vector_store_path)
+        elif os.path.exists(rescore_path):
+            os.remove(rescore_path)
+        if compression == "none":
+            return vector_store
+
+        vector_store.index, used = compress_index(vector_store.index, compression, cfg.PQ_SUBQUANTIZERS)
+        print(f"向量索引已压缩: {used}")
+        if not rescore:
+            return vector_store
+        return RescoringFAISS.from_store(
+            vector_store, load_rescore_vectors(vector_store_path), cfg.VECTOR_RESCORE_FACTOR
+        )
+
+    def _load_index_manifest(self, vector_store_path: str) -> Optional[Dict[str, Any]]:
+        manifest_path = os.path.join(vector_store_path, INDEX_MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"警告: 索引清单 {manifest_path} 解析失败: {e}")
+            return None
+
+    def is_index_current(self, file_path: str, game_name: str, rulebook_id: Optional[str] = None) -> bool:
+        """磁盘上的索引是否由该文件的当前内容、以当前配置建立"""
+        cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
+        vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
+        manifest = self._load_index_manifest(vector_store_path)
+        if not manifest or not os.path.exists(os.path.join(self._index_data_path(cleaned_game_name), "index.faiss")):
+            return False
+        fingerprint = self._index_fingerprint(file_path, rulebook_id)
+        return all(manifest.get(key) == value for key, value in fingerprint.items())
+
+    def add_rulebook_text(self, file_path: str, game_name: str, skip_if_unchanged: bool = False,
+                          rulebook_id: Optional[str] = None) -> bool:
+        """
+        从文件加载规则书文本并构建RAG索引
+        Args:
+            skip_if_unchanged: 为True时，如果磁盘上的索引已由相同内容和配置建立，则跳过重建
+            rulebook_id: 规则书的显示编号，记录在每个文档块的元数据中，用于回答的出处
+        Returns:
+            是否重建了索引
+        """
         
         # 确保 game_name 用于路径时是干净的
         cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
+        with self._index_lock(cleaned_game_name):
+            if skip_if_unchanged and self.is_index_current(file_path, cleaned_game_name, rulebook_id):
+                print(f"游戏 '{cleaned_game_name}' 的规则书内容未变化，跳过重建索引")
+                return False
+            self._build_rulebook_index(file_path, cleaned_game_name, rulebook_id)
+            return True
+
+    def _build_rulebook_index(self, file_path: str, cleaned_game_name: str, rulebook_id: Optional[str] = None):
+        trace = RequestTrace("index_rulebook")
+        # 先计算内容哈希再读取文本: 读取期间文件被修改时，清单中的旧哈希会让下次检查触发重建
+        fingerprint = self._index_fingerprint(file_path, rulebook_id)
+        previous_segment = self._manifest_segment(cleaned_game_name)
+        vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
+        os.makedirs(vector_store_path, exist_ok=True)
+
+        if cfg.SHARED_INDEX_SEGMENTS:
+            segment = segment_key(fingerprint)
+            self._build_segment(file_path, cleaned_game_name, rulebook_id, fingerprint, segment, trace)
+        else:
+            segment = None
+            vector_store, parent_chunks = self._create_index_files(
+                file_path, rulebook_id, fingerprint, vector_store_path, trace
+            )
+            # 之后的检索查询走缓存
+            vector_store.embedding_function = self.query_embeddings
+            
+            # 更新游戏检索器
+            self._forget_loaded_index(cleaned_game_name)
+            self.game_retrievers[cleaned_game_name] = vector_store.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": self._retrieval_k()}
+            )
+            self.game_parent_chunks[cleaned_game_name] = {
+                doc.metadata["parent_id"]: doc for doc in parent_chunks
+            }
+        if previous_segment and previous_segment != segment:
+            self._release_segment(cleaned_game_name, previous_segment)
+        
+        print(f"已为游戏 '{cleaned_game_name}' 创建/更新RAG索引")
+        print(f"索引计时 {trace.summary()}")
+        METRICS.observe_trace(trace)
 
+    def _build_segment(self, file_path: str, cleaned_game_name: str, rulebook_id: Optional[str],
+                       fingerprint: Dict[str, Any], segment: str, trace: RequestTrace):
+        """使用共享索引段: 相同内容和配置的段已存在时直接引用，否则建立新段"""
+        store = self._segment_store()
+        with self._segment_lock(segment):
+            if store.exists(segment):
+                print(f"游戏 '{cleaned_game_name}' 的规则书与已有索引段 {segment} 相同，共用该段，不重新计算Embedding")
+                trace.set("shared_segment", True)
+            else:
+                staging_path = store.staging_path()
+                try:
+                    # 只写入临时目录，不保留返回的向量存储: 之后从段目录加载
+                    # (原始向量以内存映射打开时，Windows上无法改名其所在的目录)
+                    self._create_index_files(file_path, rulebook_id, fingerprint, staging_path, trace)
+                    store.install(segment, staging_path)
+                except BaseException:
+                    shutil.rmtree(staging_path, ignore_errors=True)
+                    raise
+            segment_manifest = self._load_index_manifest(store.path(segment)) or {}
+            self._link_segment(cleaned_game_name, segment, {
+                **segment_manifest,
+                "source_path": os.path.abspath(file_path),
+                "built_at": time.time(),
+            })
+        self._forget_loaded_index(cleaned_game_name)
+        self.load_or_get_retriever(cleaned_game_name)
+
+    def _create_index_files(self, file_path: str, rulebook_id: Optional[str], fingerprint: Dict[str, Any],
+                            vector_store_path: str, trace: RequestTrace) -> Tuple[FAISS, List[Document]]:
+        """加载、分割规则书，计算Embedding并把索引和清单保存到 vector_store_path，返回 (向量存储, 父章节块)"""
         # 加载文本
-        loader = TextLoader(file_path, encoding='utf-8')
-        documents = loader.load()
+        with trace.span("load"):
+            loader = TextLoader(file_path, encoding='utf-8')
+            documents = loader.load()
+            if rulebook_id:
+                for document in documents:
+                    document.metadata["rulebook_id"] = rulebook_id
         
         # 文本分割
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-        splits = text_splitter.split_documents(documents)
-        
-        # 创建向量存储
-        vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
-        os.makedirs(vector_store_path, exist_ok=True)
+        with trace.span("split"):
+            splits, parent_chunks = self._split_rulebook(documents)
+        trace.set("chunks", len(splits))
         
         # 创建或更新FAISS索引
-        vector_store = FAISS.from_documents(
-            documents=splits,
-            embedding=self.embeddings,
-        )
+        with trace.span("embed"):
+            vector_store = FAISS.from_documents(
+                documents=splits,
+                embedding=self.embeddings,
+            )
+        with trace.span("compress"):
+            vector_store = self._compress_vector_store(vector_store, vector_store_path, fingerprint["vector_compression"])
         
         # 保存到磁盘
-        vector_store.save_local(vector_store_path)
-        
-        # 更新游戏检索器
-        self.game_retrievers[cleaned_game_name] = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
-        
-        print(f"已为游戏 '{cleaned_game_name}' 创建/更新RAG索引")
+        with trace.span("save"):
+            vector_store.save_local(vector_store_path)
+            self._save_parent_chunks(vector_store_path, parent_chunks)
+            self._save_index_manifest(vector_store_path, {
+                **fingerprint,
+                "source_path": os.path.abspath(file_path),
+                "chunks": len(splits),
+                "built_at": time.time(),
+            })
+        return vector_store, parent_chunks
+
+    def install_index_directory(self, game_name: str, index_dir: str, fingerprint: Dict[str, Any],
+                                manifest: Dict[str, Any]):
+        """
+        把在别处建立好的索引目录 (例如导入的索引包) 安装为游戏的索引，不重新计算Embedding。
+        index_dir 须与 VECTOR_STORE_DIRECTORY 在同一文件系统上，安装后被移走或删除。
+        Args:
+            fingerprint: 索引的指纹 (见 _index_fingerprint)，用于确定共享索引段
+            manifest: 写入游戏目录的索引清单
+        """
+        cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
+        vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
+        manifest = {key: value for key, value in manifest.items() if key != "segment"}
+        with self._index_lock(cleaned_game_name):
+            previous_segment = self._manifest_segment(cleaned_game_name)
+            self._forget_loaded_index(cleaned_game_name)
+            segment = None
+            if cfg.SHARED_INDEX_SEGMENTS:
+                segment = segment_key(fingerprint)
+                store = self._segment_store()
+                self._save_index_manifest(index_dir, manifest)
+                with self._segment_lock(segment):
+                    if store.exists(segment):
+                        shutil.rmtree(index_dir, ignore_errors=True)
+                    else:
+                        store.install(segment, index_dir)
+                    self._link_segment(cleaned_game_name, segment, manifest)
+            else:
+                self._save_index_manifest(index_dir, manifest)
+                previous_dir = f"{index_dir}.previous"
+                if os.path.exists(vector_store_path):
+                    os.replace(vector_store_path, previous_dir)
+                os.replace(index_dir, vector_store_path)
+                shutil.rmtree(previous_dir, ignore_errors=True)
+            if previous_segment and previous_segment != segment:
+                self._release_segment(cleaned_game_name, previous_segment)
     
-    def _get_or_create_memory(self, game_name: str, player_id: str) -> ConversationBufferWindowMemory:
+    def _split_rulebook(self, documents: List[Document]) -> Tuple[List[Document], List[Document]]:
+        """
+        按配置的策略分割规则书文档。
+        Returns:
+            (用于建立向量索引的块, 父章节块 (仅 markdown 分块))
+        """
+        if cfg.CHUNKING_STRATEGY == "markdown":
+            splitter = MarkdownSectionSplitter(
+                chunk_size=cfg.CHUNK_SIZE,
+                parent_chunk_size=cfg.PARENT_CHUNK_SIZE,
+            )
+            return splitter.split_documents(documents)
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            length_function=len,
+            add_start_index=True,  # 记录块在原文中的位置，供上下文构建时合并重叠块
+        )
+        splits = []
+        for document in documents:
+            document_splits = text_splitter.split_documents([document])
+            annotate_pages(document_splits, document.page_content)
+            splits.extend(document_splits)
+        return splits, []
+
+    def _save_index_manifest(self, vector_store_path: str, manifest: Dict[str, Any]):
+        with open(os.path.join(vector_store_path, INDEX_MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def _save_parent_chunks(self, vector_store_path: str, parent_chunks: List[Document]):
+        """将父章节块保存到向量存储目录"""
+        parents_path = os.path.join(vector_store_path, PARENT_CHUNKS_FILENAME)
+        if not parent_chunks:
+            if os.path.exists(parents_path):
+                os.remove(parents_path)
+            return
+        with open(parents_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in parent_chunks],
+                f, ensure_ascii=False
+            )
+
+    def _load_parent_chunks(self, vector_store_path: str) -> Dict[str, Document]:
+        """从向量存储目录加载父章节块，不存在时返回空字典"""
+        parents_path = os.path.join(vector_store_path, PARENT_CHUNKS_FILENAME)
+        if not os.path.exists(parents_path):
+            return {}
+        try:
+            with open(parents_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            return {
+                item["metadata"]["parent_id"]: Document(page_content=item["page_content"], metadata=item["metadata"])
+                for item in items
+            }
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"警告: 父章节块文件 {parents_path} 解析失败: {e}")
+            return {}
+
+    def _get_or_create_memory(self, game_name: str, player_id: str) -> BaseChatMemory:
         """获取或创建玩家的对话记忆"""
         cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
         # 如果游戏会话不存在，创建一个
@@ -283,25 +782,68 @@ class LangchainManager:
         # 如果玩家会话不存在，创建一个
         if player_id not in self.game_sessions[cleaned_game_name]:
             message_history = ChatMessageHistory()
-            # 使用新版本的API创建记忆对象
-            memory = ConversationBufferWindowMemory(
-                chat_memory=message_history,
-                return_messages=True,
-                memory_key="chat_history",
-                k=5  # 保留最近5轮对话
-            )
+            if cfg.HISTORY_MEMORY_MODE == "summary":
+                # 最近几轮原文 + 较早对话的滚动摘要，摘要在后台更新
+                memory = RollingSummaryMemory(
+                    chat_memory=message_history,
+                    return_messages=True,
+                    memory_key="chat_history",
+                    output_key="answer",
+                    recent_turns=cfg.HISTORY_SUMMARY_RECENT_TURNS,
+                    max_summary_tokens=cfg.HISTORY_SUMMARY_MAX_TOKENS,
+                    summarizer=self.condense_llm or self.llm,
+                )
+            elif cfg.HISTORY_TOKEN_BUDGET > 0:
+                # 按token预算截取最近的对话
+                memory = TokenBudgetMemory(
+                    chat_memory=message_history,
+                    return_messages=True,
+                    memory_key="chat_history",
+                    output_key="answer",
+                    max_token_limit=cfg.HISTORY_TOKEN_BUDGET,
+                )
+            else:
+                # 使用新版本的API创建记忆对象
+                memory = ConversationBufferWindowMemory(
+                    chat_memory=message_history,
+                    return_messages=True,
+                    memory_key="chat_history",
+                    output_key="answer",
+                    k=5  # 保留最近5轮对话
+                )
             self.game_sessions[cleaned_game_name][player_id] = memory
         
         return self.game_sessions[cleaned_game_name][player_id]
     
-    def get_answer(self, question: str, game_name: str, player_id: str) -> str:
-        """获取LLM的回答"""
+    def get_answer(self, question: str, game_name: str, player_id: str,
+                   trace: Optional[RequestTrace] = None) -> str:
+        """
+        获取LLM的回答
+        Args:
+            trace: 调用方的请求计时 (例如还要记录JSON序列化耗时的HTTP处理函数)。
+                   未提供时自行创建，并在返回前汇总到运行指标。
+        """
+        answer, _ = self.get_answer_with_citations(question, game_name, player_id, trace=trace)
+        return answer
+
+    def get_answer_with_citations(self, question: str, game_name: str, player_id: str,
+                                  trace: Optional[RequestTrace] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        获取LLM的回答及其所依据的规则书出处
+        Returns:
+            (回答, 出处列表 (见 citations.collect_citations，未启用 ANSWER_CITATIONS 时为空))
+        """
         cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
+        owns_trace = trace is None
+        if owns_trace:
+            trace = RequestTrace("ask")
         
         memory = self._get_or_create_memory(cleaned_game_name, player_id)
-        retriever = self.load_or_get_retriever(cleaned_game_name)
+        with trace.span("retriever_load"):
+            retriever = self.load_or_get_retriever(cleaned_game_name)
 
         raw_answer = "" 
+        citations: List[Dict[str, Any]] = []
 
         if retriever:
             try:
@@ -320,23 +862,69 @@ class LangchainManager:
                     current_combine_docs_chain_kwargs["prompt"] = qa_prompt
                     print("Using custom qa_prompt for combine_docs_chain.")
 
+                # 决定是否需要调用LLM改写问题：链只在 get_chat_history 返回非空文本时才改写。
+                # 按链实际看到的历史判断: 滚动摘要模式下较早的对话已移入摘要，不在 chat_memory 中
+                should_condense, condense_path = decide_condense(
+                    question, memory.buffer_as_messages, cfg.CONDENSE_QUESTION_MODE
+                )
+                if should_condense and self.condense_llm is not None:
+                    condense_path = f"{condense_path}_fast_model"
+                trace.set("condense_path", condense_path)
+
+                # 重排序、合并重叠块并按token预算裁剪上下文
+                pipeline_retriever = PipelineRetriever(
+                    base_retriever=retriever,
+                    context_token_budget=cfg.CONTEXT_TOKEN_BUDGET,
+                    parent_chunks=(
+                        self.game_parent_chunks.get(cleaned_game_name)
+                        if cfg.SMALL_TO_BIG_RETRIEVAL else None
+                    ),
+                    reranker=self.reranker,
+                    rerank_top_n=cfg.RERANK_TOP_N,
+                )
+                # 改写期间用原问题预先检索，与改写的LLM调用并行
+                speculation = None
+                if should_condense and cfg.SPECULATIVE_RETRIEVAL:
+                    speculation = SpeculativeRetrieval(
+                        question,
+                        pipeline_retriever.retrieve_candidates,
+                        pipeline_retriever.build_context_docs,
+                        cfg.SPECULATIVE_RETRIEVAL_MIN_OVERLAP,
+                    ).start()
+                    pipeline_retriever.speculation = speculation
+
                 chain_args = {
                     "llm": self.llm,
-                    "retriever": retriever,
+                    "retriever": pipeline_retriever,
                     "memory": memory,
                     "verbose": cfg.DEBUG,
-                    "return_source_documents": False,
+                    "return_source_documents": cfg.ANSWER_CITATIONS,
+                    "get_chat_history": (
+                        lambda history: format_chat_history(history) if should_condense else ""
+                    ),
                 }
                 if condense_question_prompt_obj: 
                     chain_args["condense_question_prompt"] = condense_question_prompt_obj
                 
+                if self.condense_llm is not None:
+                    chain_args["condense_question_llm"] = self.condense_llm
+
                 if current_combine_docs_chain_kwargs: 
                     chain_args["combine_docs_chain_kwargs"] = current_combine_docs_chain_kwargs
 
                 qa_chain = ConversationalRetrievalChain.from_llm(**chain_args)
                 
-                response = qa_chain.invoke({"question": question})
+                response = qa_chain.invoke(
+                    {"question": question},
+                    config={"callbacks": [TraceCallbackHandler(trace)]},
+                )
+                if speculation is not None and speculation.result:
+                    trace.record("speculative_retrieval", speculation.seconds)
+                    trace.set("speculative_retrieval", speculation.result)
+                    if speculation.overlap is not None:
+                        trace.set("speculative_overlap", round(speculation.overlap, 2))
                 raw_answer = response.get("answer", "无法生成回答")
+                citations = collect_citations(response.get("source_documents") or [], cfg.ANSWER_CITATIONS_MAX)
             except Exception as e:
                 print(f"处理问题时出错: {str(e)}")
                 raw_answer = f"抱歉，处理您的问题时发生了内部错误: {str(e)}"
@@ -345,12 +933,18 @@ class LangchainManager:
             raw_answer = "抱歉，当前游戏没有可用的规则书RAG索引，无法回答关于规则的问题。您可以尝试使用 `tc rulebook refresh_cache` 来加载规则书。"
 
         # 清理回答中的 <think>...</think> 标签
-        if isinstance(raw_answer, str):
-            cleaned_answer = re.sub(r"<think>.*?</think>\n?", "", raw_answer, flags=re.DOTALL).strip()
-        else:
-            cleaned_answer = str(raw_answer).strip() if raw_answer is not None else ""
+        with trace.span("think_strip"):
+            if isinstance(raw_answer, str):
+                cleaned_answer = re.sub(r"<think>.*?</think>\n?", "", raw_answer, flags=re.DOTALL).strip()
+            else:
+                cleaned_answer = str(raw_answer).strip() if raw_answer is not None else ""
 
-        return cleaned_answer if cleaned_answer else "抱歉，我无法生成回答。"
+        print(f"请求计时 {trace.summary()}")
+        if owns_trace:
+            METRICS.observe_trace(trace)
+        if not cleaned_answer:
+            return "抱歉，我无法生成回答。", []
+        return cleaned_answer, citations
     
     def reset_conversation(self, game_name: str, player_id: str):
         """重置特定玩家的对话记忆"""
@@ -359,6 +953,10 @@ class LangchainManager:
             self.game_sessions[cleaned_game_name][player_id].clear()
             print(f"已重置玩家 {player_id} 在游戏 '{cleaned_game_name}' 的对话记忆")
     
+    def session_count(self) -> int:
+        """当前所有游戏中的玩家会话数"""
+        return sum(len(sessions) for sessions in list(self.game_sessions.values()))
+
     def clear_game_state(self, game_name: str):
         """清除特定游戏的所有会话记忆和RAG索引"""
         cleaned_game_name = game_name.strip() if isinstance(game_name, str) else game_name
@@ -366,8 +964,11 @@ class LangchainManager:
             del self.game_sessions[cleaned_game_name]
             print(f"已清除游戏 '{cleaned_game_name}' 的所有会话记忆")
         
-        if cleaned_game_name in self.game_retrievers:
-            del self.game_retrievers[cleaned_game_name]
+        was_loaded = cleaned_game_name in self.game_retrievers
+        # 与其他游戏共用的索引段在没有游戏使用后才从内存中释放
+        self._forget_loaded_index(cleaned_game_name)
+        if was_loaded:
+            segment = self._manifest_segment(cleaned_game_name)
             # 物理删除磁盘上的向量存储
             vector_store_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, f"{cleaned_game_name}")
             if os.path.exists(vector_store_path):
@@ -376,4 +977,7 @@ class LangchainManager:
                     print(f"已删除磁盘上的向量存储: {vector_store_path}")
                 except Exception as e:
                     print(f"删除向量存储 {vector_store_path} 失败: {e}")
+            # 共享索引段按引用计数删除: 仍被其他游戏引用时保留
+            if segment:
+                self._release_segment(cleaned_game_name, segment)
             print(f"已清除游戏 '{cleaned_game_name}' 的RAG索引") 
\ No newline at end of file
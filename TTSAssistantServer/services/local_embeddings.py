@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 本地CPU Embedding引擎
+sentence_transformers 提供商的优化后端 (SENTENCE_TRANSFORMER_BACKEND):
+    - onnx / onnx_int8: 导出为ONNX模型 (可动态量化为int8)，用 onnxruntime 推理
+    - torch_int8: 对 SentenceTransformer 模型的线性层做动态int8量化
+所有后端共用一个推理线程: 调用方把文本放入有界队列 (队列满时等待)，推理线程合并队列中的文本，
+按长度排序后分批计算，减少填充浪费; 推理使用的线程数由 EMBEDDING_THREADS 控制。
+"""
+
+import os
+import queue
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+LOCAL_BACKENDS = ("onnx", "onnx_int8", "torch_int8")
+SENTENCE_TRANSFORMER_BACKENDS = ("torch",) + LOCAL_BACKENDS
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_INT8_MODEL_FILENAME = "model_int8.onnx"
+
+# 推理线程每次最多从队列中取出的批数，取出的文本一起按长度排序
+LOOKAHEAD_BATCHES = 4
+
+
+def default_thread_count() -> int:
+    return os.cpu_count() or 1
+
+
+def hub_model_id(model_name: str) -> str:
+    """SentenceTransformer 的短模型名 (例如 all-MiniLM-L6-v2) 对应的 Hugging Face 模型ID"""
+    if "/" in model_name or os.path.isdir(model_name):
+        return model_name
+    return f"sentence-transformers/{model_name}"
+
+
+class _Request:
+    """一次 embed 调用，推理线程按位置填入向量"""
+
+    def __init__(self, count: int):
+        self.vectors: List[Optional[List[float]]] = [None] * count
+        self.remaining = count
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class EmbeddingBatcher:
+    """
+    有界队列 + 单个推理线程的动态批处理器。
+    并发调用的文本 (例如建立索引的文档块和检索查询) 在推理线程中合并、按长度排序后分批交给 encode。
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32,
+                 max_batch_chars: int = 16000, queue_size: int = 256):
+        """
+        Args:
+            encode: 计算一批文本的向量，返回形状为 (len(texts), 维度) 的数组
+            max_batch_size: 每批最多的文本数
+            max_batch_chars: 每批的最大字符数 (按批内最长文本的长度 × 文本数计算，即填充后的大小)
+            queue_size: 等待推理的文本数上限，队列满时调用方阻塞
+        """
+        self.encode = encode
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_chars = max(1, max_batch_chars)
+        self._queue: "queue.Queue[Optional[Tuple[str, _Request, int]]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        request = _Request(len(texts))
+        for position, text in enumerate(texts):
+            self._queue.put((text, request, position))
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def close(self):
+        """处理完已排队的文本后停止推理线程"""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _batches(self, items: List[Tuple[str, _Request, int]]) -> List[List[Tuple[str, _Request, int]]]:
+        """按长度升序分批: 达到条数上限或填充后的字符数超出预算时开始新的一批"""
+        items.sort(key=lambda item: len(item[0]))
+        batches, current = [], []
+        for item in items:
+            padded_chars = (len(current) + 1) * len(item[0])
+            if current and (len(current) >= self.max_batch_size or padded_chars > self.max_batch_chars):
+                batches.append(current)
+                current = []
+            current.append(item)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            while len(items) < self.max_batch_size * LOOKAHEAD_BATCHES:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                items.append(item)
+            for batch in self._batches(items):
+                self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[Tuple[str, _Request, int]]):
+        try:
+            vectors = self.encode([text for text, _, _ in batch])
+            error = None
+        except Exception as e:
+            vectors, error = None, e
+        for row, (_, request, position) in enumerate(batch):
+            if error is not None:
+                request.error = error
+            else:
+                request.vectors[position] = vectors[row].tolist()
+            request.remaining -= 1
+            if request.remaining == 0:
+                request.done.set()
+
+
+def _mean_pool(hidden_states: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[:, :, None].astype(np.float32)
+    return (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def export_onnx_model(model_name: str, cache_dir: str) -> str:
+    """把模型导出为ONNX (含 tokenizer.json) 保存到 cache_dir 下，已导出时直接返回目录"""
+    model_dir = os.path.join(cache_dir, hub_model_id(model_name).replace("/", "--"))
+    if os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILENAME)):
+        return model_dir
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise ImportError("未安装optimum库，请使用pip install optimum[onnxruntime]安装")
+    print(f"正在将Embedding模型 {model_name} 导出为ONNX: {model_dir}")
+    model = ORTModelForFeatureExtraction.from_pretrained(hub_model_id(model_name), export=True)
+    model.save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(hub_model_id(model_name)).save_pretrained(model_dir)
+    return model_dir
+
+
+def quantize_onnx_model(model_dir: str) -> str:
+    """对导出的ONNX模型做动态int8量化 (只量化权重)，已量化时直接返回路径"""
+    quantized_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILENAME)
+    if os.path.exists(quantized_path):
+        return quantized_path
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise ImportError("未安装onnxruntime库，请使用pip install onnxruntime安装")
+    print(f"正在将ONNX模型量化为int8: {quantized_path}")
+    quantize_dynamic(os.path.join(model_dir, ONNX_MODEL_FILENAME), quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+class OnnxEncoder:
+    """onnxruntime 推理: 批内填充到最长文本，对最后一层隐藏状态做平均池化并归一化 (与 normalize_embeddings=True 一致)"""
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = False, threads: int = 0,
+                 max_length: int = 256):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("未安装onnxruntime库，请使用pip install onnxruntime安装")
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("未安装tokenizers库，请使用pip install tokenizers安装")
+
+        model_dir = export_onnx_model(model_name, cache_dir)
+        model_path = quantize_onnx_model(model_dir) if quantize else os.path.join(model_dir, ONNX_MODEL_FILENAME)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads if threads > 0 else default_thread_count()
+        # 只有一个推理线程调用，不需要算子间并行
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        if self.tokenizer.padding is None:
+            self.tokenizer.enable_padding()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        outputs = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})
+        hidden_states = outputs[0]
+        pooled = _mean_pool(hidden_states, attention_mask) if hidden_states.ndim == 3 else hidden_states
+        return _normalize(pooled.astype(np.float32))
+
+
+class QuantizedTorchEncoder:
+    """SentenceTransformer 模型，线性层动态量化为int8"""
+
+    def __init__(self, model_name: str, threads: int = 0):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("未安装sentence-transformers库，请使用pip install sentence-transformers安装")
+        torch.set_num_threads(threads if threads > 0 else default_thread_count())
+        model = SentenceTransformer(model_name, device="cpu")
+        self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+        )
+
+
+class LocalEmbeddings(Embeddings):
+    """通过 EmbeddingBatcher 调用本地编码器的Embedding，查询和文档使用相同的编码"""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], model_name: str, max_batch_size: int = 32,
+                 max_batch_chars: int = 16000, queue_size: int = 256):
+        # 应包含后端名: 不同后端 (量化与否) 的向量不完全相同，切换后端需要重建索引
+        self.model_name = model_name
+        self.batcher = EmbeddingBatcher(encode, max_batch_size, max_batch_chars, queue_size)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.batcher.embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed([text])[0]
+
+
+def create_local_embeddings(model_name: str, backend: str, cache_dir: str, threads: int = 0,
+                            max_batch_size: int = 32, max_batch_chars: int = 16000,
+                            queue_size: int = 256) -> LocalEmbeddings:
+    """按后端名创建本地Embedding，backend 为 LOCAL_BACKENDS 之一"""
+    if backend in ("onnx", "onnx_int8"):
+        encoder = OnnxEncoder(model_name, cache_dir, quantize=backend == "onnx_int8", threads=threads)
+    elif backend == "torch_int8":
+        encoder = QuantizedTorchEncoder(model_name, threads=threads)
+    else:
+        raise ValueError(f"不支持的本地Embedding后端: {backend} (可选: {', '.join(LOCAL_BACKENDS)})")
+    return LocalEmbeddings(encoder.encode, f"{model_name}:{backend}", max_batch_size, max_batch_chars, queue_size)
+
+
+def create_sentence_transformer_embeddings(model_name: str, backend: str, cache_dir: str, threads: int = 0,
+                                           max_batch_size: int = 32, max_batch_chars: int = 16000,
+                                           queue_size: int = 256) -> Embeddings:
+    """sentence_transformers 提供商的Embedding: torch 后端为 HuggingFaceEmbeddings，其余见 create_local_embeddings"""
+    if backend != "torch":
+        return create_local_embeddings(model_name, backend, cache_dir, threads, max_batch_size, max_batch_chars,
+                                       queue_size)
+    try:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    except ImportError:
+        raise ImportError("未安装sentence-transformers库，请使用pip install sentence-transformers安装")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - Markdown规则书分块
+按标题结构切分规则书，保留章节路径 (例如 "准备阶段 > 选牌") 作为元数据，
+表格和列表尽量保持完整，并为小块检索、大块返回 (small-to-big) 生成父章节块
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from services.citations import PageIndex, set_page_metadata
+
+# 章节路径分隔符
+SECTION_PATH_SEPARATOR = " > "
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+_LIST_ITEM_PATTERN = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+")
+_TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_COMMENT_PATTERN = re.compile(r"^\s*<!--.*?-->\s*$", re.DOTALL)
+_SENTENCE_PATTERN = re.compile(r".+?(?:[。！？；!?;]+|\.(?=\s)|$)\s*", re.DOTALL)
+
+
+class _Block:
+    """Markdown中不可再分的结构块: heading / paragraph / list / table / code / comment (例如页码标记)"""
+
+    def __init__(self, kind: str, text: str, start: int, level: int = 0, title: str = ""):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.level = level
+        self.title = title
+
+
+class _Section:
+    """一个标题及其下直到下一个标题之前的内容"""
+
+    def __init__(self, path: List[str], start: int):
+        self.path = path
+        self.start = start
+        self.blocks: List[_Block] = []
+
+    @property
+    def path_text(self) -> str:
+        return SECTION_PATH_SEPARATOR.join(self.path)
+
+    @property
+    def has_body(self) -> bool:
+        return any(block.kind not in ("heading", "comment") for block in self.blocks)
+
+
+def _parse_blocks(text: str) -> List[_Block]:
+    """将Markdown文本解析为结构块列表，记录每块在原文中的起始位置"""
+    lines = text.splitlines(keepends=True)
+    offsets = []
+    position = 0
+    for line in lines:
+        offsets.append(position)
+        position += len(line)
+
+    blocks: List[_Block] = []
+    i = 0
+    n = len(lines)
+
+    def is_blank(index: int) -> bool:
+        return not lines[index].strip()
+
+    def starts_other_block(index: int) -> bool:
+        line = lines[index]
+        return bool(
+            _HEADING_PATTERN.match(line.rstrip("\n"))
+            or _FENCE_PATTERN.match(line)
+            or line.lstrip().startswith("|")
+            or _LIST_ITEM_PATTERN.match(line)
+        )
+
+    while i < n:
+        line = lines[i]
+        if is_blank(i):
+            i += 1
+            continue
+
+        start_index = i
+        heading = _HEADING_PATTERN.match(line.rstrip("\n"))
+        if heading:
+            blocks.append(_Block("heading", line.rstrip("\n"), offsets[i],
+                                 level=len(heading.group(1)), title=heading.group(2).strip()))
+            i += 1
+            continue
+
+        if _FENCE_PATTERN.match(line):
+            fence = _FENCE_PATTERN.match(line).group(1)
+            i += 1
+            while i < n and not lines[i].strip().startswith(fence):
+                i += 1
+            i = min(i + 1, n)
+            kind = "code"
+        elif line.lstrip().startswith("|"):
+            while i < n and lines[i].lstrip().startswith("|"):
+                i += 1
+            kind = "table"
+        elif _LIST_ITEM_PATTERN.match(line):
+            i += 1
+            while i < n:
+                if _LIST_ITEM_PATTERN.match(lines[i]):
+                    i += 1
+                elif not is_blank(i) and lines[i][:1] in (" ", "\t"):
+                    i += 1  # 列表项的缩进续行
+                elif is_blank(i) and i + 1 < n and (
+                    _LIST_ITEM_PATTERN.match(lines[i + 1]) or lines[i + 1][:1] in (" ", "\t")
+                ) and lines[i + 1].strip():
+                    i += 1  # 列表项之间的空行
+                else:
+                    break
+            kind = "list"
+        else:
+            i += 1
+            while i < n and not is_blank(i) and not starts_other_block(i):
+                i += 1
+            kind = "paragraph"
+
+        block_text = "".join(lines[start_index:i]).rstrip()
+        if kind == "paragraph" and _COMMENT_PATTERN.match(block_text):
+            kind = "comment"
+        blocks.append(_Block(kind, block_text, offsets[start_index]))
+    return blocks
+
+
+def _build_sections(blocks: List[_Block]) -> List[_Section]:
+    """按标题层级把结构块分组为章节，并计算章节路径"""
+    # 文档只有一个一级标题时，把它视为文档标题，不计入章节路径
+    skip_title_level = 1 if sum(1 for b in blocks if b.kind == "heading" and b.level == 1) == 1 else 0
+
+    sections: List[_Section] = []
+    stack: List[Tuple[int, str]] = []
+    current = _Section([], blocks[0].start if blocks else 0)
+    for block in blocks:
+        if block.kind == "heading":
+            if current.blocks:
+                sections.append(current)
+            while stack and stack[-1][0] >= block.level:
+                stack.pop()
+            stack.append((block.level, block.title))
+            path = [title for level, title in stack if level != skip_title_level]
+            current = _Section(path, block.start)
+        current.blocks.append(block)
+    if current.blocks:
+        sections.append(current)
+    return sections
+
+
+def _split_oversized_block(block: _Block, max_size: int) -> List[_Block]:
+    """把超出大小的单个结构块拆开: 表格按行 (重复表头)，列表按条目，段落按句子"""
+    if block.kind == "table":
+        rows = block.text.split("\n")
+        header: List[str] = []
+        if len(rows) > 1 and _TABLE_SEPARATOR_PATTERN.match(rows[1]):
+            header, rows = rows[:2], rows[2:]
+        offset = block.start + sum(len(line) + 1 for line in header)
+        pieces: List[_Block] = []
+        current_rows: List[str] = []
+        piece_start = offset
+        for row in rows:
+            if current_rows and len("\n".join(header + current_rows + [row])) > max_size:
+                pieces.append(_Block("table", "\n".join(header + current_rows), piece_start))
+                current_rows = []
+            if not current_rows:
+                piece_start = offset
+            current_rows.append(row)
+            offset += len(row) + 1
+        if current_rows:
+            pieces.append(_Block("table", "\n".join(header + current_rows), piece_start))
+        return pieces
+
+    if block.kind == "list":
+        lines = block.text.split("\n")
+        first_item = _LIST_ITEM_PATTERN.match(lines[0])
+        base_indent = len(first_item.group(1)) if first_item else 0
+        items: List[List[str]] = []
+        for line in lines:
+            match = _LIST_ITEM_PATTERN.match(line)
+            if not items or (match and len(match.group(1)) <= base_indent):
+                items.append([line])
+            else:
+                items[-1].append(line)  # 子列表和续行跟随所属条目
+        units = ["\n".join(item) for item in items]
+        joiner = "\n"
+    else:
+        units = _SENTENCE_PATTERN.findall(block.text)
+        joiner = ""
+
+    pieces = []
+    current = ""
+    current_start = block.start
+    offset = block.start
+    for unit in units:
+        # 单个单元仍然过长时只能硬切
+        while len(unit) > max_size:
+            if current:
+                pieces.append(_Block(block.kind, current, current_start))
+                current = ""
+            pieces.append(_Block(block.kind, unit[:max_size], offset))
+            unit = unit[max_size:]
+            offset += max_size
+        if not unit:
+            continue
+        if current and len(current) + len(joiner) + len(unit) > max_size:
+            pieces.append(_Block(block.kind, current, current_start))
+            current = ""
+        if current:
+            current += joiner + unit
+        else:
+            current = unit
+            current_start = offset
+        offset += len(unit) + len(joiner)
+    if current:
+        pieces.append(_Block(block.kind, current, current_start))
+    return pieces
+
+
+def _pack_blocks(blocks: List[_Block], max_size: int) -> List[List[_Block]]:
+    """把结构块顺序打包成不超过 max_size 字符的组，结构块本身不被拆开 (除非单块超限)"""
+    groups: List[List[_Block]] = []
+    current: List[_Block] = []
+    current_len = 0
+    for block in blocks:
+        pieces = [block] if len(block.text) <= max_size else _split_oversized_block(block, max_size)
+        for piece in pieces:
+            added = len(piece.text) + (2 if current else 0)
+            # 标题块总是和其后的内容放在一起
+            if current and current_len + added > max_size and not all(b.kind == "heading" for b in current):
+                groups.append(current)
+                current, current_len = [], 0
+                added = len(piece.text)
+            current.append(piece)
+            current_len += added
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _join(blocks: List[_Block]) -> str:
+    return "\n\n".join(block.text for block in blocks)
+
+
+def _add_page_metadata(metadata: Dict, page_index: PageIndex, blocks: List[_Block]):
+    """规则书带有页码标记 (PDF提取) 时，记录块所在的首页和末页"""
+    if page_index:
+        set_page_metadata(metadata, *page_index.page_range(blocks[0].start, blocks[-1].start + len(blocks[-1].text)))
+
+
+def section_spans(text: str) -> List[Tuple[str, int, int]]:
+    """
+    返回文档中每个章节的 (章节路径, 起始位置, 结束位置)，
+    用于把按字符分块的结果对应回章节 (例如评估检索质量)
+    """
+    sections = _build_sections(_parse_blocks(text))
+    spans = []
+    for index, section in enumerate(sections):
+        end = sections[index + 1].start if index + 1 < len(sections) else len(text)
+        spans.append((section.path_text, section.start, end))
+    return spans
+
+
+class MarkdownSectionSplitter:
+    """
+    按Markdown标题结构分块。
+    每个章节先按 parent_chunk_size 打包成父块 (小章节即整个章节)，
+    再在父块内按 chunk_size 打包成用于检索的子块。
+    子块的元数据中记录 section_path 和 parent_id，父块记录 start_index；
+    规则书中有 <!-- page N --> 页码标记时，子块和父块都记录 page (首页) 和跨页时的 page_end。
+    """
+
+    def __init__(self, chunk_size: int = 600, parent_chunk_size: int = 3000):
+        self.chunk_size = chunk_size
+        self.parent_chunk_size = max(parent_chunk_size, chunk_size)
+
+    def split_text(self, text: str, metadata: Optional[Dict] = None) -> Tuple[List[Document], List[Document]]:
+        """
+        Returns:
+            (子块列表, 父块列表)
+        """
+        base_metadata = dict(metadata or {})
+        children: List[Document] = []
+        parents: List[Document] = []
+        page_index = PageIndex(text)
+
+        for section_index, section in enumerate(_build_sections(_parse_blocks(text))):
+            if not section.has_body:
+                continue
+            path_text = section.path_text
+            for part_index, parent_blocks in enumerate(_pack_blocks(section.blocks, self.parent_chunk_size)):
+                parent_id = f"s{section_index}p{part_index}"
+                parent_text = _join(parent_blocks)
+                parent_metadata = {**base_metadata, "section_path": path_text, "parent_id": parent_id}
+                # 只有父块是原文的连续片段时才记录位置，供上下文构建合并相邻章节
+                start = parent_blocks[0].start
+                if text[start:start + len(parent_text)] == parent_text:
+                    parent_metadata["start_index"] = start
+                _add_page_metadata(parent_metadata, page_index, parent_blocks)
+                parents.append(Document(page_content=parent_text, metadata=parent_metadata))
+                for child_blocks in _pack_blocks(parent_blocks, self.chunk_size):
+                    if all(block.kind == "comment" for block in child_blocks):
+                        continue  # 只剩页码标记等注释的块没有检索价值
+                    body = _join(child_blocks)
+                    # 在子块前加上章节路径，使章节名参与向量检索
+                    content = f"{path_text}\n{body}" if path_text and child_blocks[0].kind != "heading" else body
+                    child_metadata = {
+                        **base_metadata,
+                        "section_path": path_text,
+                        "parent_id": parent_id,
+                        "chunk_index": len(children),
+                    }
+                    _add_page_metadata(child_metadata, page_index, child_blocks)
+                    children.append(Document(page_content=content, metadata=child_metadata))
+        return children, parents
+
+    def split_documents(self, documents: List[Document]) -> Tuple[List[Document], List[Document]]:
+        """对多个文档分块，parent_id 在文档之间保持唯一"""
+        all_children: List[Document] = []
+        all_parents: List[Document] = []
+        for doc_index, document in enumerate(documents):
+            children, parents = self.split_text(document.page_content, document.metadata)
+            if len(documents) > 1:
+                for doc in children + parents:
+                    doc.metadata["parent_id"] = f"d{doc_index}{doc.metadata['parent_id']}"
+            all_children.extend(children)
+            all_parents.extend(parents)
+        return all_children, all_parents
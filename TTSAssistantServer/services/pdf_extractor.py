@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则书PDF文本提取
+TTS 会把 Custom_PDF 对象的PDF缓存到 Mods/PDF 目录。这里找到每个规则书URL对应的本地PDF，
+在进程池中按页提取文本 (pypdf，纯Python实现)，写入可编辑规则书 .md 文件，并用
+<!-- page N --> 标记每页的开始。
+每个任务只处理一段页码，结果直接写入临时文件，几百页的规则书也不会整本驻留内存。
+"""
+
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import types
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PAGE_MARKER_TEMPLATE = "<!-- page {page} -->"
+
+_NON_ALNUM_PATTERN = re.compile(r"[^A-Za-z0-9]")
+_BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+def tts_cache_stem(url: str) -> str:
+    """TTS 缓存文件名的主干: 去掉URL中所有非字母数字字符"""
+    return _NON_ALNUM_PATTERN.sub("", url)
+
+
+def index_cached_pdfs(pdf_dir: str) -> Dict[str, str]:
+    """Mods/PDF 目录中的PDF {文件名主干 (小写): 路径}"""
+    index = {}
+    if not os.path.isdir(pdf_dir):
+        return index
+    for name in os.listdir(pdf_dir):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() == ".pdf":
+            index[stem.lower()] = os.path.join(pdf_dir, name)
+    return index
+
+
+def find_cached_pdf(url: str, pdf_index: Dict[str, str]) -> Optional[str]:
+    """查找规则书URL在TTS缓存中的本地PDF，未缓存 (游戏还没在TTS中加载过) 时返回None"""
+    if not url:
+        return None
+    return pdf_index.get(tts_cache_stem(url).lower())
+
+
+def pdf_signature(pdf_path: str) -> Dict[str, float]:
+    """PDF文件的大小和修改时间，用于判断是否需要重新提取"""
+    stat = os.stat(pdf_path)
+    return {"pdf_size": stat.st_size, "pdf_mtime": stat.st_mtime}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _require_pypdf():
+    try:
+        import pypdf
+        return pypdf
+    except ImportError:
+        raise ImportError("未安装pypdf库，请使用pip install pypdf安装")
+
+
+def pypdf_available() -> bool:
+    try:
+        _require_pypdf()
+        return True
+    except ImportError:
+        return False
+
+
+def count_pages(pdf_path: str) -> int:
+    pypdf = _require_pypdf()
+    return len(pypdf.PdfReader(pdf_path).pages)
+
+
+def _clean_page_text(text: str) -> str:
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return _BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int, part_path: str) -> Tuple[int, int]:
+    """
+    (在工作进程中执行) 提取 [start, end) 页的文本，逐页写入 part_path。
+    Returns:
+        (提取的页数, 文本字符数)
+    """
+    pypdf = _require_pypdf()
+    reader = pypdf.PdfReader(pdf_path)
+    chars = 0
+    with open(part_path, "w", encoding="utf-8") as out:
+        for index in range(start, end):
+            try:
+                text = _clean_page_text(reader.pages[index].extract_text() or "")
+            except Exception as e:
+                text = f"<!-- 第{index + 1}页文本提取失败: {type(e).__name__} -->"
+            out.write(PAGE_MARKER_TEMPLATE.format(page=index + 1))
+            out.write("\n\n")
+            if text:
+                out.write(text)
+                out.write("\n\n")
+            chars += len(text)
+    return end - start, chars
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    spawn 方式启动的工作进程默认会重新导入入口脚本 (app.py 在模块级别创建LLM、Embedding等组件)。
+    启动工作进程期间临时替换 __main__，工作进程只导入本模块。
+    """
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        if main_module is not None:
+            sys.modules["__main__"] = main_module
+
+
+class PdfTextExtractor:
+    """把规则书PDF按页段分给工作进程提取，再按页码顺序拼接成 .md 文件"""
+
+    def __init__(self, max_workers: int = 0, pages_per_task: int = 20):
+        self.max_workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+        self.pages_per_task = max(1, pages_per_task)
+
+    def extract(self, pdf_path: str, output_path: str, title: str = "") -> Dict:
+        return self.extract_many([(pdf_path, output_path, title)])[0]
+
+    def extract_many(self, jobs: List[Tuple[str, str, str]]) -> List[Dict]:
+        """
+        提取多本PDF
+        Args:
+            jobs: [(pdf_path, output_path, title)]
+        Returns:
+            与 jobs 一一对应的结果: {"pages", "chars", "seconds", "error"} (成功时 error 为None)
+        """
+        started_at = time.perf_counter()
+        results: List[Dict] = [{"pages": 0, "chars": 0, "seconds": 0.0, "error": None} for _ in jobs]
+        work_dir = tempfile.mkdtemp(prefix="tts_pdf_extract_")
+        try:
+            # [(job_index, start, end, part_path)]
+            tasks = []
+            for job_index, (pdf_path, _, _) in enumerate(jobs):
+                try:
+                    page_count = count_pages(pdf_path)
+                except Exception as e:
+                    results[job_index]["error"] = f"无法读取PDF: {e}"
+                    continue
+                for start in range(0, page_count, self.pages_per_task):
+                    end = min(page_count, start + self.pages_per_task)
+                    tasks.append((job_index, start, end, os.path.join(work_dir, f"{job_index}_{start:06d}.txt")))
+
+            for (job_index, *_), outcome in zip(tasks, self._run_tasks(jobs, tasks)):
+                result = results[job_index]
+                if isinstance(outcome, Exception):
+                    result["error"] = result["error"] or f"文本提取失败: {outcome}"
+                else:
+                    result["pages"] += outcome[0]
+                    result["chars"] += outcome[1]
+
+            for job_index, (pdf_path, output_path, title) in enumerate(jobs):
+                result = results[job_index]
+                if result["error"] is None:
+                    parts = [task[3] for task in tasks if task[0] == job_index]
+                    self._write_markdown(output_path, title, pdf_path, result["pages"], parts)
+                result["seconds"] = time.perf_counter() - started_at
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return results
+
+    def _run_tasks(self, jobs, tasks) -> Iterator:
+        """按提交顺序返回每个任务的结果 (页数, 字符数) 或异常"""
+        if self.max_workers == 1 or len(tasks) <= 1:
+            for job_index, start, end, part_path in tasks:
+                try:
+                    yield _extract_page_range(jobs[job_index][0], start, end, part_path)
+                except Exception as e:
+                    yield e
+            return
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks)), mp_context=context) as pool:
+            with _without_main_module():
+                futures = [
+                    pool.submit(_extract_page_range, jobs[job_index][0], start, end, part_path)
+                    for job_index, start, end, part_path in tasks
+                ]
+            for future in futures:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield e
+
+    def _write_markdown(self, output_path: str, title: str, pdf_path: str, pages: int, parts: List[str]):
+        """写入临时文件后原子替换，避免规则书监视器读到写了一半的文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        temp_path = f"{output_path}.extracting"
+        with open(temp_path, "w", encoding="utf-8") as out:
+            if title:
+                out.write(f"# {title}\n\n")
+            out.write(f"<!-- 由 {os.path.basename(pdf_path)} 自动提取，共 {pages} 页。可直接编辑本文件修正提取错误，"
+                      f"编辑后的文件不会被再次提取覆盖。 -->\n\n")
+            for part_path in parts:
+                with open(part_path, "r", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, out)
+        os.replace(temp_path, output_path)
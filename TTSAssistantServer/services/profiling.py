@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 慢请求采样分析
+按配置对请求做 cProfile 分析，只保存超过耗时阈值或按 1/N 抽中的请求，
+分析结果写入 data/ 下的轮转目录，事后可用 pstats / snakeviz 查看。
+"""
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 分析模式
+PROFILING_MODE_OFF = "off"
+PROFILING_MODE_THRESHOLD = "threshold"  # 分析每个请求，只保存耗时超过阈值的
+PROFILING_MODE_SAMPLE = "sample"        # 每 N 个请求分析并保存一个
+PROFILING_MODE_BOTH = "both"            # 保存超过阈值的请求，以及每 N 个请求中的一个
+
+PROFILE_SUFFIX = ".prof"
+SUMMARY_SUFFIX = ".txt"
+# 文本摘要中列出的函数数
+SUMMARY_TOP_FUNCTIONS = 40
+
+_UNSAFE_NAME_PATTERN = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class RequestProfiler:
+    """对指定请求做 cProfile 分析并保存到轮转目录"""
+
+    def __init__(self, directory: str, mode: str = PROFILING_MODE_OFF, threshold_ms: float = 5000,
+                 sample_every: int = 100, max_files: int = 50):
+        self.directory = directory
+        self.mode = (mode or PROFILING_MODE_OFF).lower()
+        self.threshold = threshold_ms / 1000.0
+        self.sample_every = max(1, sample_every)
+        self.max_files = max(1, max_files)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _sampled(self) -> bool:
+        if self.mode not in (PROFILING_MODE_SAMPLE, PROFILING_MODE_BOTH):
+            return False
+        return next(self._counter) % self.sample_every == 0
+
+    @contextmanager
+    def profile(self, name: str, **tags: str):
+        """
+        分析一段代码 (通常是一个请求处理函数)。
+        threshold 模式下每个请求都会开启分析，开销约为 cProfile 的常规开销；
+        sample 模式下只有被抽中的请求才开启。
+        """
+        sampled = self._sampled()
+        if not (sampled or self.mode in (PROFILING_MODE_THRESHOLD, PROFILING_MODE_BOTH)):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ 同一时间只允许一个 cProfile 处于活动状态，并发请求时跳过本次分析
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            reason = None
+            if elapsed >= self.threshold and self.mode in (PROFILING_MODE_THRESHOLD, PROFILING_MODE_BOTH):
+                reason = "slow"
+            elif sampled:
+                reason = "sampled"
+            if reason:
+                try:
+                    self._save(profiler, name, elapsed, reason, tags)
+                except Exception as e:
+                    print(f"警告: 保存性能分析结果失败: {e}")
+
+    def _save(self, profiler: cProfile.Profile, name: str, elapsed: float, reason: str, tags: Dict[str, str]):
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base_name = _UNSAFE_NAME_PATTERN.sub("_", f"{timestamp}_{name}_{reason}_{elapsed * 1000:.0f}ms")
+        profile_path = os.path.join(self.directory, base_name + PROFILE_SUFFIX)
+        profiler.dump_stats(profile_path)
+
+        summary = io.StringIO()
+        summary.write(f"request: {name}\nreason: {reason}\nduration_ms: {elapsed * 1000:.1f}\n")
+        for key, value in tags.items():
+            summary.write(f"{key}: {value}\n")
+        summary.write("\n")
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(SUMMARY_TOP_FUNCTIONS)
+        with open(os.path.join(self.directory, base_name + SUMMARY_SUFFIX), "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+
+        print(f"性能分析: 已保存 {name} 请求 ({reason}, {elapsed * 1000:.0f}ms) 到 {profile_path}")
+        self._rotate()
+
+    def _rotate(self):
+        """只保留最新的 max_files 份分析结果"""
+        with self._lock:
+            profiles = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.name.endswith(PROFILE_SUFFIX)),
+                key=lambda entry: entry.name,
+            )
+            for entry in profiles[:-self.max_files]:
+                for path in (entry.path, entry.path[:-len(PROFILE_SUFFIX)] + SUMMARY_SUFFIX):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def list_profiles(self) -> List[Dict]:
+        """列出已保存的分析结果，最新的在前"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(PROFILE_SUFFIX):
+                continue
+            base_name = entry.name[:-len(PROFILE_SUFFIX)]
+            parts = base_name.split("_")
+            summary_name = base_name + SUMMARY_SUFFIX
+            profiles.append({
+                "file": entry.name,
+                "summary_file": summary_name if os.path.exists(os.path.join(self.directory, summary_name)) else None,
+                "size_bytes": entry.stat().st_size,
+                "created_at": datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec="seconds"),
+                "request": "_".join(parts[1:-2]) if len(parts) >= 4 else base_name,
+                "reason": parts[-2] if len(parts) >= 4 else None,
+                "duration_ms": int(parts[-1][:-2]) if len(parts) >= 4 and parts[-1].endswith("ms") and parts[-1][:-2].isdigit() else None,
+            })
+        profiles.sort(key=lambda item: item["file"], reverse=True)
+        return profiles
+
+    def resolve_file(self, filename: str) -> Optional[str]:
+        """返回分析结果文件的完整路径，文件名不合法或不存在时返回None"""
+        if os.path.basename(filename) != filename or not filename.endswith((PROFILE_SUFFIX, SUMMARY_SUFFIX)):
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
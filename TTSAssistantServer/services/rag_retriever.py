@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - RAG检索管线
+包装底层向量检索器，在结果交给LLM之前做后处理 (重排序、扩展到父章节、合并重叠块、控制上下文token预算)
+"""
+
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+
+from services.context_builder import build_context, expand_to_parents
+
+
+class PipelineRetriever(BaseRetriever):
+    """在底层检索器之上执行上下文构建的检索器"""
+
+    # 底层检索器 (通常是 FAISS 的 VectorStoreRetriever)
+    base_retriever: Any
+    # 上下文token预算，<=0 表示不限制
+    context_token_budget: int = 0
+    # 父章节块 {parent_id: Document}，提供时执行小块检索、大块返回
+    parent_chunks: Optional[Dict[str, Document]] = None
+    # 重排序器 (services.reranker.Reranker)，提供时从候选块中只保留 rerank_top_n 块
+    reranker: Any = None
+    rerank_top_n: int = 3
+
+    # 用原问题预先执行的推测检索 (services.speculative_retrieval.SpeculativeRetrieval)，
+    # 提供时改写后问题的候选块与之足够重合就直接复用推测结果
+    speculation: Any = None
+
+    def retrieve_candidates(self, query: str) -> List[Document]:
+        """向量检索候选块"""
+        # 不向底层检索器传递回调，避免检索耗时被重复计入
+        return self.base_retriever.invoke(query)
+
+    def build_context_docs(self, query: str, docs: List[Document]) -> List[Document]:
+        """重排序、扩展到父章节并按预算构建上下文"""
+        if self.reranker is not None:
+            candidate_count = len(docs)
+            docs = self.reranker.rerank(query, docs, self.rerank_top_n)
+            print(f"重排序: {candidate_count} 个候选块 -> {len(docs)} 块")
+        if self.parent_chunks:
+            docs = expand_to_parents(docs, self.parent_chunks)
+        context_docs, context_tokens = build_context(docs, self.context_token_budget)
+        print(f"上下文构建: {len(docs)} 个检索块 -> {len(context_docs)} 段, 约 {context_tokens} tokens")
+        return context_docs
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = None
+        if self.speculation is not None:
+            context_docs, docs = self.speculation.resolve(query)
+            if context_docs is not None:
+                return context_docs
+        if docs is None:
+            docs = self.retrieve_candidates(query)
+        return self.build_context_docs(query, docs)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 请求计时
+记录单次请求各阶段的耗时和走过的路径，便于定位慢请求
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from services.token_counter import estimate_tokens_total
+
+
+class RequestTrace:
+    """单次请求的计时记录"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        # 各阶段耗时 (秒)，同名阶段多次出现时累加
+        self.spans: Dict[str, float] = {}
+        # 附加标签，例如走了哪条改写路径
+        self.tags: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        """计时一个阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """记录一个阶段的耗时"""
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def set(self, key: str, value: Any):
+        """设置标签"""
+        self.tags[key] = value
+
+    def add(self, key: str, amount: int):
+        """累加数值标签，例如各阶段的提示词token数"""
+        with self._lock:
+            self.tags[key] = self.tags.get(key, 0) + amount
+
+    def total(self) -> float:
+        """请求开始至今的总耗时 (秒)"""
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典 (毫秒)"""
+        return {
+            "total_ms": round(self.total() * 1000, 1),
+            "spans_ms": {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()},
+            **self.tags,
+        }
+
+    def summary(self) -> str:
+        """单行摘要，用于日志输出"""
+        spans = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.spans.items())
+        tags = " ".join(f"{key}={value}" for key, value in self.tags.items())
+        return f"[{self.name}] total={self.total() * 1000:.0f}ms {spans} {tags}".strip()
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    将链内部的LLM调用、检索耗时和提示词token数记录到 RequestTrace。
+    检索开始前的LLM调用视为问题改写 (condense)，之后的视为回答生成 (generate)。
+    """
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._starts: Dict[UUID, float] = {}
+        self._retrieval_started = False
+
+    def _start(self, run_id: UUID):
+        self._starts[run_id] = time.perf_counter()
+
+    def _end(self, run_id: UUID, name: str):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.trace.record(name, time.perf_counter() - start)
+
+    def _llm_phase(self) -> str:
+        return "generate" if self._retrieval_started else "condense"
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+        self.trace.add(f"prompt_tokens_{self._llm_phase()}", estimate_tokens_total(prompts))
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+        texts = [str(message.content) for batch in messages for message in batch]
+        self.trace.add(f"prompt_tokens_{self._llm_phase()}", estimate_tokens_total(texts))
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, self._llm_phase())
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, self._llm_phase())
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID, **kwargs: Any):
+        self._retrieval_started = True
+        self._start(run_id)
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, "retrieval")
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, "retrieval")
+
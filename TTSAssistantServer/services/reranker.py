@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 检索结果重排序
+先用向量检索取较多候选块，再用更精确的打分器重新排序，只把最好的几块交给LLM。
+支持两种打分器:
+    lexical: 查询词覆盖率 (中文字二元组 + 英文单词)，无额外依赖
+    cross_encoder: 本地CPU上运行的 sentence-transformers CrossEncoder 模型
+"""
+
+import abc
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+_CJK_RUN_PATTERN = re.compile(r"[\u4e00-\u9fff]+")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# 查询中常见但不区分内容的中文字，含这些字的二元组不参与打分
+_CJK_STOP_CHARS = set("的了吗呢吧是在有和与或就都也还要会能可以什么怎么多少几哪谁")
+
+
+def _terms(text: str) -> List[str]:
+    """提取打分用的词项: 英文单词/数字，以及中文字二元组 (单字串保留单字)"""
+    terms = _WORD_PATTERN.findall(text.lower())
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            if run not in _CJK_STOP_CHARS:
+                terms.append(run)
+            continue
+        for i in range(len(run) - 1):
+            bigram = run[i:i + 2]
+            if bigram[0] in _CJK_STOP_CHARS or bigram[1] in _CJK_STOP_CHARS:
+                continue
+            terms.append(bigram)
+    return terms
+
+
+def chunk_id(doc: Document) -> str:
+    """文档块的稳定标识: 来源 + 内容的摘要 (重建索引后内容未变的块仍能命中缓存)"""
+    source = str(doc.metadata.get("source", ""))
+    return hashlib.sha1(f"{source}\n{doc.page_content}".encode("utf-8")).hexdigest()[:16]
+
+
+def query_hash(query: str) -> str:
+    """查询文本的摘要，用作缓存键的一部分"""
+    return hashlib.sha1(query.strip().encode("utf-8")).hexdigest()[:16]
+
+
+class Reranker(abc.ABC):
+    """重排序器基类: 子类实现 _score_batch，基类负责分批、缓存和排序"""
+
+    name = "base"
+
+    def __init__(self, batch_size: int = 16, cache_size: int = 4096):
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        # LRU缓存 {(query_hash, chunk_id): score}
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @abc.abstractmethod
+    def _score_batch(self, query: str, texts: List[str]) -> List[float]:
+        """对一批 (查询, 文本) 打分，分数越高越相关"""
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        """为每个文档块打分，命中缓存的块不再重复计算"""
+        qhash = query_hash(query)
+        keys = [(qhash, chunk_id(doc)) for doc in docs]
+        scores: List[Optional[float]] = [None] * len(docs)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            pending = [i for i, score in enumerate(scores) if score is None]
+            self.cache_hits += len(docs) - len(pending)
+            self.cache_misses += len(pending)
+
+        for offset in range(0, len(pending), self.batch_size):
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = self._score_batch(query, [docs[i].page_content for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+
+        if pending and self.cache_size > 0:
+            with self._lock:
+                for i in pending:
+                    self._cache[keys[i]] = scores[i]
+                    self._cache.move_to_end(keys[i])
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: Sequence[Document], top_n: int) -> List[Document]:
+        """按分数重新排序并保留前 top_n 块，同分时保持原向量检索顺序"""
+        if not docs:
+            return []
+        scores = self.score(query, docs)
+        order = sorted(range(len(docs)), key=lambda i: (-scores[i], i))
+        return [docs[i] for i in order[:top_n]] if top_n > 0 else [docs[i] for i in order]
+
+    def stats(self) -> Dict[str, float]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                "cache_size": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "hit_rate": self.cache_hits / total if total else 0.0,
+            }
+
+
+class LexicalOverlapReranker(Reranker):
+    """
+    查询词覆盖率打分: 文档块覆盖的查询词项比例为主，词项密度作为次要依据。
+    只依赖查询和文档本身 (不使用候选集统计量)，所以分数可以安全缓存。
+    """
+
+    name = "lexical"
+
+    def _score_one(self, query_terms: set, text: str) -> float:
+        if not query_terms:
+            return 0.0
+        doc_terms = _terms(text)
+        if not doc_terms:
+            return 0.0
+        doc_term_set = set(doc_terms)
+        matched = query_terms & doc_term_set
+        coverage = len(matched) / len(query_terms)
+        occurrences = sum(1 for term in doc_terms if term in matched)
+        density = occurrences / math.sqrt(len(doc_terms))
+        return coverage + 0.1 * density
+
+    def _score_batch(self, query: str, texts: List[str]) -> List[float]:
+        query_terms = set(_terms(query))
+        return [self._score_one(query_terms, text) for text in texts]
+
+
+class CrossEncoderReranker(Reranker):
+    """使用 sentence-transformers CrossEncoder 在CPU上打分"""
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 16, cache_size: int = 4096):
+        super().__init__(batch_size=batch_size, cache_size=cache_size)
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def _score_batch(self, query: str, texts: List[str]) -> List[float]:
+        pairs = [(query, text) for text in texts]
+        return [float(score) for score in self.model.predict(pairs, batch_size=self.batch_size)]
+
+
+def create_reranker(provider: str, model_name: str = "", batch_size: int = 16,
+                    cache_size: int = 4096) -> Optional[Reranker]:
+    """
+    按配置创建重排序器。
+    Args:
+        provider: lexical / cross_encoder / none
+        model_name: cross_encoder 使用的模型名称
+    Returns:
+        Reranker 对象，provider 为 none 时返回None。
+        cross_encoder 依赖未安装或模型加载失败时退回 lexical。
+    """
+    provider = (provider or "none").lower()
+    if provider in ("none", "", "off"):
+        return None
+    if provider == "cross_encoder":
+        try:
+            reranker = CrossEncoderReranker(model_name, batch_size=batch_size, cache_size=cache_size)
+            print(f"重排序: 使用CrossEncoder模型 {model_name}")
+            return reranker
+        except ImportError:
+            print("未安装sentence-transformers库，重排序退回 lexical 打分。可使用pip install sentence-transformers安装")
+        except Exception as e:
+            print(f"警告: 加载CrossEncoder模型 '{model_name}' 失败，重排序退回 lexical 打分: {e}")
+    elif provider != "lexical":
+        raise ValueError(f"不支持的重排序方式: {provider}")
+    print("重排序: 使用查询词覆盖率 (lexical) 打分")
+    return LexicalOverlapReranker(batch_size=batch_size, cache_size=cache_size)
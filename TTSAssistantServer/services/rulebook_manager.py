@@ -27,6 +27,10 @@ class RulebookManager:
         text = re.sub(r'[\s]+', '_', text)
         return text
     
+    def rulebook_file_path(self, game_name: str, filename: str) -> str:
+        """规则书缓存文件的路径 (不创建文件)"""
+        return os.path.join(self.cache_dir, self.slugify(game_name), filename)
+
     def create_rulebook_file(self, game_name: str, filename: str) -> str:
         """
         为规则书创建空的缓存文件
@@ -38,12 +42,9 @@ class RulebookManager:
         Returns:
             str: 创建的缓存文件的绝对路径
         """
+        file_path = self.rulebook_file_path(game_name, filename)
         # 为游戏创建子目录
-        game_dir = os.path.join(self.cache_dir, self.slugify(game_name))
-        os.makedirs(game_dir, exist_ok=True)
-        
-        # 构建文件路径
-        file_path = os.path.join(game_dir, filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
         # 仅在文件不存在时创建空文件（避免覆盖用户已填充的内容）
         if not os.path.exists(file_path):
@@ -52,6 +53,44 @@ class RulebookManager:
         
         return file_path
     
+    def move_rulebook_file(self, game_name: str, source_path: str, filename: str) -> str:
+        """
+        把规则书缓存文件移动为游戏目录下的 filename (覆盖已存在的文件)。
+        仍是模板内容的文件按新文件名重新生成模板，使其中的 refresh_cache 命令保持正确。
+        
+        Returns:
+            str: 移动后的文件路径
+        """
+        game_dir = os.path.join(self.cache_dir, self.slugify(game_name))
+        os.makedirs(game_dir, exist_ok=True)
+        file_path = os.path.join(game_dir, filename)
+        if self.is_template_content(source_path, game_name):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(self._generate_template_content(game_name, filename))
+            if os.path.abspath(source_path) != os.path.abspath(file_path):
+                os.remove(source_path)
+        else:
+            os.replace(source_path, file_path)
+        return file_path
+    
+    def is_template_content(self, file_path: str, game_name: str) -> bool:
+        """
+        检查规则书缓存文件是否仍然只有模板内容 (或为空)，即用户还没有粘贴规则
+        
+        Args:
+            file_path: 规则书缓存文件路径
+            game_name: 创建该文件时使用的游戏名称
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+        except (OSError, UnicodeDecodeError):
+            return False
+        if not content:
+            return True
+        template = self._generate_template_content(game_name, os.path.basename(file_path)).strip()
+        return content == template
+    
     def _generate_template_content(self, game_name: str, filename: str) -> str:
         """生成规则书模板内容"""
         return f"""# {game_name} 规则书
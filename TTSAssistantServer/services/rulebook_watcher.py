@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则书文件监视
+监视可编辑规则书目录中 .md 文件的变化，合并短时间内的多次保存后，
+把变化的文件交给后台队列重建对应游戏的索引，用户不必再手动执行 refresh_cache。
+"""
+
+import os
+import queue
+import threading
+from typing import Callable, Optional, Set
+
+from services.file_watcher import FileWatcher
+
+RULEBOOK_EXTENSION = ".md"
+
+
+def _is_rulebook_file(path: str) -> bool:
+    return path.lower().endswith(RULEBOOK_EXTENSION) and not os.path.basename(path).startswith(".")
+
+
+class RulebookWatcher(FileWatcher):
+    """监视可编辑规则书目录下 (含子目录) 的 .md 文件"""
+
+    def __init__(self, directory: str, on_change: Callable[[str], None], backend: str = "auto",
+                 debounce_seconds: float = 2.0, poll_interval: float = 2.0):
+        super().__init__(directory, on_change, _is_rulebook_file, backend=backend,
+                         debounce_seconds=debounce_seconds, poll_interval=poll_interval,
+                         recursive=True, name="rulebook-watcher")
+
+    def start(self) -> Optional[str]:
+        started = self.active_backend is None
+        backend = super().start()
+        if backend and started:
+            print(f"规则书监视已启动 ({backend}): {self.directory}")
+        return backend
+
+
+class ReindexQueue:
+    """
+    后台串行执行规则书重建索引任务 (Embedding开销大，避免并发构建)。
+    同一文件在排队期间只保留一个任务；任务开始执行后再次提交会重新排队，保证最终索引是最新内容。
+    """
+
+    def __init__(self, handler: Callable[[str], None]):
+        self.handler = handler
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._queued: Set[str] = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, path: str) -> bool:
+        """提交重建任务，文件已在队列中时返回False"""
+        with self._lock:
+            if path in self._queued:
+                return False
+            self._queued.add(path)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="rulebook-reindex", daemon=True)
+                self._worker.start()
+        self._queue.put(path)
+        return True
+
+    def depth(self) -> int:
+        """排队中 (尚未开始执行) 的任务数"""
+        with self._lock:
+            return len(self._queued)
+
+    def join(self):
+        """等待所有已提交的任务执行完毕"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            with self._lock:
+                self._queued.discard(path)
+            try:
+                self.handler(path)
+            except Exception as e:
+                print(f"重建规则书索引 {path} 时出错: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 单飞缓存
+同一个键同时只执行一次计算，并发的调用等待这次计算并共享结果；
+结果按版本缓存，版本 (例如规则书文件和索引清单的修改时间) 不变时直接返回。
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# get() 返回的结果来源
+CACHED = "cached"      # 版本未变化，直接返回缓存的结果
+SHARED = "shared"      # 等待了其他调用正在进行的计算
+COMPUTED = "computed"  # 由本次调用计算
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Exception = None
+
+
+class SingleFlightCache:
+    """按键合并并发计算并缓存结果，直到 version_fn 返回的版本变化"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._results: Dict[Hashable, Tuple[Any, Any]] = {}
+
+    def get(self, key: Hashable, compute: Callable[[], Any], version_fn: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        Args:
+            compute: 计算结果，抛出异常时异常传给所有等待的调用，结果不缓存
+            version_fn: 当前版本，在计算完成后再次调用作为缓存的版本 (计算本身可能改变版本，例如重建索引)
+        Returns:
+            (结果, 来源: CACHED / SHARED / COMPUTED)
+        """
+        version = version_fn()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1], CACHED
+            call = self._calls.get(key)
+            owner = call is None
+            if owner:
+                call = self._calls[key] = _Call()
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, SHARED
+
+        try:
+            call.value = compute()
+            with self._lock:
+                self._results[key] = (version_fn(), call.value)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.value, COMPUTED
+
+    def invalidate(self, key: Hashable):
+        """丢弃缓存的结果，下次调用重新计算"""
+        with self._lock:
+            self._results.pop(key, None)
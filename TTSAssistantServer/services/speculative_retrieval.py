@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 推测检索
+后续问题需要先调用LLM改写再检索，两段延迟相加。推测检索在改写的同时用原问题执行完整的检索管线
+(向量检索、重排序、父章节扩展、上下文构建)；改写完成后只用改写后的问题做一次向量检索，
+候选块与推测结果足够重合时直接复用推测结果，省去重排序等后续步骤，否则照常处理改写后的问题。
+"""
+
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from langchain.schema import Document
+
+# 推测结果标签，记录在请求计时中
+SPECULATION_HIT = "hit"
+SPECULATION_MISS = "miss"
+SPECULATION_ERROR = "error"
+
+
+def _doc_key(doc: Document) -> Tuple[Any, ...]:
+    """文档块的标识: 同一索引中 (规则书, 父章节, 起始位置, 内容) 相同即为同一块"""
+    metadata = doc.metadata or {}
+    return (
+        metadata.get("rulebook_id"), metadata.get("parent_id"), metadata.get("start_index"), doc.page_content
+    )
+
+
+def candidate_overlap(candidates: List[Document], speculative_candidates: List[Document]) -> float:
+    """改写后问题的候选块中有多少比例也在推测检索的候选块中"""
+    if not candidates:
+        return 1.0 if not speculative_candidates else 0.0
+    speculative_keys = {_doc_key(doc) for doc in speculative_candidates}
+    shared = sum(1 for doc in candidates if _doc_key(doc) in speculative_keys)
+    return shared / len(candidates)
+
+
+class SpeculativeRetrieval:
+    """
+    在后台线程中用原问题执行检索。
+    Args:
+        question: 原问题
+        retrieve_candidates: 向量检索，返回候选块
+        build_context_docs: (查询, 候选块) -> 交给LLM的上下文块
+        min_overlap: 复用推测结果所需的最小候选重合比例
+    """
+
+    def __init__(self, question: str, retrieve_candidates: Callable[[str], List[Document]],
+                 build_context_docs: Callable[[str, List[Document]], List[Document]], min_overlap: float):
+        self.question = question
+        self.min_overlap = min_overlap
+        self.result: Optional[str] = None
+        self.overlap: Optional[float] = None
+        self.seconds = 0.0
+        self._retrieve_candidates = retrieve_candidates
+        self._build_context_docs = build_context_docs
+        self._candidates: List[Document] = []
+        self._context_docs: List[Document] = []
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name="speculative-retrieval", daemon=True)
+
+    def start(self) -> "SpeculativeRetrieval":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._candidates = self._retrieve_candidates(self.question)
+            self._context_docs = self._build_context_docs(self.question, self._candidates)
+        except Exception as e:
+            self._error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+
+    def wait(self):
+        self._thread.join()
+
+    def resolve(self, query: str) -> Tuple[Optional[List[Document]], Optional[List[Document]]]:
+        """
+        判断改写后的查询能否复用推测结果。
+        Returns:
+            (可复用时为推测的上下文块, 为判断而检索的改写后查询的候选块)，
+            未复用时调用方用候选块 (为None时重新检索) 照常处理改写后的查询
+        """
+        self.wait()
+        if self._error is not None:
+            print(f"推测检索失败，使用改写后的问题检索: {self._error}")
+            self.result = SPECULATION_ERROR
+            return None, None
+        candidates = None
+        if query.strip() == self.question.strip():
+            self.overlap = 1.0
+        else:
+            candidates = self._retrieve_candidates(query)
+            self.overlap = candidate_overlap(candidates, self._candidates)
+        if self.overlap >= self.min_overlap:
+            self.result = SPECULATION_HIT
+            return self._context_docs, candidates
+        self.result = SPECULATION_MISS
+        return None, candidates
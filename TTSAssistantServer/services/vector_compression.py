@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 向量压缩
+把FAISS索引中的float32向量压缩为 fp16 / int8 标量量化或乘积量化 (PQ)，减少索引的磁盘和内存占用；
+可选保留一份float32向量 (内存映射，只读取用到的行)，对压缩索引返回的候选按精确距离重新排序。
+"""
+
+import math
+import operator
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+COMPRESSION_MODES = ("none", "fp16", "int8", "pq")
+RESCORE_VECTORS_FILENAME = "vectors.f32.npy"
+
+# PQ 每个子量化器最多 2^8 个中心; 向量太少时减少中心数，少于 2^4 个时改用 int8
+PQ_MAX_BITS = 8
+PQ_MIN_BITS = 4
+
+
+def _faiss():
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("未安装faiss库，请使用pip install faiss-cpu安装")
+    return faiss
+
+
+def pq_subquantizers(dimension: int, requested: int = 0) -> int:
+    """
+    PQ子量化器数 (每个向量压缩后的字节数)，必须整除向量维度。
+    requested <= 0 或不能整除时，取不超过 dimension/8 的最大约数 (每个子量化器约8维)。
+    """
+    if requested > 0 and dimension % requested == 0:
+        return requested
+    if requested > 0:
+        print(f"警告: PQ子量化器数 {requested} 不能整除向量维度 {dimension}，改为自动选择")
+    target = max(1, dimension // 8)
+    for m in range(target, 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def _pq_bits(count: int, dimension: int, m: int) -> Optional[int]:
+    """
+    每个子量化器的编码位数: 在训练点足够 (每个中心至少一个) 且总大小 (float32码本 + 编码) 小于int8量化的前提下取最大值，
+    都不满足时返回None。向量少时码本占主要部分，PQ反而比int8大。
+    """
+    int8_bytes = count * dimension
+    for nbits in range(min(PQ_MAX_BITS, int(math.log2(max(count, 1)))), PQ_MIN_BITS - 1, -1):
+        pq_bytes = (2 ** nbits) * dimension * 4 + math.ceil(count * m * nbits / 8)
+        if pq_bytes < int8_bytes:
+            return nbits
+    return None
+
+
+def compress_index(index: Any, mode: str, pq_m: int = 0) -> Tuple[Any, str]:
+    """
+    用索引中的原始向量训练并建立压缩索引，距离度量与原索引相同
+    Args:
+        index: 可以还原向量的FAISS索引 (FAISS.from_documents 建立的 IndexFlat)
+        mode: COMPRESSION_MODES 之一
+        pq_m: PQ子量化器数 (0 表示自动)
+    Returns:
+        (压缩后的索引, 实际使用的压缩方式)。mode 为 none 或索引为空时原样返回。
+    """
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"不支持的向量压缩方式: {mode} (可选: {', '.join(COMPRESSION_MODES)})")
+    if mode == "none" or index.ntotal == 0:
+        return index, "none"
+
+    faiss = _faiss()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    dimension, metric = index.d, index.metric_type
+
+    if mode == "pq":
+        m = pq_subquantizers(dimension, pq_m)
+        nbits = _pq_bits(index.ntotal, dimension, m)
+        if nbits is None:
+            print(f"向量数 {index.ntotal} 太少，PQ码本比int8量化更大，改用int8量化")
+            mode = "int8"
+        else:
+            compressed = faiss.IndexPQ(dimension, m, nbits, metric)
+            # 规则书的块数通常只有几百个，允许每个中心只有少量训练点
+            compressed.pq.cp.min_points_per_centroid = 1
+            compressed.pq.cp.max_points_per_centroid = max(256, index.ntotal)
+            compressed.train(vectors)
+            compressed.add(vectors)
+            return compressed, mode
+
+    quantizer_type = faiss.ScalarQuantizer.QT_fp16 if mode == "fp16" else faiss.ScalarQuantizer.QT_8bit
+    compressed = faiss.IndexScalarQuantizer(dimension, quantizer_type, metric)
+    compressed.train(vectors)
+    compressed.add(vectors)
+    return compressed, mode
+
+
+def save_rescore_vectors(index: Any, folder_path: str) -> str:
+    """把索引中的原始float32向量保存到 folder_path，必须在压缩前调用"""
+    path = os.path.join(folder_path, RESCORE_VECTORS_FILENAME)
+    temp_path = f"{path}.tmp.npy"
+    np.save(temp_path, index.reconstruct_n(0, index.ntotal).astype(np.float32, copy=False))
+    os.replace(temp_path, path)
+    return path
+
+
+def load_rescore_vectors(folder_path: str) -> Optional[np.ndarray]:
+    """以内存映射方式打开保存的原始向量，文件不存在时返回None"""
+    path = os.path.join(folder_path, RESCORE_VECTORS_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+class RescoringFAISS(FAISS):
+    """
+    先在压缩索引中取 k * rescore_factor 个候选，再用原始向量计算精确距离取前k个。
+    未附加原始向量或带元数据过滤的查询按普通FAISS检索。
+    """
+
+    rescore_vectors: Optional[np.ndarray] = None
+    rescore_factor: int = 0
+
+    @classmethod
+    def from_store(cls, store: FAISS, rescore_vectors: Optional[np.ndarray] = None,
+                   rescore_factor: int = 0) -> "RescoringFAISS":
+        """用已有FAISS向量存储的索引和文档库创建，不复制数据"""
+        rescoring_store = cls(
+            embedding_function=store.embedding_function,
+            index=store.index,
+            docstore=store.docstore,
+            index_to_docstore_id=store.index_to_docstore_id,
+            normalize_L2=store._normalize_L2,
+            distance_strategy=store.distance_strategy,
+        )
+        if rescore_vectors is not None and rescore_factor > 0:
+            if len(rescore_vectors) != store.index.ntotal:
+                print(f"警告: 原始向量数 {len(rescore_vectors)} 与索引向量数 {store.index.ntotal} 不一致，不进行精确重排序")
+            else:
+                rescoring_store.rescore_vectors = rescore_vectors
+                rescoring_store.rescore_factor = rescore_factor
+        return rescoring_store
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        if self.rescore_vectors is None or filter is not None:
+            return super().similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+            )
+
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            _faiss().normalize_L2(vector)
+        _, indices = self.index.search(vector, k * self.rescore_factor)
+        # 按行号顺序读取内存映射中的向量
+        candidates = np.sort(indices[0][indices[0] != -1])
+        if len(candidates) == 0:
+            return []
+
+        exact = np.asarray(self.rescore_vectors[candidates], dtype=np.float32)
+        higher_is_better = self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+        if higher_is_better:
+            scores = exact @ vector[0]
+            order = np.argsort(-scores)[:k]
+        else:
+            # 与 IndexFlatL2 相同，返回平方L2距离
+            scores = ((exact - vector[0]) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:k]
+
+        docs = []
+        for position in order:
+            _id = self.index_to_docstore_id[int(candidates[position])]
+            doc = self.docstore.search(_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {_id}, got {doc}")
+            docs.append((doc, float(scores[position])))
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = operator.ge if higher_is_better else operator.le
+            docs = [(doc, score) for doc, score in docs if cmp(score, score_threshold)]
+        return docs
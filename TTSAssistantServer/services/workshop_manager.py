@@ -8,13 +8,26 @@ TabletopSimulatorCompanion (TTS Companion) - Workshop管理器
 
 import os
 import json
+import hashlib
 import re
 import glob
 import pathlib
-from typing import Dict, List, Optional, Any, Union
+import threading
+from typing import Dict, List, Optional, Any, Tuple, Union
 import config as cfg
+from services.file_watcher import FileWatcher
+from services.pdf_extractor import (
+    PdfTextExtractor, file_sha256, find_cached_pdf, index_cached_pdfs, pdf_signature, pypdf_available
+)
 from services.rulebook_manager import RulebookManager
 
+# 增量扫描状态的格式版本: 扫描逻辑变化 (会从同一个Mod中找到不同的规则书) 时递增，使所有Mod重新扫描
+SCAN_STATE_VERSION = 1
+WORKSHOP_FILE_INFOS_FILENAME = "WorkshopFileInfos.json"
+# 规则书文件名中URL摘要的长度 (十六进制字符数)
+RULEBOOK_URL_DIGEST_LENGTH = 8
+RULEBOOK_SLUG_MAX_LENGTH = 30
+
 class WorkshopManager:
     """管理TTS Workshop数据和规则书元数据"""
     
@@ -23,6 +36,15 @@ class WorkshopManager:
         self.rulebook_manager = RulebookManager()
         self.processed_mods_file = cfg.PROCESSED_MODS_FILE
         self.processed_mods = self._load_processed_mods()
+        # 上次扫描时 WorkshopFileInfos.json 各条目的特征，用于增量扫描
+        self.scan_state_file = cfg.WORKSHOP_SCAN_STATE_FILE or os.path.join(
+            os.path.dirname(self.processed_mods_file), "workshop_scan_state.json"
+        )
+        # 后台增量扫描和请求处理可能同时修改元数据
+        self._lock = threading.RLock()
+        # PDF文本提取耗时较长，同一时间只运行一次
+        self._extraction_lock = threading.Lock()
+        self._pypdf_warning_shown = False
         
     def _load_processed_mods(self) -> Dict:
         """从JSON文件加载已处理的Mod数据"""
@@ -50,91 +72,237 @@ class WorkshopManager:
         text = re.sub(r'[\s]+', '_', text)
         return text
     
-    def scan_all_tts_data(self):
-        """扫描TTS Workshop数据，查找游戏和规则书(PDF)"""
+    def _workshop_file_infos_path(self) -> Optional[str]:
+        """WorkshopFileInfos.json 的路径，TTS数据目录未配置或不存在时返回None"""
         if not cfg.TTS_DATA_DIRECTORY or not os.path.exists(cfg.TTS_DATA_DIRECTORY):
             print(f"错误: TTS数据目录不存在或未配置: {cfg.TTS_DATA_DIRECTORY}")
-            return
-        
-        workshop_file_infos_path = os.path.join(cfg.TTS_DATA_DIRECTORY, "Mods", "Workshop", "WorkshopFileInfos.json")
-        
+            return None
+        return os.path.join(cfg.TTS_DATA_DIRECTORY, "Mods", "Workshop", WORKSHOP_FILE_INFOS_FILENAME)
+    
+    def _load_workshop_items(self, workshop_file_infos_path: str) -> Optional[List[Dict]]:
+        """读取 WorkshopFileInfos.json 中的工坊物品列表，失败时返回None"""
         if not os.path.exists(workshop_file_infos_path):
             print(f"错误: WorkshopFileInfos.json 未找到于: {workshop_file_infos_path}")
             # 作为后备，可以考虑扫描Saves目录，或者只依赖于已有的processed_mods.json
             # 目前，如果核心的Workshop清单不存在，我们将中止扫描以避免不完整的处理
-            return
+            return None
         
         print(f"正在从 {workshop_file_infos_path} 读取已下载的工坊物品信息...")
         try:
             with open(workshop_file_infos_path, 'r', encoding='utf-8') as f:
-                workshop_items = json.load(f)
+                return json.load(f)
         except json.JSONDecodeError:
             print(f"错误: 解析 WorkshopFileInfos.json 失败。文件可能已损坏。")
-            return
+            return None
         except Exception as e:
             print(f"读取 WorkshopFileInfos.json 时发生未知错误: {e}")
+            return None
+    
+    def _resolve_game_json_path(self, item: Dict, workshop_file_infos_path: str, verbose: bool = True) -> Optional[str]:
+        """把工坊物品的 "Directory" 解析为Mod存档JSON的路径，无法解析时返回None"""
+        game_name = item.get("Name")
+        game_json_path = item.get("Directory") # 这是指向单个mod的json文件路径
+        
+        # 确保路径是绝对的并且使用正确的系统分隔符
+        # "Directory" 键中的路径可能已经是绝对的，并且可能包含混合的分隔符
+        if not os.path.isabs(game_json_path):
+             # 如果不是绝对路径，我们假定它相对于TTS_DATA_DIRECTORY下的某个位置，
+             # 但 WorkshopFileInfos.json 通常包含绝对路径或相对于其自身位置的路径。
+             # 为简单起见，我们先打印警告，后续可能需要更复杂的路径解析逻辑。
+             if verbose:
+                 print(f"警告: 游戏 '{game_name}' 的路径 '{game_json_path}' 不是绝对路径，可能无法正确定位。")
+             # 尝试将其相对于WorkshopFileInfos.json的目录进行解析
+             game_json_path = os.path.join(os.path.dirname(workshop_file_infos_path), game_json_path)
+        
+        game_json_path = os.path.normpath(game_json_path)
+        
+        if not game_json_path.endswith(".json"):
+            # 有些 "Directory" 可能指向目录而非直接的json文件，这里我们假设它应指向json
+            # 如果存在同名的json文件，则使用它
+            potential_json_path = game_json_path + ".json" 
+            if os.path.exists(potential_json_path):
+                game_json_path = potential_json_path
+            else:
+                # 尝试查找目录下的主json文件 (例如，与目录同名的json)
+                dir_name = os.path.basename(game_json_path)
+                potential_json_path_in_dir = os.path.join(game_json_path, f"{dir_name}.json")
+                if os.path.exists(potential_json_path_in_dir):
+                     game_json_path = potential_json_path_in_dir
+                else:
+                    if verbose:
+                        print(f"警告: 游戏 '{game_name}' 的路径 '{item.get('Directory')}' 未指向有效的JSON文件，跳过。")
+                    return None
+        
+        return game_json_path
+    
+    def _scan_workshop_item(self, item: Dict, workshop_file_infos_path: str) -> bool:
+        """扫描 WorkshopFileInfos.json 中的一个工坊物品，返回是否扫描了它的JSON文件"""
+        game_name = item.get("Name")
+        game_json_path = item.get("Directory") # 这是指向单个mod的json文件路径
+        
+        if not game_name or not game_json_path:
+            print(f"警告: WorkshopFileInfos.json 中的项目缺少名称或目录: {item}")
+            return False
+        
+        # 清理 game_name
+        if isinstance(game_name, str):
+            game_name = game_name.strip()
+        
+        game_json_path = self._resolve_game_json_path(item, workshop_file_infos_path)
+        if not game_json_path:
+            return False
+        
+        if os.path.exists(game_json_path):
+            print(f"扫描游戏: '{game_name}' 从文件: {game_json_path}")
+            self._scan_workshop_game_json(game_json_path, game_name)
+            return True
+        
+        print(f"警告: 游戏 '{game_name}' 的JSON文件未找到: {game_json_path}，跳过。")
+        return False
+    
+    def scan_all_tts_data(self):
+        """扫描TTS Workshop数据，查找游戏和规则书(PDF)"""
+        workshop_file_infos_path = self._workshop_file_infos_path()
+        if not workshop_file_infos_path:
+            return
+        
+        workshop_items = self._load_workshop_items(workshop_file_infos_path)
+        if workshop_items is None:
             return
         
         scanned_games_count = 0
-        for item in workshop_items:
-            game_name = item.get("Name")
-            game_json_path = item.get("Directory") # 这是指向单个mod的json文件路径
+        with self._lock:
+            for item in workshop_items:
+                if self._scan_workshop_item(item, workshop_file_infos_path):
+                    scanned_games_count += 1
             
-            if not game_name or not game_json_path:
-                print(f"警告: WorkshopFileInfos.json 中的项目缺少名称或目录: {item}")
-                continue
+            # （可选）保留对Saves目录的扫描，以处理非工坊物品或自定义游戏
+            # saves_dir = os.path.join(cfg.TTS_DATA_DIRECTORY, "Saves")
+            # if os.path.exists(saves_dir):
+            #     print("扫描Saves目录以查找自定义游戏...")
+            #     self._scan_directory(saves_dir) # _scan_directory 需要相应调整或重写
             
-            # 清理 game_name
-            if isinstance(game_name, str):
-                game_name = game_name.strip()
-            
-            # 确保路径是绝对的并且使用正确的系统分隔符
-            # "Directory" 键中的路径可能已经是绝对的，并且可能包含混合的分隔符
-            if not os.path.isabs(game_json_path):
-                 # 如果不是绝对路径，我们假定它相对于TTS_DATA_DIRECTORY下的某个位置，
-                 # 但 WorkshopFileInfos.json 通常包含绝对路径或相对于其自身位置的路径。
-                 # 为简单起见，我们先打印警告，后续可能需要更复杂的路径解析逻辑。
-                 print(f"警告: 游戏 '{game_name}' 的路径 '{game_json_path}' 不是绝对路径，可能无法正确定位。")
-                 # 尝试将其相对于WorkshopFileInfos.json的目录进行解析
-                 game_json_path = os.path.join(os.path.dirname(workshop_file_infos_path), game_json_path)
-            
-            game_json_path = os.path.normpath(game_json_path)
+            # 保存处理结果
+            if scanned_games_count > 0:
+                self._save_processed_mods()
+            self._save_scan_state(self._workshop_signatures(workshop_items, workshop_file_infos_path))
+        
+        print(f"工坊扫描完成，共处理 {scanned_games_count} 个来自 WorkshopFileInfos.json 的游戏。")
+        print(f"总共 {len(self.processed_mods)} 个游戏已记录在案。")
+    
+    def scan_workshop_changes(self) -> Dict[str, int]:
+        """
+        增量扫描: 与上次扫描时记录的 WorkshopFileInfos.json 条目比较，只扫描新增或有变化的Mod。
+        没有扫描状态文件时 (首次运行) 相当于全量扫描。
+        
+        Returns:
+            Dict: {"added": 新增条目数, "changed": 变化条目数, "removed": 移除条目数, "scanned": 扫描的JSON文件数}
+        """
+        result = {"added": 0, "changed": 0, "removed": 0, "scanned": 0}
+        workshop_file_infos_path = self._workshop_file_infos_path()
+        if not workshop_file_infos_path:
+            return result
+        
+        workshop_items = self._load_workshop_items(workshop_file_infos_path)
+        if workshop_items is None:
+            return result
+        
+        with self._lock:
+            # 元数据文件丢失时，之前的扫描结果已不可用，需要重新扫描所有Mod
+            previous = self._load_scan_state() if self.processed_mods else {}
+            current = self._workshop_signatures(workshop_items, workshop_file_infos_path)
             
-            if not game_json_path.endswith(".json"):
-                # 有些 "Directory" 可能指向目录而非直接的json文件，这里我们假设它应指向json
-                # 如果存在同名的json文件，则使用它
-                potential_json_path = game_json_path + ".json" 
-                if os.path.exists(potential_json_path):
-                    game_json_path = potential_json_path
+            for item in workshop_items:
+                key = self._workshop_item_key(item)
+                if key is None or key not in current:
+                    continue
+                signature = current[key]
+                if key not in previous:
+                    result["added"] += 1
+                elif previous[key] != signature:
+                    result["changed"] += 1
                 else:
-                    # 尝试查找目录下的主json文件 (例如，与目录同名的json)
-                    dir_name = os.path.basename(game_json_path)
-                    potential_json_path_in_dir = os.path.join(game_json_path, f"{dir_name}.json")
-                    if os.path.exists(potential_json_path_in_dir):
-                         game_json_path = potential_json_path_in_dir
-                    else:
-                        print(f"警告: 游戏 '{game_name}' 的路径 '{item.get('Directory')}' 未指向有效的JSON文件，跳过。")
-                        continue
+                    # 未变化的Mod不再重复解析
+                    continue
+                if self._scan_workshop_item(item, workshop_file_infos_path):
+                    result["scanned"] += 1
+            result["removed"] = len(set(previous) - set(current))
             
-            if os.path.exists(game_json_path):
-                print(f"扫描游戏: '{game_name}' 从文件: {game_json_path}")
-                self._scan_workshop_game_json(game_json_path, game_name)
-                scanned_games_count += 1
-            else:
-                print(f"警告: 游戏 '{game_name}' 的JSON文件未找到: {game_json_path}，跳过。")
-        
-        # （可选）保留对Saves目录的扫描，以处理非工坊物品或自定义游戏
-        # saves_dir = os.path.join(cfg.TTS_DATA_DIRECTORY, "Saves")
-        # if os.path.exists(saves_dir):
-        #     print("扫描Saves目录以查找自定义游戏...")
-        #     self._scan_directory(saves_dir) # _scan_directory 需要相应调整或重写
-        
-        # 保存处理结果
-        if scanned_games_count > 0:
-            self._save_processed_mods()
+            if result["scanned"] > 0:
+                self._save_processed_mods()
+            self._save_scan_state(current)
         
-        print(f"工坊扫描完成，共处理 {scanned_games_count} 个来自 WorkshopFileInfos.json 的游戏。")
-        print(f"总共 {len(self.processed_mods)} 个游戏已记录在案。")
+        print(f"工坊增量扫描完成: 新增 {result['added']}，变化 {result['changed']}，"
+              f"移除 {result['removed']}，扫描 {result['scanned']} 个游戏。")
+        return result
+    
+    def create_watcher(self, backend: str = "auto", poll_interval: float = 5.0) -> Optional[FileWatcher]:
+        """
+        创建工坊目录的监视器: WorkshopFileInfos.json 或Mod存档JSON变化后增量扫描。
+        订阅更新时会一次改写许多Mod存档JSON，所有文件共用一个去抖计时，一批变化只扫描一次。
+        TTS数据目录未配置时返回None。
+        """
+        if backend == "off" or not cfg.TTS_DATA_DIRECTORY or not os.path.exists(cfg.TTS_DATA_DIRECTORY):
+            return None
+        workshop_dir = os.path.join(cfg.TTS_DATA_DIRECTORY, "Mods", "Workshop")
+        return FileWatcher(
+            workshop_dir,
+            lambda path: self.scan_workshop_changes(),
+            lambda path: path.lower().endswith(".json"),
+            backend=backend,
+            poll_interval=poll_interval,
+            recursive=False,
+            name="workshop-watcher",
+            coalesce=True,
+        )
+    
+    def _workshop_item_key(self, item: Any) -> Optional[str]:
+        """工坊物品在扫描状态中的键 (Mod的 "Directory")"""
+        if not isinstance(item, dict):
+            return None
+        directory = item.get("Directory")
+        return directory if isinstance(directory, str) and directory else None
+    
+    def _workshop_signatures(self, workshop_items: List[Dict], workshop_file_infos_path: str) -> Dict[str, Dict]:
+        """
+        每个工坊物品的特征: 名称、工坊更新时间和Mod存档JSON的修改时间。
+        Mod JSON 在清单更新之后才下载完成时，修改时间的变化会让它在下次增量扫描时被重新扫描。
+        """
+        signatures = {}
+        for item in workshop_items:
+            key = self._workshop_item_key(item)
+            name = item.get("Name") if key else None
+            if not key or not name:
+                continue
+            game_json_path = self._resolve_game_json_path(item, workshop_file_infos_path, verbose=False)
+            try:
+                json_mtime = os.path.getmtime(game_json_path) if game_json_path else None
+            except OSError:
+                json_mtime = None
+            signatures[key] = {
+                "name": name.strip() if isinstance(name, str) else name,
+                "update_time": item.get("UpdateTime"),
+                "json_mtime": json_mtime,
+            }
+        return signatures
+    
+    def _load_scan_state(self) -> Dict[str, Dict]:
+        """读取上次扫描记录的工坊条目特征"""
+        if os.path.exists(self.scan_state_file):
+            try:
+                with open(self.scan_state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("version") == SCAN_STATE_VERSION:
+                    return state.get("entries", {})
+            except (json.JSONDecodeError, AttributeError):
+                print(f"警告: {self.scan_state_file} 解析失败，将重新扫描所有Mod")
+        return {}
+    
+    def _save_scan_state(self, entries: Dict[str, Dict]):
+        """保存本次扫描的工坊条目特征"""
+        os.makedirs(os.path.dirname(self.scan_state_file), exist_ok=True)
+        with open(self.scan_state_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": SCAN_STATE_VERSION, "entries": entries}, f, ensure_ascii=False)
     
     def _scan_workshop_game_json(self, game_json_path: str, game_name: str):
         """扫描单个工坊游戏的JSON文件，查找Custom_PDF并提取规则书引用。"""
@@ -271,24 +439,7 @@ class WorkshopManager:
                 print(f"  规则书 {ref_url} 已为游戏 '{game_name}' 处理过，跳过。")
                 continue
             
-            # 从引用中提取文件名，移除查询参数和片段
-            try:
-                parsed_url = pathlib.PurePosixPath(ref_url.split('?')[0].split('#')[0])
-                filename = parsed_url.name
-                if not filename or not filename.lower().endswith('.pdf'):
-                    filename = original_source_name or "rulebook.pdf" # 后备文件名
-            except Exception:
-                filename = original_source_name or "rulebook.pdf"
-            
-            # 创建一个对文件名更友好的 slug
-            slugified_name_part = self.slugify(os.path.splitext(filename)[0])
-            # 确保文件名不会太长，并尝试保持唯一性
-            timestamp_suffix = hex(abs(hash(ref_url)))[2:10] # 使用哈希的一部分增加唯一性
-            max_len_slug = 30
-            if len(slugified_name_part) > max_len_slug:
-                slugified_name_part = slugified_name_part[:max_len_slug]
-            
-            normalized_filename = f"rulebook_{slugified_name_part}_{timestamp_suffix}.md"
+            normalized_filename = self._rulebook_filename(ref_url, original_source_name)
             
             # 创建规则书缓存文件
             editable_text_path = self.rulebook_manager.create_rulebook_file(game_name, normalized_filename)
@@ -310,38 +461,277 @@ class WorkshopManager:
         self.processed_mods[game_name]["rulebooks"] = current_rulebooks
         # 保存通常在扫描所有workshop items之后进行，或在create_default_rulebook_entry中单独进行
     
+    def _rulebook_slug(self, ref_url: str, original_source_name: Optional[str] = None) -> str:
+        """规则书文件名中由PDF文件名生成的部分"""
+        # 从引用中提取文件名，移除查询参数和片段
+        try:
+            parsed_url = pathlib.PurePosixPath(ref_url.split('?')[0].split('#')[0])
+            filename = parsed_url.name
+            if not filename or not filename.lower().endswith('.pdf'):
+                filename = original_source_name or "rulebook.pdf" # 后备文件名
+        except Exception:
+            filename = original_source_name or "rulebook.pdf"
+        
+        # 创建一个对文件名更友好的 slug，并确保文件名不会太长
+        return self.slugify(os.path.splitext(filename)[0])[:RULEBOOK_SLUG_MAX_LENGTH]
+    
+    def _rulebook_filename(self, ref_url: str, original_source_name: Optional[str] = None) -> str:
+        """
+        规则书缓存文件名: rulebook_<slug>_<URL的SHA-1摘要前8位>.md。
+        同一URL在任何进程中都得到相同的文件名，重新扫描不会产生重复文件。
+        """
+        digest = hashlib.sha1(ref_url.encode('utf-8')).hexdigest()[:RULEBOOK_URL_DIGEST_LENGTH]
+        return f"rulebook_{self._rulebook_slug(ref_url, original_source_name)}_{digest}.md"
+    
+    def migrate_rulebook_filenames(self) -> Dict[str, int]:
+        """
+        迁移旧版本以进程内随机的 hash() 命名的规则书文件: 每个规则书只保留一个文件，并改名为确定的文件名。
+        同一规则书的多个文件 (元数据中的文件、同名前缀的历史重复文件) 中，优先保留用户已填写的内容，
+        其次保留最近修改的文件；与保留内容相同或仍是模板的重复文件被删除，其余用户内容改名为 .md.bak 备份。
+        
+        Returns:
+            Dict: {"renamed": 改名的规则书数, "removed": 删除的重复文件数, "backed_up": 备份的重复文件数}
+        """
+        counts = {"renamed": 0, "removed": 0, "backed_up": 0}
+        with self._lock:
+            changed = False
+            for game_name, game_data in list(self.processed_mods.items()):
+                rulebooks = game_data.get("rulebooks", {})
+                url_rulebooks = {
+                    pdf_key: info for pdf_key, info in rulebooks.items()
+                    if info.get("original_source") and not pdf_key.startswith("default_for_")
+                }
+                slugs = [self._rulebook_slug(info["original_source"]) for info in url_rulebooks.values()]
+                for pdf_key, info in url_rulebooks.items():
+                    expected_filename = self._rulebook_filename(info["original_source"])
+                    current_path = info.get("editable_text_path")
+                    if not current_path:
+                        continue
+                    game_dir = os.path.dirname(current_path)
+                    expected_path = os.path.join(game_dir, expected_filename)
+                    slug = self._rulebook_slug(info["original_source"])
+                    # 同一游戏中有多个同名PDF时无法判断历史文件属于哪个规则书，只处理元数据中的文件
+                    candidates = self._rulebook_file_candidates(
+                        game_dir, slug, include_orphans=slugs.count(slug) == 1
+                    )
+                    for path in (current_path, expected_path):
+                        if os.path.exists(path) and path not in candidates:
+                            candidates.append(path)
+                    if candidates:
+                        self._merge_rulebook_files(game_name, candidates, expected_path, counts)
+                    if info.get("normalized_filename") != expected_filename or current_path != expected_path:
+                        info["normalized_filename"] = expected_filename
+                        info["editable_text_path"] = expected_path
+                        counts["renamed"] += 1
+                        changed = True
+            if changed:
+                self._save_processed_mods()
+        if any(counts.values()):
+            print(f"规则书文件迁移完成: 改名 {counts['renamed']}，删除重复 {counts['removed']}，"
+                  f"备份 {counts['backed_up']} 个文件。")
+        return counts
+    
+    def _rulebook_file_candidates(self, game_dir: str, slug: str, include_orphans: bool) -> List[str]:
+        """游戏目录中可能属于同一规则书的文件 (rulebook_<slug>_<摘要>.md)"""
+        if not include_orphans or not os.path.isdir(game_dir):
+            return []
+        pattern = re.compile(rf"^rulebook_{re.escape(slug)}_[0-9a-f]{{1,{RULEBOOK_URL_DIGEST_LENGTH}}}\.md$")
+        return [os.path.join(game_dir, name) for name in sorted(os.listdir(game_dir)) if pattern.match(name)]
+    
+    def _merge_rulebook_files(self, game_name: str, candidates: List[str], expected_path: str, counts: Dict[str, int]):
+        """在 candidates 中选出保留的文件并移动到 expected_path，处理其余重复文件"""
+        def rank(path: str):
+            return (not self.rulebook_manager.is_template_content(path, game_name), os.path.getmtime(path))
+        
+        keep_path = max(candidates, key=rank)
+        with open(keep_path, 'rb') as f:
+            keep_content = f.read()
+        for path in candidates:
+            if path == keep_path:
+                continue
+            with open(path, 'rb') as f:
+                content = f.read()
+            if content == keep_content or self.rulebook_manager.is_template_content(path, game_name):
+                os.remove(path)
+                counts["removed"] += 1
+            else:
+                backup_path = f"{path}.bak"
+                os.replace(path, backup_path)
+                counts["backed_up"] += 1
+                print(f"警告: '{game_name}' 的规则书有多个不同内容的文件，已保留 {os.path.basename(keep_path)}，"
+                      f"{os.path.basename(path)} 备份为 {os.path.basename(backup_path)}")
+        if keep_path != expected_path:
+            self.rulebook_manager.move_rulebook_file(game_name, keep_path, os.path.basename(expected_path))
+    
     def create_default_rulebook_entry(self, game_name: str):
         """为游戏创建默认的规则书条目"""
-        if game_name not in self.processed_mods:
-            self.processed_mods[game_name] = {
-                "_game_display_name": game_name,
-                "rulebooks": {}
-            }
+        with self._lock:
+            if game_name not in self.processed_mods:
+                self.processed_mods[game_name] = {
+                    "_game_display_name": game_name,
+                    "rulebooks": {}
+                }
         
-        # 默认规则书标识符
-        default_key = f"default_for_{self.slugify(game_name)}" # slugify game_name for key
+            # 默认规则书标识符
+            default_key = f"default_for_{self.slugify(game_name)}" # slugify game_name for key
         
-        # 如果默认规则书已经存在，跳过
-        if default_key in self.processed_mods[game_name].get("rulebooks", {}):
-            return
+            # 如果默认规则书已经存在，跳过
+            if default_key in self.processed_mods[game_name].get("rulebooks", {}):
+                return
         
-        # 创建默认规则书文件名
-        normalized_filename = f"rulebook_default_for_{self.slugify(game_name)}.md"
+            # 创建默认规则书文件名
+            normalized_filename = f"rulebook_default_for_{self.slugify(game_name)}.md"
         
-        # 创建规则书缓存文件
-        editable_text_path = self.rulebook_manager.create_rulebook_file(game_name, normalized_filename)
+            # 创建规则书缓存文件
+            editable_text_path = self.rulebook_manager.create_rulebook_file(game_name, normalized_filename)
         
-        # 添加规则书元数据
-        self.processed_mods[game_name]["rulebooks"][default_key] = {
-            "original_source": default_key,
-            "normalized_filename": normalized_filename,
-            "editable_text_path": str(editable_text_path), #确保是字符串
-            "status": "awaiting_user_content",
-            "display_id": str(len(self.processed_mods[game_name]["rulebooks"]) + 1)
-        }
+            # 添加规则书元数据
+            self.processed_mods[game_name]["rulebooks"][default_key] = {
+                "original_source": default_key,
+                "normalized_filename": normalized_filename,
+                "editable_text_path": str(editable_text_path), #确保是字符串
+                "status": "awaiting_user_content",
+                "display_id": str(len(self.processed_mods[game_name]["rulebooks"]) + 1)
+            }
         
-        # 保存更新
-        self._save_processed_mods()
+            # 保存更新
+            self._save_processed_mods()
+    
+    def plan_imported_rulebook(self, game_name: str, pdf_identifier_key: str, info: Dict) -> Tuple[str, str]:
+        """
+        为从索引包导入的规则书确定缓存文件路径和显示编号，不修改任何数据。
+        已有同一规则书 (相同的 pdf_identifier_key) 时沿用其文件和编号; 否则包中的编号未被占用时保留该编号。
+
+        Returns:
+            (规则书缓存文件路径, 显示编号)
+        """
+        with self._lock:
+            rulebooks = self.processed_mods.get(game_name, {}).get("rulebooks", {})
+            existing = rulebooks.get(pdf_identifier_key)
+            if existing and existing.get("editable_text_path"):
+                return existing["editable_text_path"], existing.get("display_id")
+
+            normalized_filename = info.get("normalized_filename") or f"rulebook_{self.slugify(pdf_identifier_key)}.md"
+            editable_text_path = self.rulebook_manager.rulebook_file_path(game_name, normalized_filename)
+            used_ids = {rulebook.get("display_id") for rulebook in rulebooks.values()}
+            display_id = info.get("display_id")
+            next_id = len(rulebooks) + 1
+            while not display_id or display_id in used_ids:
+                display_id, next_id = str(next_id), next_id + 1
+            return editable_text_path, display_id
+
+    def register_imported_rulebook(self, game_name: str, pdf_identifier_key: str, info: Dict,
+                                   editable_text_path: str, display_id: str):
+        """
+        登记从索引包导入的规则书 (路径和编号由 plan_imported_rulebook 确定，在索引和规则书文件都写入后调用)
+        """
+        with self._lock:
+            if game_name not in self.processed_mods:
+                self.processed_mods[game_name] = {
+                    "_game_display_name": game_name,
+                    "rulebooks": {}
+                }
+            rulebooks = self.processed_mods[game_name].setdefault("rulebooks", {})
+            existing = rulebooks.get(pdf_identifier_key)
+            if existing and existing.get("editable_text_path"):
+                existing["status"] = "processed_into_rag"
+            else:
+                rulebooks[pdf_identifier_key] = {
+                    "original_source": info.get("original_source", pdf_identifier_key),
+                    "normalized_filename": os.path.basename(editable_text_path),
+                    "editable_text_path": str(editable_text_path),
+                    "status": "processed_into_rag",
+                    "display_id": display_id
+                }
+            self._save_processed_mods()
+
+    def extract_rulebook_texts(self, game_name: Optional[str] = None,
+                               extractor: Optional[PdfTextExtractor] = None) -> Dict[str, int]:
+        """
+        从TTS缓存的PDF (Mods/PDF) 中提取规则书文本，写入可编辑规则书文件，状态更新为 text_extracted。
+        以下情况跳过: PDF尚未被TTS缓存、PDF和规则书文件都与上次提取时相同、用户已经编辑过规则书文件。
+        
+        Args:
+            game_name: 只处理指定游戏，为None时处理所有游戏
+            extractor: 文本提取器，为None时按配置创建
+        Returns:
+            Dict: {"extracted", "unchanged", "user_edited", "not_cached", "failed"} 各类规则书的数量
+        """
+        counts = {"extracted": 0, "unchanged": 0, "user_edited": 0, "not_cached": 0, "failed": 0}
+        if not cfg.TTS_DATA_DIRECTORY or not os.path.exists(cfg.TTS_DATA_DIRECTORY):
+            return counts
+        if not pypdf_available():
+            if not self._pypdf_warning_shown:
+                print("未安装pypdf库，请使用pip install pypdf安装，规则书PDF文本提取已跳过")
+                self._pypdf_warning_shown = True
+            return counts
+        
+        pdf_index = index_cached_pdfs(os.path.join(cfg.TTS_DATA_DIRECTORY, "Mods", "PDF"))
+        with self._extraction_lock:
+            jobs, targets = [], []
+            with self._lock:
+                for name, game_data in list(self.processed_mods.items()):
+                    if game_name is not None and name != game_name:
+                        continue
+                    for pdf_key, info in list(game_data.get("rulebooks", {}).items()):
+                        source = info.get("original_source") or ""
+                        if not source.lower().startswith(("http://", "https://")):
+                            continue # 默认规则书条目没有对应的PDF
+                        pdf_path = find_cached_pdf(source, pdf_index)
+                        if not pdf_path:
+                            counts["not_cached"] += 1
+                            continue
+                        skip_reason = self._extraction_skip_reason(name, info, pdf_path)
+                        if skip_reason:
+                            counts[skip_reason] += 1
+                            continue
+                        jobs.append((pdf_path, info["editable_text_path"], f"{name} 规则书"))
+                        targets.append((name, pdf_key))
+            
+            if not jobs:
+                return counts
+            
+            print(f"正在从 {len(jobs)} 个PDF中提取规则书文本...")
+            extractor = extractor or PdfTextExtractor(cfg.PDF_EXTRACTION_WORKERS, cfg.PDF_PAGES_PER_TASK)
+            results = extractor.extract_many(jobs)
+            
+            with self._lock:
+                for (name, pdf_key), (pdf_path, text_path, _), result in zip(targets, jobs, results):
+                    if result["error"]:
+                        counts["failed"] += 1
+                        print(f"  提取 '{name}' 的规则书 {os.path.basename(pdf_path)} 失败: {result['error']}")
+                        continue
+                    info = self.processed_mods.get(name, {}).get("rulebooks", {}).get(pdf_key)
+                    if info is None:
+                        continue
+                    info["status"] = "text_extracted"
+                    info["extraction"] = {
+                        "pdf_path": pdf_path,
+                        **pdf_signature(pdf_path),
+                        "pages": result["pages"],
+                        "text_sha256": file_sha256(text_path),
+                    }
+                    counts["extracted"] += 1
+                    print(f"  已提取 '{name}' 的规则书 {info.get('normalized_filename')}: {result['pages']} 页")
+                self._save_processed_mods()
+        
+        print(f"规则书PDF文本提取完成: {counts}")
+        return counts
+    
+    def _extraction_skip_reason(self, game_name: str, info: Dict, pdf_path: str) -> Optional[str]:
+        """判断规则书是否需要(重新)提取，需要时返回None，否则返回 counts 中对应的键"""
+        text_path = info.get("editable_text_path")
+        if not text_path or not os.path.exists(text_path) or \
+                self.rulebook_manager.is_template_content(text_path, game_name):
+            return None
+        previous = info.get("extraction") or {}
+        # 规则书文件不是模板，也不是上次提取的结果: 用户粘贴或修改过，不能覆盖
+        if not previous.get("text_sha256") or file_sha256(text_path) != previous["text_sha256"]:
+            return "user_edited"
+        current = pdf_signature(pdf_path)
+        if all(previous.get(key) == value for key, value in current.items()):
+            return "unchanged"
+        return None
     
     def get_game_rulebook_info(self, game_name: str) -> List[Dict]:
         """获取游戏的规则书信息列表"""
@@ -349,7 +739,7 @@ class WorkshopManager:
         
         game_data = self.processed_mods.get(game_name)
         if game_data:
-            for pdf_key, rulebook_info in game_data.get("rulebooks", {}).items():
+            for pdf_key, rulebook_info in list(game_data.get("rulebooks", {}).items()):
                 rulebooks_data.append({
                     "id": rulebook_info.get("display_id", ""),
                     "name": rulebook_info.get("normalized_filename", pdf_key), # Fallback to key if name is missing
@@ -388,10 +778,11 @@ class WorkshopManager:
     
     def update_rulebook_status(self, game_name: str, pdf_identifier_key: str, status: str):
         """更新规则书状态"""
-        if (game_name in self.processed_mods and 
-            pdf_identifier_key in self.processed_mods[game_name].get("rulebooks", {})):
-            self.processed_mods[game_name]["rulebooks"][pdf_identifier_key]["status"] = status
-            self._save_processed_mods()
+        with self._lock:
+            if (game_name in self.processed_mods and 
+                pdf_identifier_key in self.processed_mods[game_name].get("rulebooks", {})):
+                self.processed_mods[game_name]["rulebooks"][pdf_identifier_key]["status"] = status
+                self._save_processed_mods()
     
     def resolve_rulebook_path(self, game_name: str, identifier: str) -> Optional[str]:
         """根据编号或部分文件名解析规则书路径"""
@@ -424,4 +815,21 @@ class WorkshopManager:
             if info.get("editable_text_path") == path:
                 return pdf_key
         
-        return None 
\ No newline at end of file
+        return None
+    
+    def get_rulebook_display_id(self, game_name: str, pdf_key: Optional[str]) -> Optional[str]:
+        """规则书的显示编号 (tc rulebook 列表中的编号)，用于回答中的出处"""
+        if not pdf_key:
+            return None
+        info = self.processed_mods.get(game_name, {}).get("rulebooks", {}).get(pdf_key)
+        return info.get("display_id") if info else None
+
+    def find_rulebook_by_path(self, path: str) -> Optional[Tuple[str, str]]:
+        """根据规则书缓存文件路径查找所属游戏，返回 (game_name, pdf_identifier_key)，找不到时返回None"""
+        target = os.path.normcase(os.path.abspath(path))
+        for game_name, game_data in list(self.processed_mods.items()):
+            for pdf_key, info in list(game_data.get("rulebooks", {}).items()):
+                editable_text_path = info.get("editable_text_path")
+                if editable_text_path and os.path.normcase(os.path.abspath(editable_text_path)) == target:
+                    return game_name, pdf_key
+        return None
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 游戏访问统计单元测试
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.access_stats import GameAccessStats
+
+
+class TestGameAccessStats(unittest.TestCase):
+    """测试访问记录、排序和持久化"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "stats", "game_access_stats.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_recent_games_ordered_by_last_access(self):
+        stats = GameAccessStats(self.path)
+        stats.record("Game A", now=100)
+        stats.record("Game B", now=300)
+        stats.record("Game C", now=200)
+        stats.record("Game A", now=250)
+        self.assertEqual(stats.recent_games(2), ["Game B", "Game A"])
+        self.assertEqual(stats.recent_games(0), [])
+
+    def test_persists_new_games_immediately_and_flushes_the_rest(self):
+        stats = GameAccessStats(self.path, save_interval=3600)
+        stats.record("Game A", now=100)
+        stats.record("Game A", now=200)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["Game A"]["count"], 1)
+
+        stats.flush()
+        reloaded = GameAccessStats(self.path)
+        self.assertEqual(reloaded.recent_games(5), ["Game A"])
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["Game A"], {"last_access": 200, "count": 2})
+
+    def test_corrupt_file_starts_empty(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        self.assertEqual(GameAccessStats(self.path).recent_games(5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
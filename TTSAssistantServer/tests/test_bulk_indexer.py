@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 批量建立规则书索引单元测试
+"""
+
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+import sys
+import pathlib
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+import config as cfg
+from services.bulk_indexer import (
+    IndexProgress, _format_duration, _start_shared_embeddings, collect_index_jobs, run_bulk_index,
+)
+from services.langchain_manager import INDEX_MANIFEST_FILENAME, LangchainManager
+from services.workshop_manager import WorkshopManager
+
+RULEBOOK_TEXT = "# 规则\n\n## 准备\n\n每位玩家拿取五枚金币。\n\n## 回合\n\n回合结束时手牌上限为七张。\n"
+
+
+class TestBulkIndexer(unittest.TestCase):
+    """测试规则书的收集、进度统计和并行建立索引"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.texts_dir = os.path.join(self.temp_dir, "texts")
+        os.makedirs(self.texts_dir)
+        self.processed_mods_file = os.path.join(self.temp_dir, "processed_mods.json")
+        self.patches = [
+            patch.object(cfg, "PROCESSED_MODS_FILE", self.processed_mods_file),
+            patch.object(cfg, "VECTOR_STORE_DIRECTORY", os.path.join(self.temp_dir, "vector_stores")),
+            patch.object(cfg, "LLM_PROVIDER", "fake"),
+            patch.object(cfg, "EMBEDDING_PROVIDER", "fake"),
+            patch.object(cfg, "RERANKER", "none"),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _write_rulebook(self, name, content):
+        path = os.path.join(self.texts_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def _write_processed_mods(self, games):
+        processed_mods = {
+            game: {"rulebooks": {
+                f"{game}-{i}": {"display_id": str(i + 1), "editable_text_path": path, "status": "pending"}
+                for i, path in enumerate(paths)
+            }}
+            for game, paths in games.items()
+        }
+        with open(self.processed_mods_file, "w", encoding="utf-8") as f:
+            json.dump(processed_mods, f, ensure_ascii=False)
+
+    def test_collect_jobs_skips_templates_and_picks_newest(self):
+        workshop_manager = WorkshopManager()
+        template = workshop_manager.rulebook_manager._generate_template_content("Empty", "empty.md")
+        old = self._write_rulebook("old.md", RULEBOOK_TEXT)
+        new = self._write_rulebook("new.md", RULEBOOK_TEXT + "\n## 胜利\n\n分数最高者获胜。\n")
+        past = time.time() - 60
+        os.utime(old, (past, past))
+        self._write_processed_mods({
+            "Empty": [self._write_rulebook("empty.md", template)],
+            "Missing": [os.path.join(self.texts_dir, "missing.md")],
+            "Two Books": [old, new],
+        })
+        workshop_manager = WorkshopManager()
+
+        with redirect_stdout(io.StringIO()):
+            jobs = collect_index_jobs(workshop_manager)
+        self.assertEqual([job["game_name"] for job in jobs], ["Two Books"])
+        self.assertEqual(jobs[0]["path"], new)
+        self.assertEqual(jobs[0]["rulebook_id"], "2")
+        self.assertEqual(collect_index_jobs(workshop_manager, games=["Empty"]), [])
+
+    def test_progress_reports_throughput_and_eta(self):
+        jobs = [{"game_name": "A", "size": 1000}, {"game_name": "B", "size": 3000}]
+        progress = IndexProgress(jobs)
+        progress.started_at -= 2.0
+        line = progress.update(jobs[0], 50)
+        self.assertIn("[1/2] A: 50 块", line)
+        self.assertIn("块/秒", line)
+        # 剩余字节是已完成的3倍，剩余时间约为已用时间的3倍
+        self.assertIn("剩余约 0:00:06", line)
+        self.assertEqual(_format_duration(3725), "1:02:05")
+
+    def test_parallel_build_is_resumable(self):
+        paths = {game: [self._write_rulebook(f"{game}.md", RULEBOOK_TEXT.replace("规则", game))]
+                 for game in ("Alpha", "Beta", "Gamma")}
+        self._write_processed_mods(paths)
+        manager = LangchainManager()
+        # 模拟上次运行中断前已完成的游戏
+        with redirect_stdout(io.StringIO()):
+            manager.add_rulebook_text(paths["Alpha"][0], "Alpha", rulebook_id="1")
+            summary = run_bulk_index(WorkshopManager(), manager, workers=2)
+
+        self.assertEqual((summary["built"], summary["skipped"], summary["failed"]), (2, 1, 0))
+        self.assertGreater(summary["chunks"], 0)
+        for game in ("Beta", "Gamma"):
+            manifest_path = os.path.join(cfg.VECTOR_STORE_DIRECTORY, game, INDEX_MANIFEST_FILENAME)
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["rulebook_id"], "1")
+            self.assertTrue(manager.is_index_current(paths[game][0], game, "1"))
+        statuses = [info["status"] for game in WorkshopManager().processed_mods.values()
+                    for info in game["rulebooks"].values()]
+        self.assertEqual(statuses, ["processed_into_rag"] * 3)
+
+        with redirect_stdout(io.StringIO()):
+            summary = run_bulk_index(WorkshopManager(), manager, workers=2)
+        self.assertEqual((summary["built"], summary["skipped"]), (0, 3))
+
+    def test_workers_load_own_embeddings_without_unix_sockets(self):
+        manager = LangchainManager()
+        af_unix = socket.AF_UNIX
+        del socket.AF_UNIX
+        try:
+            # 不支持Unix套接字的系统上导入共享Embedding服务模块会失败，不应导入
+            with patch.dict(sys.modules, {"services.embedding_service": None}), redirect_stdout(io.StringIO()):
+                service, overrides = _start_shared_embeddings(manager, self.temp_dir)
+        finally:
+            socket.AF_UNIX = af_unix
+        self.assertEqual((service, overrides), (None, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
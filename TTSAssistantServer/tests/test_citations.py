@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则出处单元测试
+"""
+
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from langchain.schema import Document
+
+from services.citations import PageIndex, annotate_pages, collect_citations, format_citations
+
+
+class TestPageIndex(unittest.TestCase):
+    """测试按字符位置查询页码"""
+
+    def test_page_at_and_range(self):
+        text = "前言\n<!-- page 1 -->\n第一页\n<!--page 2-->\n第二页\n"
+        index = PageIndex(text)
+        self.assertIsNone(index.page_at(0))
+        self.assertEqual(index.page_at(text.index("第一页")), 1)
+        self.assertEqual(index.page_at(len(text)), 2)
+        self.assertEqual(index.page_range(text.index("第一页"), len(text)), (1, 2))
+        self.assertFalse(PageIndex("没有页码标记"))
+
+    def test_annotate_pages_uses_start_index(self):
+        text = "<!-- page 3 -->\n第三页的内容。\n<!-- page 4 -->\n第四页的内容。"
+        docs = [
+            Document(page_content="第三页的内容。", metadata={"start_index": text.index("第三页")}),
+            Document(page_content=text[text.index("第三页"):], metadata={"start_index": text.index("第三页")}),
+            Document(page_content="没有位置", metadata={}),
+        ]
+        annotate_pages(docs, text)
+        self.assertEqual(docs[0].metadata["page"], 3)
+        self.assertNotIn("page_end", docs[0].metadata)
+        self.assertEqual((docs[1].metadata["page"], docs[1].metadata["page_end"]), (3, 4))
+        self.assertNotIn("page", docs[2].metadata)
+
+
+class TestCitationFormatting(unittest.TestCase):
+    """测试出处去重和格式"""
+
+    def test_collect_deduplicates_and_limits(self):
+        docs = [
+            Document(page_content="a", metadata={"rulebook_id": "2", "section_path": "准备", "page": 14}),
+            Document(page_content="b", metadata={"rulebook_id": "2", "section_path": "准备 > 选牌", "page": 14}),
+            Document(page_content="c", metadata={"rulebook_id": "2", "page": 20, "page_end": 21}),
+            Document(page_content="d", metadata={"rulebook_id": "1", "section_path": "回合流程"}),
+            Document(page_content="e", metadata={"source": "rules.md"}),
+        ]
+        citations = collect_citations(docs)
+        self.assertEqual(format_citations(citations), "规则书2 第14页; 规则书2 第20-21页; 规则书1「回合流程」")
+        self.assertEqual(len(collect_citations(docs, max_items=1)), 1)
+
+    def test_format_without_citations(self):
+        self.assertEqual(format_citations([]), "")
+        self.assertEqual(format_citations([{"rulebook_id": None, "section": None, "page": 5, "page_end": None}]), "第5页")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 查询Embedding缓存单元测试
+"""
+
+import threading
+import time
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from langchain_core.embeddings import Embeddings
+
+from services.embedding_cache import CachedQueryEmbeddings, normalize_query
+
+
+class FakeEmbeddings(Embeddings):
+    """记录调用次数的假Embedding，按文本长度返回向量"""
+
+    def __init__(self, delay: float = 0.0):
+        self.model = "fake-model"
+        self.delay = delay
+        self.document_calls = []
+        self.query_calls = []
+
+    def embed_documents(self, texts):
+        time.sleep(self.delay)
+        self.document_calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.delay)
+        self.query_calls.append(text)
+        return [float(len(text)), 1.0]
+
+
+class SlowQueryOnlyEmbeddings(FakeEmbeddings):
+    """不在对称提供商列表中，只能逐条计算查询"""
+
+
+class TestCachedQueryEmbeddings(unittest.TestCase):
+    """测试查询Embedding的缓存、合并和微批处理"""
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  怎么　获胜？ "), "怎么 获胜?")
+
+    def test_repeated_query_hits_cache(self):
+        provider = FakeEmbeddings()
+        cached = CachedQueryEmbeddings(provider, batch_window_ms=0)
+        first = cached.embed_query("怎样才能获胜？")
+        second = cached.embed_query(" 怎样才能获胜? ")
+        self.assertEqual(first, second)
+        self.assertEqual(len(provider.document_calls), 1)
+        stats = cached.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 0.5)
+
+    def test_concurrent_queries_are_batched(self):
+        provider = FakeEmbeddings(delay=0.01)
+        cached = CachedQueryEmbeddings(provider, batch_window_ms=50)
+        questions = [f"问题{i}" for i in range(5)] + ["问题0"]
+        results = {}
+
+        def worker(index, question):
+            results[index] = cached.embed_query(question)
+
+        threads = [threading.Thread(target=worker, args=(i, q)) for i, q in enumerate(questions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), len(questions))
+        self.assertEqual(len(provider.document_calls), 1)
+        self.assertEqual(sorted(provider.document_calls[0]), sorted(set(questions)))
+        self.assertEqual(results[0], results[5])
+
+    def test_provider_without_batch_support(self):
+        provider = SlowQueryOnlyEmbeddings()
+        cached = CachedQueryEmbeddings(provider)
+        cached.embed_query("问题")
+        cached.embed_query("问题")
+        self.assertEqual(provider.query_calls, ["问题"])
+        self.assertEqual(provider.document_calls, [])
+
+    def test_errors_are_not_cached(self):
+        provider = SlowQueryOnlyEmbeddings()
+        provider.embed_query = lambda text: (_ for _ in ()).throw(RuntimeError("服务不可用"))
+        cached = CachedQueryEmbeddings(provider)
+        with self.assertRaises(RuntimeError):
+            cached.embed_query("问题")
+        self.assertEqual(cached.stats()["cache_size"], 0)
+
+    def test_cache_is_bounded(self):
+        cached = CachedQueryEmbeddings(FakeEmbeddings(), cache_size=2, batch_window_ms=0)
+        for question in ["一", "二", "三"]:
+            cached.embed_query(question)
+        self.assertEqual(cached.stats()["cache_size"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 共享Embedding服务单元测试
+"""
+
+import importlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import sys
+import pathlib
+from unittest.mock import patch
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.embedding_cache import embedding_model_key
+import services.embedding_service as embedding_service
+from services.embedding_service import EmbeddingService, EmbeddingServiceClient, EmbeddingServiceError
+from services.fake_providers import HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """记录每次批量调用的文本数"""
+
+    def __init__(self, **kwargs):
+        super().__init__(size=32, **kwargs)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        if "boom" in texts:
+            raise ValueError("模型推理失败")
+        return super().embed_documents(texts)
+
+
+class TestEmbeddingService(unittest.TestCase):
+    """测试Unix套接字服务和客户端"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, "embeddings.sock")
+        self.embeddings = CountingEmbeddings(latency_ms=20)
+        self.service = EmbeddingService(self.embeddings, self.socket_path).start()
+
+    def tearDown(self):
+        self.service.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_client_matches_in_process_embeddings(self):
+        client = EmbeddingServiceClient(self.socket_path, connect_timeout=1)
+        texts = ["每位玩家拿取五枚金币", "回合结束时弃掉多余的手牌"]
+        expected = HashingEmbeddings(size=32).embed_documents(texts)
+        for actual, wanted in zip(client.embed_documents(texts), expected):
+            for a, b in zip(actual, wanted):
+                self.assertAlmostEqual(a, b, places=6)
+        self.assertEqual(len(client.embed_query("抽牌")), 32)
+        self.assertEqual(client.embed_documents([]), [])
+        # 客户端使用服务端模型的标识，切换到共享服务不会触发索引重建
+        self.assertEqual(embedding_model_key(client), embedding_model_key(self.embeddings))
+
+    def test_concurrent_requests_are_batched(self):
+        client = EmbeddingServiceClient(self.socket_path, connect_timeout=1)
+        self.embeddings.calls.clear()
+        threads = [threading.Thread(target=client.embed_query, args=(f"问题{i}",)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(self.embeddings.calls), 12)
+        self.assertLess(len(self.embeddings.calls), 12)
+
+    def test_server_error_raised_to_client(self):
+        client = EmbeddingServiceClient(self.socket_path, connect_timeout=1)
+        with self.assertRaises(EmbeddingServiceError):
+            client.embed_documents(["boom"])
+        # 出错后连接仍可继续使用
+        self.assertEqual(len(client.embed_documents(["正常"])), 1)
+
+    def test_client_reconnects_after_service_restart(self):
+        client = EmbeddingServiceClient(self.socket_path, connect_timeout=1)
+        client.embed_query("第一次")
+        self.service.stop()
+        self.service = EmbeddingService(self.embeddings, self.socket_path).start()
+        self.assertEqual(len(client.embed_query("重启后")), 32)
+
+    def test_connect_timeout_without_service(self):
+        with self.assertRaises(ConnectionError):
+            EmbeddingServiceClient(os.path.join(self.temp_dir, "missing.sock"), connect_timeout=0.3)
+
+
+class TestWithoutUnixSockets(unittest.TestCase):
+    """测试不支持Unix套接字的系统 (Windows)"""
+
+    def test_import_and_clear_error(self):
+        af_unix = socket.AF_UNIX
+        del socket.AF_UNIX
+        try:
+            with patch.dict(sys.modules):
+                sys.modules.pop("services.embedding_service")
+                module = importlib.import_module("services.embedding_service")
+            self.assertFalse(module.UNIX_SOCKETS_SUPPORTED)
+            with self.assertRaisesRegex(ConnectionError, "不支持Unix套接字"):
+                module.EmbeddingService(HashingEmbeddings(size=8), "embeddings.sock").start()
+            with self.assertRaisesRegex(ConnectionError, "不支持Unix套接字"):
+                module.EmbeddingServiceClient("embeddings.sock", connect_timeout=0)
+        finally:
+            socket.AF_UNIX = af_unix
+        self.assertTrue(embedding_service.UNIX_SOCKETS_SUPPORTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
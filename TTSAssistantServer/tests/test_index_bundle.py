@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 索引包导出/导入单元测试
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import sys
+import pathlib
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+import config as cfg
+from services.fake_providers import HashingEmbeddings
+from services.index_bundle import IndexBundleError, export_index_bundle, import_index_bundle
+from services.langchain_manager import LangchainManager
+from services.workshop_manager import WorkshopManager
+
+RULEBOOK_TEXT = "# 规则\n\n## 准备\n\n每位玩家拿取五枚金币。\n\n## 回合\n\n回合结束时手牌上限为七张。\n"
+PDF_KEY = "http://example.com/rules.pdf"
+
+
+class TestIndexBundle(unittest.TestCase):
+    """测试在一台机器上导出、在另一台机器 (另一组数据目录) 上导入索引包"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle_path = os.path.join(self.temp_dir, "game.ttsindex.tar.gz")
+        self.patches = [
+            patch.object(cfg, "LLM_PROVIDER", "fake"),
+            patch.object(cfg, "EMBEDDING_PROVIDER", "fake"),
+            patch.object(cfg, "RERANKER", "none"),
+        ]
+        for p in self.patches:
+            p.start()
+        self._use_machine("source")
+        workshop_manager = WorkshopManager()
+        rulebook_path = workshop_manager.rulebook_manager.create_rulebook_file("Gizmos", "rulebook_gizmos.md")
+        with open(rulebook_path, "w", encoding="utf-8") as f:
+            f.write(RULEBOOK_TEXT)
+        workshop_manager.processed_mods["Gizmos"] = {"rulebooks": {PDF_KEY: {
+            "original_source": PDF_KEY, "normalized_filename": "rulebook_gizmos.md",
+            "editable_text_path": rulebook_path, "status": "processed_into_rag", "display_id": "1",
+        }}}
+        workshop_manager._save_processed_mods()
+        with redirect_stdout(io.StringIO()):
+            manager = LangchainManager()
+            manager.add_rulebook_text(rulebook_path, "Gizmos", rulebook_id="1")
+            export_index_bundle(manager, workshop_manager, "Gizmos", self.bundle_path)
+        self._use_machine("target")
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _use_machine(self, name):
+        """切换到另一组数据目录，模拟另一台机器"""
+        root = os.path.join(self.temp_dir, name)
+        for key, path in (("VECTOR_STORE_DIRECTORY", "vector_stores"), ("PROCESSED_MODS_FILE", "processed_mods.json"),
+                          ("EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY", "texts")):
+            p = patch.object(cfg, key, os.path.join(root, path))
+            p.start()
+            self.patches.append(p)
+
+    def _import(self, **kwargs):
+        manager, workshop_manager = LangchainManager(), WorkshopManager()
+        with redirect_stdout(io.StringIO()):
+            result = import_index_bundle(manager, workshop_manager, self.bundle_path, **kwargs)
+        return manager, workshop_manager, result
+
+    def test_import_is_verified_and_needs_no_rebuild(self):
+        manager, workshop_manager, result = self._import()
+        self.assertEqual(result["game_name"], "Gizmos")
+        self.assertEqual(result["rulebook_id"], "1")
+        with open(result["rulebook_path"], "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), RULEBOOK_TEXT)
+        self.assertTrue(result["rulebook_path"].startswith(cfg.EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY))
+        self.assertEqual(WorkshopManager().check_auto_load_rulebook("Gizmos")["status"], "processed_into_rag")
+
+        with patch.object(manager, "_build_rulebook_index") as build, redirect_stdout(io.StringIO()):
+            rebuilt = manager.add_rulebook_text(result["rulebook_path"], "Gizmos", skip_if_unchanged=True,
+                                                rulebook_id="1")
+            retriever = manager.load_or_get_retriever("Gizmos")
+        self.assertFalse(rebuilt)
+        build.assert_not_called()
+        docs = retriever.invoke("手牌上限")
+        self.assertTrue(any("七张" in doc.page_content for doc in docs))
+        self.assertEqual(os.listdir(cfg.VECTOR_STORE_DIRECTORY), ["Gizmos"])
+
+    def test_import_relabels_rulebook_id_when_taken(self):
+        workshop_manager = WorkshopManager()
+        workshop_manager.create_default_rulebook_entry("Gizmos")
+        manager, _, result = self._import()
+        self.assertEqual(result["rulebook_id"], "2")
+        self.assertTrue(manager.is_index_current(result["rulebook_path"], "Gizmos", "2"))
+        with redirect_stdout(io.StringIO()):
+            docs = manager.load_or_get_retriever("Gizmos").invoke("金币")
+        self.assertEqual({doc.metadata["rulebook_id"] for doc in docs}, {"2"})
+
+    def test_import_under_another_game_name(self):
+        manager, _, result = self._import(game_name="Gizmos (中文)")
+        self.assertTrue(manager.is_index_current(result["rulebook_path"], "Gizmos (中文)", "1"))
+
+    def test_import_into_shared_segment(self):
+        with patch.object(cfg, "SHARED_INDEX_SEGMENTS", True):
+            manager, _, result = self._import()
+            _, _, copy = self._import(game_name="Gizmos (重制版)")
+            segment = manager._manifest_segment("Gizmos")
+            self.assertIsNotNone(segment)
+            self.assertEqual(manager._manifest_segment("Gizmos (重制版)"), segment)
+            self.assertTrue(manager.is_index_current(copy["rulebook_path"], "Gizmos (重制版)", "1"))
+            with redirect_stdout(io.StringIO()):
+                docs = manager.load_or_get_retriever("Gizmos (重制版)").invoke("手牌上限")
+                # 从共享段导出的索引包与原来的相同
+                export_index_bundle(manager, WorkshopManager(), "Gizmos", self.bundle_path)
+            self.assertTrue(any("七张" in doc.page_content for doc in docs))
+        self._use_machine("third")
+        _, _, result = self._import()
+        self.assertEqual(result["chunks"], copy["chunks"])
+
+    def test_refuses_different_embedding_model(self):
+        manager, workshop_manager = LangchainManager(), WorkshopManager()
+        manager.embeddings = HashingEmbeddings(size=64)
+        with self.assertRaisesRegex(IndexBundleError, "Embedding模型不一致"), redirect_stdout(io.StringIO()):
+            import_index_bundle(manager, workshop_manager, self.bundle_path)
+        self.assertFalse(workshop_manager.has_game("Gizmos"))
+        self.assertEqual(os.listdir(cfg.VECTOR_STORE_DIRECTORY), [])
+
+    def test_failed_install_leaves_game_unregistered(self):
+        manager, workshop_manager = LangchainManager(), WorkshopManager()
+        with patch.object(manager, "install_index_directory", side_effect=OSError("改名失败")), \
+                redirect_stdout(io.StringIO()):
+            with self.assertRaises(OSError):
+                import_index_bundle(manager, workshop_manager, self.bundle_path)
+        self.assertFalse(workshop_manager.has_game("Gizmos"))
+        self.assertFalse(WorkshopManager().has_game("Gizmos"))
+        self.assertFalse(os.path.exists(cfg.EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY)
+                         and any(files for _, _, files in os.walk(cfg.EDITABLE_RULEBOOK_TEXT_CACHE_DIRECTORY)))
+        self.assertEqual(os.listdir(cfg.VECTOR_STORE_DIRECTORY), [])
+        # 失败后可以重新导入
+        _, _, result = self._import()
+        self.assertEqual(result["rulebook_id"], "1")
+
+    def test_refuses_different_chunking_config(self):
+        with patch.object(cfg, "CHUNK_SIZE", cfg.CHUNK_SIZE + 100):
+            with self.assertRaisesRegex(IndexBundleError, "chunk_size"):
+                self._import()
+
+    def test_refuses_corrupted_bundle(self):
+        tampered_path = os.path.join(self.temp_dir, "tampered.tar.gz")
+        with tarfile.open(self.bundle_path, "r:gz") as source, tarfile.open(tampered_path, "w:gz") as tampered:
+            for member in source:
+                data = source.extractfile(member).read()
+                if member.name == "rulebook.md":
+                    data = data.replace("七".encode("utf-8"), "八".encode("utf-8"))
+                member.size = len(data)
+                tampered.addfile(member, io.BytesIO(data))
+        self.bundle_path = tampered_path
+        with self.assertRaisesRegex(IndexBundleError, "校验失败"):
+            self._import()
+
+
+if __name__ == "__main__":
+    unittest.main()
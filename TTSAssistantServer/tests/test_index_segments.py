@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 共享索引段单元测试
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.index_segments import SegmentStore, segment_key
+
+
+class TestSegmentStore(unittest.TestCase):
+    """测试段的安装和引用计数"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SegmentStore(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _staged(self):
+        staging_path = self.store.staging_path()
+        with open(os.path.join(staging_path, "index.faiss"), "wb") as f:
+            f.write(b"index")
+        return staging_path
+
+    def test_segment_key_depends_on_every_field(self):
+        fingerprint = {"content_sha256": "abc", "chunk_size": 500, "rulebook_id": "1"}
+        self.assertEqual(segment_key(fingerprint), segment_key(dict(reversed(list(fingerprint.items())))))
+        self.assertNotEqual(segment_key(fingerprint), segment_key({**fingerprint, "rulebook_id": "2"}))
+
+    def test_install_once(self):
+        self.assertFalse(self.store.exists("k"))
+        self.assertTrue(self.store.install("k", self._staged()))
+        # 同一段已被其他进程建立时丢弃自己的临时目录
+        second = self._staged()
+        self.assertFalse(self.store.install("k", second))
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(self.store.exists("k"))
+
+    def test_release_deletes_after_last_reference(self):
+        self.store.install("k", self._staged())
+        self.store.add_ref("k", "Game A")
+        self.store.add_ref("k", "Game B")
+        self.store.add_ref("k", "Game B")
+        self.assertEqual(sorted(self.store.refs("k")), ["Game A", "Game B"])
+        self.assertFalse(self.store.release("k", "Game A"))
+        self.assertFalse(self.store.release("k", "Game A"))
+        self.assertTrue(self.store.exists("k"))
+        self.assertTrue(self.store.release("k", "Game B"))
+        self.assertFalse(os.path.exists(self.store.path("k")))
+        self.assertFalse(self.store.release("k", "Game B"))
+
+
+if __name__ == "__main__":
+    unittest.main()
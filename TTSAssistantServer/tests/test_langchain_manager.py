@@ -11,6 +11,7 @@ import sys
 import pathlib
 import tempfile
 import shutil # Added for robust cleanup
+import threading
 from unittest.mock import patch, MagicMock, ANY
 
 # 添加父目录到导入路径
@@ -18,6 +19,12 @@ sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
 
 # 导入测试目标
 from services.langchain_manager import LangchainManager, ChatMessageHistory
+from services.condense_policy import decide_condense, looks_self_contained, format_chat_history
+from services.context_builder import merge_overlapping_chunks, build_context
+from services.chat_memory import RollingSummaryMemory, TokenBudgetMemory
+from services.request_trace import RequestTrace
+from langchain.schema import Document
+from langchain.schema.messages import HumanMessage, AIMessage
 import config as cfg # Import config directly for patching
 
 # Helper to create a dummy markdown file
@@ -53,6 +60,159 @@ class TestChatMessageHistory(unittest.TestCase):
         history.clear()
         self.assertEqual(len(history.messages), 0)
 
+class TestCondensePolicy(unittest.TestCase):
+    """测试问题改写策略"""
+
+    def setUp(self):
+        self.history = [HumanMessage(content="抽牌阶段每人抽几张牌？"), AIMessage(content="每人抽两张。")]
+
+    def test_no_history_skips_condense(self):
+        self.assertEqual(decide_condense("那弃牌呢？", [], "always"), (False, "no_history"))
+
+    def test_self_contained_question_skips_in_auto_mode(self):
+        question = "游戏开始时每位玩家拿多少金币？"
+        self.assertTrue(looks_self_contained(question))
+        self.assertEqual(decide_condense(question, self.history, "auto"), (False, "self_contained"))
+        # always 模式下保持Langchain原有行为
+        self.assertEqual(decide_condense(question, self.history, "always"), (True, "condense"))
+
+    def test_follow_up_question_is_condensed(self):
+        for question in ["那弃牌阶段呢？", "它可以被复制吗？", "为什么？", "What about it?"]:
+            self.assertFalse(looks_self_contained(question), question)
+            self.assertEqual(decide_condense(question, self.history, "auto"), (True, "condense"))
+
+    def test_never_mode(self):
+        self.assertEqual(decide_condense("为什么？", self.history, "never"), (False, "disabled"))
+
+    def test_format_chat_history(self):
+        self.assertEqual(
+            format_chat_history(self.history),
+            "Human: 抽牌阶段每人抽几张牌？\nAssistant: 每人抽两张。",
+        )
+
+
+class TestContextBuilder(unittest.TestCase):
+    """测试上下文构建 (合并重叠块、token预算)"""
+
+    def setUp(self):
+        self.text = "".join(f"第{i}条规则：玩家在回合开始时抽一张牌。" for i in range(60))
+
+    def _chunk(self, start, end, source="rules.md"):
+        return Document(page_content=self.text[start:end], metadata={"source": source, "start_index": start})
+
+    def test_merge_by_start_index(self):
+        docs = [self._chunk(80, 200), self._chunk(300, 400), self._chunk(0, 100)]
+        merged = merge_overlapping_chunks(docs)
+        self.assertEqual(len(merged), 2)
+        # 合并后的块排在其成员最高相关度的位置
+        self.assertEqual(merged[0].page_content, self.text[0:200])
+        self.assertEqual(merged[0].metadata["start_index"], 0)
+        self.assertEqual(merged[1].page_content, self.text[300:400])
+
+    def test_merge_by_text_overlap_without_start_index(self):
+        first = Document(page_content=self.text[0:150], metadata={"source": "rules.md"})
+        second = Document(page_content=self.text[100:250], metadata={"source": "rules.md"})
+        other_source = Document(page_content=self.text[100:250], metadata={"source": "other.md"})
+        merged = merge_overlapping_chunks([second, first, other_source])
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0].page_content, self.text[0:250])
+
+    def test_budget_fills_in_relevance_order(self):
+        docs = [self._chunk(0, 100), self._chunk(500, 900), self._chunk(1000, 1050)]
+        selected, tokens = build_context(docs, token_budget=200)
+        self.assertEqual([doc.page_content for doc in selected], [self.text[0:100], self.text[1000:1050]])
+        self.assertLessEqual(tokens, 200)
+
+    def test_first_chunk_truncated_when_over_budget(self):
+        selected, tokens = build_context([self._chunk(0, 600)], token_budget=50)
+        self.assertEqual(len(selected), 1)
+        self.assertLessEqual(tokens, 50)
+        self.assertTrue(self.text.startswith(selected[0].page_content))
+
+
+class TestTokenBudgetMemory(unittest.TestCase):
+    """测试按token预算截取的对话记忆"""
+
+    def test_trims_oldest_turns_to_budget(self):
+        memory = TokenBudgetMemory(chat_memory=ChatMessageHistory(), return_messages=True, max_token_limit=20)
+        for i in range(5):
+            memory.chat_memory.add_user_message(f"问题{i}" * 3)
+            memory.chat_memory.add_ai_message(f"回答{i}" * 3)
+        messages = memory.load_memory_variables({})["chat_history"]
+        self.assertEqual([m.content for m in messages], ["问题4" * 3, "回答4" * 3])
+        # 完整历史仍然保留
+        self.assertEqual(len(memory.chat_memory.messages), 10)
+
+
+class RecordingSummarizer:
+    """记录摘要提示词的模拟LLM，可阻塞以模拟慢速调用"""
+
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def invoke(self, prompt):
+        self.release.wait(5)
+        self.prompts.append(prompt)
+        return AIMessage(content=f"<think>思考</think>摘要{len(self.prompts)}")
+
+
+class TestRollingSummaryMemory(unittest.TestCase):
+    """测试最近几轮原文加滚动摘要的对话记忆"""
+
+    def setUp(self):
+        self.summarizer = RecordingSummarizer()
+        self.memory = RollingSummaryMemory(
+            chat_memory=ChatMessageHistory(), return_messages=True, output_key="answer",
+            recent_turns=2, summarizer=self.summarizer,
+        )
+
+    def _save_turns(self, start, count):
+        for i in range(start, start + count):
+            self.memory.save_context({"question": f"问题{i}"}, {"answer": f"回答{i}"})
+
+    def test_older_turns_folded_into_summary(self):
+        self._save_turns(0, 2)
+        self.memory.wait_for_summary()
+        self.assertEqual(self.summarizer.prompts, [])
+
+        self._save_turns(2, 4)
+        self.memory.wait_for_summary()
+        messages = self.memory.load_memory_variables({})["chat_history"]
+        self.assertEqual(messages[0].type, "system")
+        self.assertTrue(messages[0].content.endswith(self.memory.summary))
+        self.assertNotIn("<think>", self.memory.summary)
+        self.assertEqual([m.content for m in messages[1:]], ["问题4", "回答4", "问题5", "回答5"])
+        # 并入摘要的消息从历史中删除，历史长度有上限
+        self.assertEqual(len(self.memory.chat_memory.messages), 4)
+        # 每轮原文只进入摘要一次
+        folded = "".join(self.summarizer.prompts)
+        for i in range(4):
+            self.assertEqual(folded.count(f"Human: 问题{i}"), 1)
+
+    def test_summary_is_updated_off_the_request_path(self):
+        self._save_turns(0, 2)
+        self.summarizer.release.clear()
+        self._save_turns(2, 1)
+        # 摘要尚未完成时保存对话不阻塞，提示词仍只含最近两轮
+        messages = self.memory.load_memory_variables({})["chat_history"]
+        self.assertEqual([m.content for m in messages], ["问题1", "回答1", "问题2", "回答2"])
+        self.summarizer.release.set()
+        self.memory.wait_for_summary()
+        self.assertEqual(self.memory.summary, "摘要1")
+
+    def test_clear_discards_pending_summary(self):
+        self._save_turns(0, 2)
+        self.summarizer.release.clear()
+        self._save_turns(2, 1)
+        self.memory.clear()
+        self.summarizer.release.set()
+        self.memory.wait_for_summary()
+        self.assertEqual(self.memory.summary, "")
+        self.assertEqual(self.memory.load_memory_variables({})["chat_history"], [])
+
+
 class TestLangchainManager(unittest.TestCase):
     """测试Langchain管理器类"""
     
@@ -155,6 +315,265 @@ class TestLangchainManager(unittest.TestCase):
         manager.clear_game_state(game_name)
         self.assertFalse(game_name in manager.game_sessions)
 
+    @patch('services.langchain_manager.LangchainManager._initialize_llm')
+    @patch('services.langchain_manager.LangchainManager._initialize_embeddings')
+    def test_get_answer_skips_condense_without_history(self, mock_init_embeddings, mock_init_llm):
+        """首个问题不应触发问题改写，追问时才改写"""
+        mock_init_llm.return_value = MagicMock()
+        mock_init_embeddings.return_value = MagicMock()
+        manager = LangchainManager()
+        manager.game_retrievers["Test Game"] = MagicMock()
+
+        mock_chain = MagicMock()
+        mock_chain.invoke.return_value = {"answer": "<think>...</think>两张。"}
+        with patch('langchain.chains.ConversationalRetrievalChain.from_llm', return_value=mock_chain) as mock_from_llm:
+            answer = manager.get_answer("抽牌阶段每人抽几张牌？", "Test Game", "player1")
+            self.assertEqual(answer, "两张。")
+            get_chat_history = mock_from_llm.call_args[1]['get_chat_history']
+            self.assertEqual(get_chat_history([HumanMessage(content="x")]), "")
+            self.assertNotIn('condense_question_llm', mock_from_llm.call_args[1])
+
+            memory = manager._get_or_create_memory("Test Game", "player1")
+            memory.chat_memory.add_user_message("抽牌阶段每人抽几张牌？")
+            memory.chat_memory.add_ai_message("两张。")
+            manager.get_answer("那弃牌阶段呢？", "Test Game", "player1")
+            get_chat_history = mock_from_llm.call_args[1]['get_chat_history']
+            self.assertEqual(get_chat_history(memory.chat_memory.messages),
+                             "Human: 抽牌阶段每人抽几张牌？\nAssistant: 两张。")
+
+    @patch('services.langchain_manager.LangchainManager._create_llm')
+    @patch('services.langchain_manager.LangchainManager._initialize_embeddings')
+    def test_condense_llm_uses_separate_model(self, mock_init_embeddings, mock_create_llm):
+        """配置了 CONDENSE_LLM_MODEL 时创建独立的改写模型"""
+        mock_init_embeddings.return_value = MagicMock()
+        with patch.object(cfg, 'CONDENSE_LLM_MODEL', 'tiny-model'), \
+             patch.object(cfg, 'CONDENSE_LLM_PROVIDER', 'ollama'):
+            manager = LangchainManager()
+        mock_create_llm.assert_any_call('ollama', 'tiny-model')
+        self.assertIsNotNone(manager.condense_llm)
+
+    def test_add_rulebook_and_get_answer_with_fake_providers(self):
+        """模拟提供商下走完真实的FAISS索引和问答链"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n\n## 回合\n\n每回合抽两张牌。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        manager.add_rulebook_text(rulebook_path, "Fake Game")
+        answer = manager.get_answer("每位玩家起始有多少金币？", "Fake Game", "player1")
+        self.assertTrue(answer.startswith("模拟回答"))
+        self.assertTrue(os.path.exists(os.path.join(self.vector_store_dir, "Fake Game", "index.faiss")))
+
+    def test_get_answer_with_citations(self):
+        """回答附带规则书编号和页码出处"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n<!-- page 14 -->\n\n## 准备\n\n每位玩家拿取五枚金币。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        manager.add_rulebook_text(rulebook_path, "Fake Game", rulebook_id="2")
+        # 规则书编号变化时需要重建索引
+        self.assertFalse(manager.is_index_current(rulebook_path, "Fake Game", rulebook_id="3"))
+
+        with patch.object(cfg, 'ANSWER_CITATIONS', True):
+            answer, citations = manager.get_answer_with_citations("每位玩家起始有多少金币？", "Fake Game", "player1")
+        self.assertTrue(answer.startswith("模拟回答"))
+        self.assertEqual(citations, [{"rulebook_id": "2", "section": "准备", "page": 14, "page_end": None}])
+
+        with patch.object(cfg, 'ANSWER_CITATIONS', False):
+            _, citations = manager.get_answer_with_citations("每位玩家起始有多少金币？", "Fake Game", "player2")
+        self.assertEqual(citations, [])
+
+    def test_speculative_retrieval_on_follow_up(self):
+        """后续问题改写的同时用原问题检索，改写结果相同时复用"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n\n## 回合\n\n每回合抽两张牌。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        manager.add_rulebook_text(rulebook_path, "Fake Game")
+
+        with patch.object(cfg, 'SPECULATIVE_RETRIEVAL', True), patch.object(cfg, 'CONDENSE_QUESTION_MODE', 'always'):
+            first_trace, follow_up_trace = RequestTrace("ask"), RequestTrace("ask")
+            manager.get_answer("每位玩家起始有多少金币？", "Fake Game", "player1", trace=first_trace)
+            answer = manager.get_answer("每回合抽几张牌？", "Fake Game", "player1", trace=follow_up_trace)
+        self.assertTrue(answer.startswith("模拟回答"))
+        # 首个问题没有历史，不改写也不推测
+        self.assertNotIn("speculative_retrieval", first_trace.tags)
+        # 模拟LLM原样返回追问，改写后的问题与原问题相同
+        self.assertEqual(follow_up_trace.tags["speculative_retrieval"], "hit")
+        self.assertIn("speculative_retrieval", follow_up_trace.spans)
+
+    def test_summary_memory_mode(self):
+        """summary 模式下长会话的历史保持有界"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        manager.add_rulebook_text(rulebook_path, "Fake Game")
+        with patch.object(cfg, 'HISTORY_MEMORY_MODE', 'summary'):
+            for i in range(4):
+                manager.get_answer(f"第{i}个问题：每位玩家起始有多少金币？", "Fake Game", "player1")
+                manager._get_or_create_memory("Fake Game", "player1").wait_for_summary()
+        memory = manager._get_or_create_memory("Fake Game", "player1")
+        self.assertIsInstance(memory, RollingSummaryMemory)
+        self.assertTrue(memory.summary)
+        self.assertEqual(len(memory.chat_memory.messages), 2 * cfg.HISTORY_SUMMARY_RECENT_TURNS)
+
+    def test_follow_up_condensed_when_history_is_only_summary(self):
+        """所有对话都已并入摘要时，后续问题仍结合摘要改写"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        manager.add_rulebook_text(rulebook_path, "Fake Game")
+        with patch.object(cfg, 'HISTORY_MEMORY_MODE', 'summary'), \
+                patch.object(cfg, 'HISTORY_SUMMARY_RECENT_TURNS', 0), \
+                patch.object(cfg, 'CONDENSE_QUESTION_MODE', 'auto'):
+            manager.get_answer("每位玩家起始有多少金币？", "Fake Game", "player1")
+            memory = manager._get_or_create_memory("Fake Game", "player1")
+            memory.wait_for_summary()
+            self.assertEqual(memory.chat_memory.messages, [])
+            self.assertTrue(memory.summary)
+            trace = RequestTrace("ask")
+            manager.get_answer("那它呢？", "Fake Game", "player1", trace=trace)
+        self.assertEqual(trace.tags["condense_path"], "condense")
+
+    def test_preload_retrievers_within_memory_budget(self):
+        """按顺序预加载检索器，索引总大小超出预算时停止"""
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            builder = LangchainManager()
+            for game_name in ("Game A", "Game B"):
+                rulebook_path = os.path.join(self.editable_texts_dir, f"{game_name}.md")
+                with open(rulebook_path, 'w', encoding='utf-8') as f:
+                    f.write(f"# {game_name}\n\n## 准备\n\n每位玩家拿取五枚金币。\n")
+                builder.add_rulebook_text(rulebook_path, game_name)
+            manager = LangchainManager()
+        self.assertGreater(manager.warm_up_embeddings(), 0)
+
+        size_mb = manager.index_size_bytes("Game A") / 1024 / 1024
+        loaded = manager.preload_retrievers(["Game A", "Missing Game", "Game B"], memory_budget_mb=size_mb * 1.5)
+        self.assertEqual(loaded, ["Game A"])
+        self.assertEqual(set(manager.game_retrievers), {"Game A"})
+
+        self.assertEqual(manager.preload_retrievers(["Game A", "Game B"], memory_budget_mb=0), ["Game B"])
+
+    def test_compressed_index_with_rescoring(self):
+        """压缩索引和原始向量保存到磁盘，重新加载后在压缩索引上精确重排序"""
+        from services.vector_compression import RESCORE_VECTORS_FILENAME, RescoringFAISS
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n\n## 回合\n\n每回合抽两张牌。\n")
+        vectors_path = os.path.join(self.vector_store_dir, "Fake Game", RESCORE_VECTORS_FILENAME)
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'), \
+             patch.object(cfg, 'VECTOR_COMPRESSION', 'int8'):
+            manager = LangchainManager()
+            manager.add_rulebook_text(rulebook_path, "Fake Game")
+            self.assertTrue(os.path.exists(vectors_path))
+            self.assertTrue(manager.is_index_current(rulebook_path, "Fake Game"))
+
+            reloaded = LangchainManager()
+            retriever = reloaded.load_or_get_retriever("Fake Game")
+            self.assertIsInstance(retriever.vectorstore, RescoringFAISS)
+            self.assertIsNotNone(retriever.vectorstore.rescore_vectors)
+            docs = retriever.invoke("每位玩家拿取五枚金币")
+            self.assertIn("五枚金币", docs[0].page_content)
+
+        # 关闭压缩需要重建，重建后不再保留原始向量
+        self.assertFalse(manager.is_index_current(rulebook_path, "Fake Game"))
+        manager.add_rulebook_text(rulebook_path, "Fake Game")
+        self.assertFalse(os.path.exists(vectors_path))
+
+    def test_shared_index_segments_for_identical_rulebooks(self):
+        """规则书相同的游戏共用一个索引段，按引用计数删除"""
+        from services.index_segments import SegmentStore
+        text = "# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n"
+        paths = {}
+        for game_name in ("Game A", "Game A (Remake)"):
+            paths[game_name] = create_dummy_md_file(self.editable_texts_dir, game_name, "rules.md", text)
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'), \
+             patch.object(cfg, 'SHARED_INDEX_SEGMENTS', True):
+            manager = LangchainManager()
+            with patch.object(manager.embeddings, 'embed_documents', wraps=manager.embeddings.embed_documents) as embed:
+                for game_name, path in paths.items():
+                    manager.add_rulebook_text(path, game_name, rulebook_id="1")
+            # 第二个游戏不重新计算Embedding
+            self.assertEqual(embed.call_count, 1)
+            segment = manager._manifest_segment("Game A")
+            self.assertEqual(manager._manifest_segment("Game A (Remake)"), segment)
+            self.assertFalse(os.path.exists(os.path.join(self.vector_store_dir, "Game A", "index.faiss")))
+            self.assertTrue(manager.is_index_current(paths["Game A (Remake)"], "Game A (Remake)", "1"))
+            self.assertIs(manager.game_retrievers["Game A"], manager.game_retrievers["Game A (Remake)"])
+
+            # 另一个进程重新加载时同样只加载一份
+            reloaded = LangchainManager()
+            self.assertEqual(reloaded.preload_retrievers(["Game A", "Game A (Remake)"], memory_budget_mb=0),
+                             ["Game A", "Game A (Remake)"])
+            self.assertIs(reloaded.game_retrievers["Game A"], reloaded.game_retrievers["Game A (Remake)"])
+            self.assertEqual(len(reloaded.loaded_segments), 1)
+            # 共享段只计算一次大小
+            size_mb = reloaded.index_size_bytes("Game A") / 1024 / 1024
+            fresh = LangchainManager()
+            self.assertEqual(len(fresh.preload_retrievers(["Game A", "Game A (Remake)"], size_mb * 1.5)), 2)
+
+            # 修改一个游戏的规则书后它使用新段，旧段仍被另一个游戏引用
+            with open(paths["Game A (Remake)"], 'a', encoding='utf-8') as f:
+                f.write("\n## 回合\n\n每回合抽两张牌。\n")
+            manager.add_rulebook_text(paths["Game A (Remake)"], "Game A (Remake)", rulebook_id="1")
+            store = SegmentStore(self.vector_store_dir)
+            self.assertNotEqual(manager._manifest_segment("Game A (Remake)"), segment)
+            self.assertEqual(store.refs(segment), ["Game A"])
+            docs = manager.game_retrievers["Game A (Remake)"].invoke("每回合抽几张牌")
+            self.assertTrue(any("两张" in doc.page_content for doc in docs))
+
+            manager.clear_game_state("Game A")
+            self.assertFalse(os.path.exists(store.path(segment)))
+            self.assertNotIn(segment, manager.loaded_segments)
+            self.assertTrue(manager.is_index_current(paths["Game A (Remake)"], "Game A (Remake)", "1"))
+
+    def test_clear_game_state_keeps_segment_used_by_other_games(self):
+        """清除一个游戏时保留其他游戏仍在使用的共享段"""
+        text = "# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n"
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'), \
+             patch.object(cfg, 'SHARED_INDEX_SEGMENTS', True):
+            manager = LangchainManager()
+            for game_name in ("Game A", "Game B"):
+                path = create_dummy_md_file(self.editable_texts_dir, game_name, "rules.md", text)
+                manager.add_rulebook_text(path, game_name)
+            segment_path = manager._index_data_path("Game B")
+            manager.clear_game_state("Game A")
+            self.assertFalse(os.path.exists(os.path.join(self.vector_store_dir, "Game A")))
+            self.assertTrue(os.path.exists(os.path.join(segment_path, "index.faiss")))
+            self.assertIn("Game B", manager.game_retrievers)
+            self.assertEqual(len(manager.game_retrievers["Game B"].invoke("金币")), 1)
+
+    def test_add_rulebook_skips_unchanged_content(self):
+        """索引清单中的内容哈希与文件一致时不重新计算Embedding"""
+        rulebook_path = os.path.join(self.editable_texts_dir, "fake_rules.md")
+        with open(rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 测试游戏\n\n## 准备\n\n每位玩家拿取五枚金币。\n")
+        with patch.object(cfg, 'LLM_PROVIDER', 'fake'), patch.object(cfg, 'EMBEDDING_PROVIDER', 'fake'):
+            manager = LangchainManager()
+        self.assertFalse(manager.is_index_current(rulebook_path, "Fake Game"))
+        self.assertTrue(manager.add_rulebook_text(rulebook_path, "Fake Game", skip_if_unchanged=True))
+        self.assertTrue(manager.is_index_current(rulebook_path, "Fake Game"))
+
+        with patch.object(manager.embeddings, 'embed_documents', wraps=manager.embeddings.embed_documents) as embed:
+            self.assertFalse(manager.add_rulebook_text(rulebook_path, "Fake Game", skip_if_unchanged=True))
+            embed.assert_not_called()
+
+            with open(rulebook_path, 'a', encoding='utf-8') as f:
+                f.write("\n## 回合\n\n每回合抽两张牌。\n")
+            self.assertFalse(manager.is_index_current(rulebook_path, "Fake Game"))
+            self.assertTrue(manager.add_rulebook_text(rulebook_path, "Fake Game", skip_if_unchanged=True))
+            embed.assert_called()
+
+        # 分块配置变化同样需要重建
+        with patch.object(cfg, 'CHUNK_SIZE', cfg.CHUNK_SIZE + 100):
+            self.assertFalse(manager.is_index_current(rulebook_path, "Fake Game"))
+
     @patch('langchain_google_genai.ChatGoogleGenerativeAI')
     @patch('langchain_google_genai.GoogleGenerativeAIEmbeddings')
     @patch('services.langchain_manager.FAISS')
@@ -230,7 +649,7 @@ class TestLangchainManager(unittest.TestCase):
         # We need to mock its invocation. The chain itself is an object, and it's callable.
         # So, we patch the class, make it return a callable mock (MagicMock instance is callable by default).
         mock_created_chain_instance = MagicMock()
-        mock_created_chain_instance.return_value = {"answer": "LLM says: Gemini is indeed fun!", "source_documents": []}
+        mock_created_chain_instance.invoke.return_value = {"answer": "LLM says: Gemini is indeed fun!", "source_documents": []}
 
         with patch('langchain.chains.ConversationalRetrievalChain.from_llm', return_value=mock_created_chain_instance) as mock_chain_from_llm:
             answer = manager.get_answer(question, game_name, player_id)
@@ -240,11 +659,11 @@ class TestLangchainManager(unittest.TestCase):
             chain_call_args_tuple = mock_chain_from_llm.call_args
             chain_actual_kwargs = chain_call_args_tuple[1]
             self.assertEqual(chain_actual_kwargs['llm'], mock_llm_instance) # manager.llm
-            self.assertEqual(chain_actual_kwargs['retriever'], mock_retriever_instance) # from manager.game_retrievers
+            self.assertEqual(chain_actual_kwargs['retriever'].base_retriever, mock_retriever_instance) # from manager.game_retrievers
             self.assertIsNotNone(chain_actual_kwargs['memory'])
             
-            # Assert that the created chain was called with the question
-            mock_created_chain_instance.assert_called_once_with({"question": question})
+            # Assert that the created chain was invoked with the question (and the timing callbacks)
+            mock_created_chain_instance.invoke.assert_called_once_with({"question": question}, config=ANY)
             self.assertEqual(answer, "LLM says: Gemini is indeed fun!")
 
         # Verify FAISS.load_local was NOT called if retriever already existed from add_rulebook_text
@@ -321,7 +740,7 @@ class TestLangchainManager(unittest.TestCase):
             
             mock_created_chain_instance = MagicMock()
             # The chain's __call__ or invoke method is what ultimately gets the answer
-            mock_created_chain_instance.return_value = {"answer": "LLM (Ollama) says: Ollama is indeed versatile!", "source_documents": []}
+            mock_created_chain_instance.invoke.return_value = {"answer": "LLM (Ollama) says: Ollama is indeed versatile!", "source_documents": []}
 
             # Patch the chain creation within the get_answer call
             with patch('langchain.chains.ConversationalRetrievalChain.from_llm', return_value=mock_created_chain_instance) as mock_chain_from_llm:
@@ -331,10 +750,10 @@ class TestLangchainManager(unittest.TestCase):
                 chain_call_args_tuple = mock_chain_from_llm.call_args
                 chain_actual_kwargs = chain_call_args_tuple[1]
                 self.assertEqual(chain_actual_kwargs['llm'], mock_llm_instance)
-                self.assertEqual(chain_actual_kwargs['retriever'], mock_retriever_instance)
+                self.assertEqual(chain_actual_kwargs['retriever'].base_retriever, mock_retriever_instance)
                 self.assertIsNotNone(chain_actual_kwargs['memory'])
                 
-                mock_created_chain_instance.assert_called_once_with({"question": question})
+                mock_created_chain_instance.invoke.assert_called_once_with({"question": question}, config=ANY)
                 self.assertEqual(answer, "LLM (Ollama) says: Ollama is indeed versatile!")
 
             mock_faiss_class.load_local.assert_not_called()
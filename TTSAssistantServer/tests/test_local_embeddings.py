@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 本地Embedding引擎单元测试
+"""
+
+import threading
+import time
+import unittest
+import sys
+import pathlib
+
+import numpy as np
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.embedding_cache import embedding_model_key
+from services.local_embeddings import (
+    EmbeddingBatcher, LocalEmbeddings, _mean_pool, _normalize, create_local_embeddings, hub_model_id,
+)
+
+
+class RecordingEncoder:
+    """向量为 [文本长度, 批内序号]，记录每批的文本"""
+
+    def __init__(self, gate: threading.Event = None):
+        self.batches = []
+        self.gate = gate
+
+    def encode(self, texts):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batches.append(list(texts))
+        return np.array([[len(text), index] for index, text in enumerate(texts)], dtype=np.float32)
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+    """测试动态分批、结果顺序、有界队列和错误传递"""
+
+    def test_results_keep_input_order(self):
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=2)
+        texts = ["ccc", "a", "bbbb", "dd", "e"]
+        vectors = batcher.embed(texts)
+        self.assertEqual([vector[0] for vector in vectors], [3, 1, 4, 2, 1])
+        self.assertEqual(batcher.embed([]), [])
+        batcher.close()
+
+    def test_batches_sorted_by_length_within_limits(self):
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=3, max_batch_chars=20)
+        texts = ["x" * 9, "x", "x" * 5, "xx", "x" * 3, "x" * 8]
+        batcher.embed(texts)
+        batcher.close()
+        lengths = [[len(text) for text in batch] for batch in encoder.batches]
+        self.assertEqual(lengths, [[1, 2, 3], [5, 8], [9]])
+        for batch in lengths:
+            self.assertLessEqual(max(batch) * len(batch), 20)
+
+    def test_concurrent_callers_share_batches(self):
+        gate = threading.Event()
+        encoder = RecordingEncoder(gate)
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=8)
+        # 第一个调用阻塞在推理中，其余查询在队列中等待并合并为一批
+        results = {}
+        first = threading.Thread(target=lambda: results.setdefault("first", batcher.embed(["first"])[0]))
+        first.start()
+        while not batcher._queue.empty():
+            time.sleep(0.001)
+        threads = [threading.Thread(target=lambda i=i: results.setdefault(i, batcher.embed(["q" * (i + 1)])[0]))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        while batcher._queue.qsize() < 4:
+            time.sleep(0.001)
+        gate.set()
+        for thread in [first] + threads:
+            thread.join()
+        batcher.close()
+        self.assertEqual(encoder.batches, [["first"], ["q", "qq", "qqq", "qqqq"]])
+        self.assertEqual([results[i][0] for i in range(4)], [1, 2, 3, 4])
+
+    def test_bounded_queue_blocks_callers(self):
+        gate = threading.Event()
+        encoder = RecordingEncoder(gate)
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=1, queue_size=2)
+        done = threading.Event()
+        caller = threading.Thread(target=lambda: (batcher.embed(["a"] * 10), done.set()))
+        caller.start()
+        self.assertFalse(done.wait(0.1))
+        self.assertLessEqual(batcher._queue.qsize(), 2)
+        gate.set()
+        self.assertTrue(done.wait(5))
+        caller.join()
+        batcher.close()
+
+    def test_encode_error_raised_to_caller(self):
+        def failing(texts):
+            raise RuntimeError("模型加载失败")
+        batcher = EmbeddingBatcher(failing)
+        with self.assertRaises(RuntimeError):
+            batcher.embed(["a", "b"])
+        batcher.close()
+
+
+class TestLocalEmbeddingHelpers(unittest.TestCase):
+    """测试池化、模型名和后端选择"""
+
+    def test_mean_pool_ignores_padding(self):
+        hidden = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]], dtype=np.float32)
+        mask = np.array([[1, 1, 0]])
+        pooled = _mean_pool(hidden, mask)
+        np.testing.assert_allclose(pooled, [[2.0, 2.0]])
+        np.testing.assert_allclose(np.linalg.norm(_normalize(pooled), axis=1), [1.0])
+
+    def test_model_key_includes_backend(self):
+        embeddings = LocalEmbeddings(RecordingEncoder().encode, "all-MiniLM-L6-v2:onnx_int8")
+        self.assertEqual(embedding_model_key(embeddings), "LocalEmbeddings:all-MiniLM-L6-v2:onnx_int8")
+        self.assertEqual(len(embeddings.embed_documents(["a", "b"])), 2)
+        embeddings.batcher.close()
+
+    def test_hub_model_id(self):
+        self.assertEqual(hub_model_id("all-MiniLM-L6-v2"), "sentence-transformers/all-MiniLM-L6-v2")
+        self.assertEqual(hub_model_id("BAAI/bge-small-zh-v1.5"), "BAAI/bge-small-zh-v1.5")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_local_embeddings("all-MiniLM-L6-v2", "tensorrt", "/tmp")
+
+
+if __name__ == '__main__':
+    unittest.main()
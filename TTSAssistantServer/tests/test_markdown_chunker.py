@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - Markdown规则书分块单元测试
+"""
+
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.markdown_chunker import MarkdownSectionSplitter
+from services.context_builder import expand_to_parents
+
+SAMPLE_RULEBOOK = """# 示例游戏 规则书
+
+## 准备阶段
+
+每位玩家拿取一块玩家版图。
+
+### 选牌
+
+每位玩家从牌堆抽取5张牌，选择1张保留，其余传给左手边的玩家。
+
+| 人数 | 每人起始金币 |
+| --- | --- |
+| 2 | 5 |
+| 3 | 4 |
+| 4 | 3 |
+
+## 回合流程
+
+1. 抽牌阶段：抽两张牌。
+2. 行动阶段：执行最多两个行动。
+   - 行动可以重复。
+3. 弃牌阶段：手牌上限为7张。
+"""
+
+
+class TestMarkdownSectionSplitter(unittest.TestCase):
+    """测试按标题结构分块"""
+
+    def test_section_paths(self):
+        children, parents = MarkdownSectionSplitter().split_text(SAMPLE_RULEBOOK, {"source": "rules.md"})
+        paths = [doc.metadata["section_path"] for doc in parents]
+        # 唯一的一级标题视为文档标题，不计入章节路径
+        self.assertEqual(paths, ["准备阶段", "准备阶段 > 选牌", "回合流程"])
+        for doc in children:
+            self.assertEqual(doc.metadata["source"], "rules.md")
+            self.assertIn(doc.metadata["parent_id"], {p.metadata["parent_id"] for p in parents})
+
+    def test_tables_and_lists_kept_intact(self):
+        children, _ = MarkdownSectionSplitter(chunk_size=120).split_text(SAMPLE_RULEBOOK)
+        table_chunks = [doc for doc in children if "| 人数 |" in doc.page_content]
+        self.assertEqual(len(table_chunks), 1)
+        self.assertIn("| 4 | 3 |", table_chunks[0].page_content)
+        list_chunks = [doc for doc in children if "抽牌阶段" in doc.page_content]
+        self.assertEqual(len(list_chunks), 1)
+        self.assertIn("弃牌阶段", list_chunks[0].page_content)
+
+    def test_oversized_table_split_repeats_header(self):
+        rows = "\n".join(f"| {i} | 效果{i} |" for i in range(40))
+        text = f"## 卡牌列表\n\n| 编号 | 效果 |\n| --- | --- |\n{rows}\n"
+        children, parents = MarkdownSectionSplitter(chunk_size=150, parent_chunk_size=150).split_text(text)
+        self.assertGreater(len(children), 1)
+        for doc in children:
+            self.assertIn("| 编号 | 效果 |", doc.page_content)
+            self.assertLessEqual(len(doc.page_content), 150 + len("卡牌列表\n"))
+        # 表格被拆开后父块不再是原文的连续片段
+        self.assertTrue(all(p.metadata["section_path"] == "卡牌列表" for p in parents))
+
+    def test_parent_start_index_points_into_source(self):
+        _, parents = MarkdownSectionSplitter().split_text(SAMPLE_RULEBOOK)
+        for doc in parents:
+            start = doc.metadata["start_index"]
+            self.assertEqual(SAMPLE_RULEBOOK[start:start + len(doc.page_content)], doc.page_content)
+
+    def test_expand_to_parents(self):
+        children, parents = MarkdownSectionSplitter(chunk_size=60).split_text(SAMPLE_RULEBOOK)
+        parent_map = {doc.metadata["parent_id"]: doc for doc in parents}
+        same_section = [doc for doc in children if doc.metadata["section_path"] == "准备阶段 > 选牌"]
+        self.assertGreater(len(same_section), 1)
+        expanded = expand_to_parents(same_section, parent_map)
+        self.assertEqual(len(expanded), 1)
+        self.assertIn("### 选牌", expanded[0].page_content)
+
+
+    def test_page_markers_recorded_in_metadata(self):
+        text = ("# 示例游戏 规则书\n\n<!-- page 1 -->\n\n## 准备阶段\n\n每位玩家拿取一块玩家版图。\n\n"
+                "<!-- page 2 -->\n\n每位玩家拿取五枚金币。\n\n## 回合流程\n\n每回合抽两张牌。\n")
+        children, parents = MarkdownSectionSplitter(chunk_size=30).split_text(text)
+        pages = {doc.metadata["section_path"]: (doc.metadata["page"], doc.metadata.get("page_end")) for doc in parents}
+        self.assertEqual(pages, {"准备阶段": (1, 2), "回合流程": (2, None)})
+        coins = [doc for doc in children if "五枚金币" in doc.page_content]
+        self.assertEqual(coins[0].metadata["page"], 2)
+        # 没有页码标记的规则书不记录页码
+        children, _ = MarkdownSectionSplitter().split_text(SAMPLE_RULEBOOK)
+        self.assertTrue(all("page" not in doc.metadata for doc in children))
+
+
+if __name__ == '__main__':
+    unittest.main()
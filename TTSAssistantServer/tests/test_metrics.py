@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 运行指标单元测试
+"""
+
+import io
+import unittest
+import sys
+import pathlib
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+import config as cfg
+from langchain.schema import Document
+from services.metrics import MetricsRegistry, labels
+from services.request_trace import RequestTrace
+from services.reranker import LexicalOverlapReranker
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """测试直方图汇总和 Prometheus 文本输出"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("test_seconds", "测试", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, {"span": "retrieval"})
+        text = self.registry.render()
+        self.assertIn('test_seconds_bucket{span="retrieval",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{span="retrieval",le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{span="retrieval",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_count{span="retrieval"} 3', text)
+        self.assertIn("# TYPE test_seconds histogram", text)
+
+    def test_observe_trace(self):
+        trace = RequestTrace("ask")
+        trace.record("retrieval", 0.02)
+        trace.record("generate", 1.5)
+        trace.set("condense_path", "no_history")
+        trace.set("speculative_retrieval", "hit")
+        self.registry.observe_trace(trace)
+        self.registry.observe_trace(trace)
+
+        spans = self.registry.histogram("tts_request_span_seconds", "")
+        self.assertEqual(spans.count({"request": "ask", "span": "generate"}), 2)
+        counter = self.registry.counter("tts_condense_path_total", "")
+        self.assertEqual(counter.value({"path": "no_history"}), 2)
+        speculation = self.registry.counter("tts_speculative_retrieval_total", "")
+        self.assertEqual(speculation.value({"result": "hit"}), 2)
+
+    def test_gauges(self):
+        self.registry.gauge("test_loaded", "已加载", lambda: 3)
+        self.registry.gauge("test_ratio", "命中率", lambda: {labels(cache="query_embedding"): 0.25})
+        self.registry.gauge("test_broken", "读取失败", lambda: 1 / 0)
+        text = self.registry.render()
+        self.assertIn("test_loaded 3", text)
+        self.assertIn('test_ratio{cache="query_embedding"} 0.25', text)
+        self.assertNotIn("test_broken", text)
+
+    def test_label_values_are_escaped(self):
+        self.registry.counter("test_total", "计数").inc(labels={"game": 'say "hi"'})
+        self.assertIn('test_total{game="say \\"hi\\""} 1', self.registry.render())
+
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """测试 /metrics 接口输出的缓存命中率"""
+
+    def test_reranker_cache_hit_ratio(self):
+        with patch.object(cfg, "LLM_PROVIDER", "fake"), patch.object(cfg, "EMBEDDING_PROVIDER", "fake"), \
+                redirect_stdout(io.StringIO()):
+            import app as app_module
+        reranker = LexicalOverlapReranker()
+        docs = [Document(page_content="每位玩家拿取五枚金币。", metadata={"source": "rules.md"})]
+        reranker.score("金币", docs)
+        reranker.score("金币", docs)
+        with patch.object(app_module.langchain_manager, "reranker", reranker):
+            text = app_module.app.test_client().get("/metrics").get_data(as_text=True)
+        self.assertIn('tts_cache_hit_ratio{cache="reranker"} 0.5', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则书PDF文本提取单元测试
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from benchmarks.synthetic_data import generate_pdf
+from services.pdf_extractor import (
+    PdfTextExtractor, find_cached_pdf, index_cached_pdfs, pypdf_available, tts_cache_stem
+)
+
+
+class TestCachedPdfLookup(unittest.TestCase):
+    """测试按URL查找TTS缓存的PDF"""
+
+    def test_tts_cache_stem_strips_non_alphanumerics(self):
+        url = "https://steamusercontent-a.akamaihd.net/ugc/12345/ABCDEF/"
+        self.assertEqual(tts_cache_stem(url), "httpssteamusercontentaakamaihdnetugc12345ABCDEF")
+
+    def test_find_cached_pdf_ignores_case_and_extension_case(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        url = "http://example.com/Rules.pdf?dl=1"
+        cached = os.path.join(temp_dir, tts_cache_stem(url) + ".PDF")
+        open(cached, "wb").close()
+        open(os.path.join(temp_dir, "unrelated.png"), "wb").close()
+
+        index = index_cached_pdfs(temp_dir)
+        self.assertEqual(find_cached_pdf(url, index), cached)
+        self.assertIsNone(find_cached_pdf("http://example.com/other.pdf", index))
+        self.assertEqual(index_cached_pdfs(os.path.join(temp_dir, "missing")), {})
+
+
+@unittest.skipUnless(pypdf_available(), "需要 pypdf")
+class TestPdfTextExtractor(unittest.TestCase):
+    """测试按页段提取和拼接"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.temp_dir, "rules.pdf")
+        generate_pdf(self.pdf_path, pages=5, seed=3, lines_per_page=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_extract_writes_page_markers_in_order(self):
+        output_path = os.path.join(self.temp_dir, "out", "rulebook.md")
+        result = PdfTextExtractor(max_workers=1, pages_per_task=2).extract(self.pdf_path, output_path, "测试游戏 规则书")
+
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["pages"], 5)
+        content = self._read(output_path)
+        self.assertTrue(content.startswith("# 测试游戏 规则书\n"))
+        positions = [content.index(f"<!-- page {page} -->") for page in range(1, 6)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn("Chapter 3:", content[positions[2]:positions[3]])
+        self.assertFalse(os.path.exists(output_path + ".extracting"))
+
+    def test_process_pool_matches_in_process_output(self):
+        inline_path = os.path.join(self.temp_dir, "inline.md")
+        pool_path = os.path.join(self.temp_dir, "pool.md")
+        PdfTextExtractor(max_workers=1, pages_per_task=2).extract(self.pdf_path, inline_path)
+        result = PdfTextExtractor(max_workers=2, pages_per_task=2).extract(self.pdf_path, pool_path)
+        self.assertIsNone(result["error"])
+        self.assertEqual(self._read(inline_path), self._read(pool_path))
+
+    def test_unreadable_pdf_reports_error(self):
+        broken_path = os.path.join(self.temp_dir, "broken.pdf")
+        with open(broken_path, "wb") as f:
+            f.write(b"not a pdf")
+        output_path = os.path.join(self.temp_dir, "broken.md")
+        results = PdfTextExtractor(max_workers=1).extract_many([
+            (broken_path, output_path, ""),
+            (self.pdf_path, os.path.join(self.temp_dir, "ok.md"), ""),
+        ])
+        self.assertIsNotNone(results[0]["error"])
+        self.assertFalse(os.path.exists(output_path))
+        self.assertIsNone(results[1]["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
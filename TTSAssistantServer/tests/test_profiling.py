@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 慢请求采样分析单元测试
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.profiling import RequestProfiler
+
+
+def _work():
+    return sum(i * i for i in range(1000))
+
+
+class TestRequestProfiler(unittest.TestCase):
+    """测试分析结果的保存条件、轮转和列表"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.profiles_dir = os.path.join(self.temp_dir, "profiles")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_off_mode_saves_nothing(self):
+        profiler = RequestProfiler(self.profiles_dir, mode="off", threshold_ms=0)
+        with profiler.profile("ask"):
+            _work()
+        self.assertEqual(profiler.list_profiles(), [])
+
+    def test_threshold_mode_keeps_only_slow_requests(self):
+        profiler = RequestProfiler(self.profiles_dir, mode="threshold", threshold_ms=60_000)
+        with profiler.profile("ask"):
+            _work()
+        self.assertEqual(profiler.list_profiles(), [])
+
+        profiler.threshold = 0
+        with profiler.profile("refresh_rag_from_cache", game_name="Test Game"):
+            _work()
+        profiles = profiler.list_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]["request"], "refresh_rag_from_cache")
+        self.assertEqual(profiles[0]["reason"], "slow")
+        with open(os.path.join(self.profiles_dir, profiles[0]["summary_file"]), encoding="utf-8") as f:
+            self.assertIn("game_name: Test Game", f.read())
+
+    def test_sample_mode_and_rotation(self):
+        profiler = RequestProfiler(self.profiles_dir, mode="sample", sample_every=2, max_files=2)
+        for _ in range(8):
+            with profiler.profile("ask"):
+                _work()
+        profiles = profiler.list_profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(all(item["reason"] == "sampled" for item in profiles))
+        # 轮转时文本摘要随分析结果一起删除
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 4)
+
+    def test_exceptions_propagate(self):
+        profiler = RequestProfiler(self.profiles_dir, mode="threshold", threshold_ms=0)
+        with self.assertRaises(RuntimeError):
+            with profiler.profile("ask"):
+                raise RuntimeError("处理失败")
+        self.assertEqual(len(profiler.list_profiles()), 1)
+
+    def test_resolve_file_rejects_other_paths(self):
+        profiler = RequestProfiler(self.profiles_dir, mode="threshold", threshold_ms=0)
+        with profiler.profile("ask"):
+            _work()
+        name = profiler.list_profiles()[0]["file"]
+        self.assertIsNotNone(profiler.resolve_file(name))
+        self.assertIsNone(profiler.resolve_file("../" + name))
+        self.assertIsNone(profiler.resolve_file("missing.prof"))
+        self.assertIsNone(profiler.resolve_file("config.py"))
+
+
+if __name__ == '__main__':
+    unittest.main()
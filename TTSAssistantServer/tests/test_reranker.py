@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 检索重排序单元测试
+"""
+
+import unittest
+import sys
+import pathlib
+from unittest.mock import MagicMock
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from langchain.schema import Document
+
+from services.reranker import LexicalOverlapReranker, Reranker, create_reranker
+from services.rag_retriever import PipelineRetriever
+
+
+class CountingReranker(Reranker):
+    """记录每批打分调用的重排序器"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def _score_batch(self, query, texts):
+        self.batches.append(list(texts))
+        return [len(text) for text in texts]
+
+
+class TestReranker(unittest.TestCase):
+    """测试重排序打分、分批和缓存"""
+
+    def setUp(self):
+        self.docs = [
+            Document(page_content="每位玩家从货物牌堆抽两张牌。", metadata={"source": "rules.md"}),
+            Document(page_content="空间站花费6金币，仓库花费3金币。", metadata={"source": "rules.md"}),
+            Document(page_content="天枢港是中立区域，不能发起战斗。", metadata={"source": "rules.md"}),
+        ]
+
+    def test_lexical_prefers_matching_chunk(self):
+        reranker = LexicalOverlapReranker()
+        top = reranker.rerank("建造空间站需要花多少金币？", self.docs, top_n=1)
+        self.assertEqual(top, [self.docs[1]])
+
+    def test_ties_keep_original_order(self):
+        reranker = LexicalOverlapReranker()
+        ranked = reranker.rerank("完全无关的问题", self.docs, top_n=3)
+        self.assertEqual(ranked, self.docs)
+
+    def test_batched_scoring_and_cache(self):
+        reranker = CountingReranker(batch_size=2)
+        reranker.rerank("问题", self.docs, top_n=2)
+        self.assertEqual([len(batch) for batch in reranker.batches], [2, 1])
+
+        # 同一查询再次打分全部命中缓存，新增的块只打分一次
+        extra = Document(page_content="新的规则块", metadata={"source": "rules.md"})
+        reranker.rerank("问题", self.docs + [extra], top_n=2)
+        self.assertEqual(reranker.batches[-1], ["新的规则块"])
+        stats = reranker.stats()
+        self.assertEqual(stats["cache_hits"], 3)
+        self.assertEqual(stats["cache_misses"], 4)
+
+    def test_subclass_must_implement_score_batch(self):
+        class IncompleteReranker(Reranker):
+            name = "incomplete"
+
+        with self.assertRaises(TypeError):
+            IncompleteReranker()
+
+    def test_cache_is_bounded(self):
+        reranker = CountingReranker(cache_size=2)
+        reranker.score("问题", self.docs)
+        self.assertEqual(reranker.stats()["cache_size"], 2)
+
+    def test_create_reranker(self):
+        self.assertIsNone(create_reranker("none"))
+        self.assertIsInstance(create_reranker("lexical"), LexicalOverlapReranker)
+        with self.assertRaises(ValueError):
+            create_reranker("unknown")
+
+    def test_pipeline_retriever_keeps_top_n(self):
+        base_retriever = MagicMock()
+        base_retriever.invoke.return_value = self.docs
+        retriever = PipelineRetriever(
+            base_retriever=base_retriever,
+            reranker=LexicalOverlapReranker(),
+            rerank_top_n=1,
+        )
+        docs = retriever.invoke("天枢港可以发起战斗吗？")
+        self.assertEqual([doc.page_content for doc in docs], [self.docs[2].page_content])
+
+
+if __name__ == '__main__':
+    unittest.main()
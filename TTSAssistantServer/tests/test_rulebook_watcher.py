@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 规则书文件监视单元测试
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import sys
+import pathlib
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.rulebook_watcher import RulebookWatcher, ReindexQueue
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+class TestRulebookWatcher(unittest.TestCase):
+    """测试去抖合并和轮询检测"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.game_dir = os.path.join(self.temp_dir, "some_game")
+        os.makedirs(self.game_dir)
+        self.rulebook_path = os.path.join(self.game_dir, "rulebook_default_for_some_game.md")
+        with open(self.rulebook_path, 'w', encoding='utf-8') as f:
+            f.write("# 规则\n")
+        self.changes = []
+        self.watcher = None
+
+    def tearDown(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _start(self, backend, debounce_seconds=0.2):
+        self.watcher = RulebookWatcher(self.temp_dir, self.changes.append, backend=backend,
+                                       debounce_seconds=debounce_seconds, poll_interval=0.1)
+        return self.watcher.start()
+
+    def test_rapid_saves_trigger_one_callback(self):
+        self._start("polling")
+        for _ in range(5):
+            self.watcher.notify(self.rulebook_path)
+            time.sleep(0.02)
+        self.watcher.notify(os.path.join(self.game_dir, "notes.txt"))
+        self.assertTrue(_wait_until(lambda: self.changes))
+        time.sleep(0.3)
+        self.assertEqual(self.changes, [os.path.abspath(self.rulebook_path)])
+
+    def test_polling_detects_modified_and_new_files(self):
+        self.assertEqual(self._start("polling", debounce_seconds=0.05), "polling")
+        # 启动前已存在的文件不触发
+        time.sleep(0.3)
+        self.assertEqual(self.changes, [])
+
+        with open(self.rulebook_path, 'a', encoding='utf-8') as f:
+            f.write("每位玩家拿取五枚金币。\n")
+        new_path = os.path.join(self.game_dir, "rulebook_expansion.md")
+        with open(new_path, 'w', encoding='utf-8') as f:
+            f.write("# 扩展\n")
+        self.assertTrue(_wait_until(lambda: len(self.changes) == 2))
+        self.assertEqual(sorted(self.changes), sorted([os.path.abspath(self.rulebook_path), os.path.abspath(new_path)]))
+
+    def test_off_backend_does_not_start(self):
+        self.assertIsNone(self._start("off"))
+
+
+class TestReindexQueue(unittest.TestCase):
+    """测试后台重建队列的串行执行和去重"""
+
+    def test_duplicate_submissions_are_merged(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(path):
+            release.wait(5)
+            handled.append(path)
+
+        reindex_queue = ReindexQueue(handler)
+        self.assertTrue(reindex_queue.submit("a.md"))
+        # 等第一个任务开始执行后再提交，之后的 b.md 在排队期间重复提交只保留一个
+        self.assertTrue(_wait_until(lambda: reindex_queue.depth() == 0))
+        self.assertTrue(reindex_queue.submit("b.md"))
+        self.assertFalse(reindex_queue.submit("b.md"))
+        self.assertTrue(reindex_queue.submit("a.md"))
+        self.assertEqual(reindex_queue.depth(), 2)
+
+        release.set()
+        reindex_queue.join()
+        self.assertEqual(handled, ["a.md", "b.md", "a.md"])
+
+    def test_handler_errors_do_not_stop_the_worker(self):
+        handled = []
+
+        def handler(path):
+            if path == "bad.md":
+                raise RuntimeError("boom")
+            handled.append(path)
+
+        reindex_queue = ReindexQueue(handler)
+        reindex_queue.submit("bad.md")
+        reindex_queue.submit("good.md")
+        reindex_queue.join()
+        self.assertEqual(handled, ["good.md"])
+
+
+if __name__ == '__main__':
+    unittest.main()
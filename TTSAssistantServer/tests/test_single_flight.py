@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 单飞缓存单元测试
+"""
+
+import threading
+import time
+import unittest
+import sys
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from services.single_flight import CACHED, COMPUTED, SHARED, SingleFlightCache
+
+
+class TestSingleFlightCache(unittest.TestCase):
+    """测试并发合并和按版本缓存"""
+
+    def test_concurrent_calls_compute_once(self):
+        cache = SingleFlightCache()
+        calls = []
+        barrier = threading.Barrier(100)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"status": "success"}
+
+        def call(_):
+            barrier.wait()
+            return cache.get("Game", compute, lambda: 1)
+
+        with ThreadPoolExecutor(max_workers=100) as executor:
+            results = list(executor.map(call, range(100)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(value == {"status": "success"} for value, _ in results))
+        sources = [source for _, source in results]
+        self.assertEqual(sources.count(COMPUTED), 1)
+        self.assertEqual(sources.count(SHARED) + sources.count(CACHED), 99)
+
+    def test_recomputes_when_version_changes(self):
+        cache = SingleFlightCache()
+        version = [1]
+        counter = iter(range(10))
+        compute = lambda: next(counter)
+        self.assertEqual(cache.get("Game", compute, lambda: version[0]), (0, COMPUTED))
+        self.assertEqual(cache.get("Game", compute, lambda: version[0]), (0, CACHED))
+        version[0] = 2
+        self.assertEqual(cache.get("Game", compute, lambda: version[0]), (1, COMPUTED))
+        cache.invalidate("Game")
+        self.assertEqual(cache.get("Game", compute, lambda: version[0]), (2, COMPUTED))
+
+    def test_version_recorded_after_compute(self):
+        """计算本身改变了版本 (例如重建索引写入清单) 时，缓存记录计算后的版本"""
+        cache = SingleFlightCache()
+        version = [1]
+
+        def compute():
+            version[0] += 1
+            return "ready"
+
+        cache.get("Game", compute, lambda: version[0])
+        self.assertEqual(cache.get("Game", compute, lambda: version[0]), ("ready", CACHED))
+
+    def test_errors_are_shared_and_not_cached(self):
+        cache = SingleFlightCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait()
+            raise RuntimeError("索引加载失败")
+
+        errors = []
+
+        def waiter():
+            try:
+                cache.get("Game", lambda: "unused", lambda: 1)
+            except RuntimeError as e:
+                errors.append(e)
+
+        owner = threading.Thread(target=lambda: self.assertRaises(RuntimeError, cache.get, "Game", failing, lambda: 1))
+        owner.start()
+        started.wait()
+        waiting = threading.Thread(target=waiter)
+        waiting.start()
+        time.sleep(0.05)
+        release.set()
+        owner.join()
+        waiting.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(cache.get("Game", lambda: "ok", lambda: 1), ("ok", COMPUTED))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 推测检索单元测试
+"""
+
+import io
+import unittest
+import sys
+import pathlib
+from contextlib import redirect_stdout
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from langchain.schema import Document
+
+from services.speculative_retrieval import SpeculativeRetrieval, candidate_overlap
+
+CHUNKS = {
+    "金币": [Document(page_content="每位玩家拿取五枚金币。"), Document(page_content="金币可以兑换卡牌。")],
+    "手牌": [Document(page_content="手牌上限为七张。"), Document(page_content="每回合抽两张牌。")],
+}
+
+
+class TestSpeculativeRetrieval(unittest.TestCase):
+    """测试推测检索结果的复用判断"""
+
+    def setUp(self):
+        self.queries = []
+        self.built = []
+
+    def _retrieve(self, query):
+        self.queries.append(query)
+        return list(CHUNKS["金币" if "金币" in query else "手牌"])
+
+    def _build(self, query, docs):
+        self.built.append(query)
+        return docs[:1]
+
+    def _speculate(self, question):
+        return SpeculativeRetrieval(question, self._retrieve, self._build, min_overlap=0.6).start()
+
+    def test_candidate_overlap(self):
+        self.assertEqual(candidate_overlap(CHUNKS["金币"], CHUNKS["金币"] + CHUNKS["手牌"]), 1.0)
+        self.assertEqual(candidate_overlap(CHUNKS["金币"][:1] + CHUNKS["手牌"][:1], CHUNKS["金币"]), 0.5)
+        self.assertEqual(candidate_overlap([], []), 1.0)
+
+    def test_identical_query_reuses_without_retrieving_again(self):
+        speculation = self._speculate("金币有多少？")
+        context_docs, candidates = speculation.resolve(" 金币有多少？")
+        self.assertEqual(context_docs, CHUNKS["金币"][:1])
+        self.assertIsNone(candidates)
+        self.assertEqual((speculation.result, self.queries), ("hit", ["金币有多少？"]))
+
+    def test_similar_condensed_query_is_hit(self):
+        speculation = self._speculate("那它呢？金币")
+        context_docs, _ = speculation.resolve("起始金币有多少？")
+        self.assertEqual(context_docs, CHUNKS["金币"][:1])
+        self.assertEqual(speculation.result, "hit")
+        # 只对原问题构建了上下文
+        self.assertEqual(self.built, ["那它呢？金币"])
+
+    def test_different_condensed_query_is_miss(self):
+        speculation = self._speculate("那它呢？")
+        context_docs, candidates = speculation.resolve("金币有多少？")
+        self.assertIsNone(context_docs)
+        # 改写后问题的候选块交给调用方继续处理，不需要再检索一次
+        self.assertEqual(candidates, CHUNKS["金币"])
+        self.assertEqual((speculation.result, speculation.overlap), ("miss", 0.0))
+
+    def test_failed_speculation_falls_back(self):
+        def fail(query):
+            raise RuntimeError("索引不可用")
+        speculation = SpeculativeRetrieval("金币", fail, self._build, min_overlap=0.6).start()
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(speculation.resolve("金币"), (None, None))
+        self.assertEqual(speculation.result, "error")
+
+
+if __name__ == "__main__":
+    unittest.main()
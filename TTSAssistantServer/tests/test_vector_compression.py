@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 向量压缩单元测试
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+import pathlib
+
+import numpy as np
+
+# 添加父目录到导入路径
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from langchain.schema import Document
+from services.fake_providers import HashingEmbeddings
+from services.vector_compression import (
+    RescoringFAISS, compress_index, load_rescore_vectors, pq_subquantizers, save_rescore_vectors,
+)
+from langchain_community.vectorstores import FAISS
+
+
+def _build_store(count=300):
+    texts = [f"规则 {i}: 第{i % 17}阶段 玩家拿取 {i % 5} 枚金币 和 {i % 11} 张卡牌" for i in range(count)]
+    documents = [Document(page_content=text, metadata={"row": i}) for i, text in enumerate(texts)]
+    return FAISS.from_documents(documents, HashingEmbeddings(size=64)), texts
+
+
+class TestVectorCompression(unittest.TestCase):
+    """测试压缩索引的建立和精确重排序"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_pq_subquantizers_divides_dimension(self):
+        self.assertEqual(pq_subquantizers(768), 96)
+        self.assertEqual(pq_subquantizers(768, 64), 64)
+        self.assertEqual(pq_subquantizers(100), 10)
+        # 不能整除时自动选择
+        self.assertEqual(pq_subquantizers(768, 100), 96)
+
+    def test_compressed_indexes_are_smaller(self):
+        import faiss
+        store, _ = _build_store(2000)
+        flat_size = len(faiss.serialize_index(store.index))
+        sizes = {}
+        for mode in ("fp16", "int8", "pq"):
+            compressed, used = compress_index(store.index, mode)
+            self.assertEqual(used, mode)
+            self.assertEqual(compressed.ntotal, store.index.ntotal)
+            sizes[mode] = len(faiss.serialize_index(compressed))
+        self.assertLess(sizes["fp16"], flat_size)
+        self.assertLess(sizes["int8"], sizes["fp16"])
+        self.assertLess(sizes["pq"], sizes["int8"])
+
+    def test_none_returns_original_index(self):
+        store, _ = _build_store(10)
+        compressed, used = compress_index(store.index, "none")
+        self.assertIs(compressed, store.index)
+        self.assertEqual(used, "none")
+        with self.assertRaises(ValueError):
+            compress_index(store.index, "int4")
+
+    def test_pq_falls_back_to_int8_for_small_indexes(self):
+        # 码本比int8编码还大时不使用PQ
+        store, _ = _build_store(40)
+        compressed, used = compress_index(store.index, "pq")
+        self.assertEqual(used, "int8")
+        self.assertEqual(compressed.ntotal, 40)
+        # 向量较少时减少每个子量化器的中心数
+        store, _ = _build_store(400)
+        compressed, used = compress_index(store.index, "pq")
+        self.assertEqual(used, "pq")
+        self.assertLess(compressed.pq.nbits, 8)
+
+    def test_rescoring_restores_exact_ranking(self):
+        store, texts = _build_store(2000)
+        exact = store.similarity_search_with_score(texts[42], k=5)
+        save_rescore_vectors(store.index, self.temp_dir)
+        store.index, _ = compress_index(store.index, "pq")
+        rescoring = RescoringFAISS.from_store(store, load_rescore_vectors(self.temp_dir), rescore_factor=8)
+
+        results = rescoring.similarity_search_with_score(texts[42], k=5)
+        # 合成文本中有距离相同的块，按距离比较
+        self.assertEqual(results[0][0].metadata["row"], 42)
+        for (_, score), (_, exact_score) in zip(results, exact):
+            self.assertAlmostEqual(score, float(exact_score), places=4)
+        # 带过滤条件的查询按普通FAISS检索
+        filtered = rescoring.similarity_search(texts[42], k=2, filter={"row": 42})
+        self.assertEqual([doc.metadata["row"] for doc in filtered], [42])
+
+    def test_mismatched_vectors_disable_rescoring(self):
+        store, _ = _build_store(20)
+        rescoring = RescoringFAISS.from_store(store, np.zeros((3, 64), dtype=np.float32), rescore_factor=4)
+        self.assertIsNone(rescoring.rescore_vectors)
+
+    def test_load_rescore_vectors_missing_file(self):
+        self.assertIsNone(load_rescore_vectors(self.temp_dir))
+        store, _ = _build_store(5)
+        save_rescore_vectors(store.index, self.temp_dir)
+        vectors = load_rescore_vectors(self.temp_dir)
+        self.assertEqual(vectors.shape, (5, 64))
+        self.assertIsInstance(vectors, np.memmap)
+        self.assertEqual(os.listdir(self.temp_dir), ["vectors.f32.npy"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 import unittest
 import os
 import json
+import hashlib
 import shutil
 import tempfile
+import time
 from unittest.mock import patch, MagicMock
 
 # 将项目根目录添加到sys.path，以便导入模块
@@ -16,6 +18,8 @@ sys.path.insert(0, project_root)
 
 from services.workshop_manager import WorkshopManager
 from services.rulebook_manager import RulebookManager # RulebookManager 会被 WorkshopManager内部实例化
+from services.pdf_extractor import PdfTextExtractor, pypdf_available, tts_cache_stem
+from benchmarks.synthetic_data import generate_pdf
 import config as cfg
 
 class TestWorkshopManager(unittest.TestCase):
@@ -276,6 +280,199 @@ class TestWorkshopManager(unittest.TestCase):
         # 游戏2的规则书数量也不应该改变
         self.assertEqual(len(data_second_scan[self.game2_name]["rulebooks"]), 2)
 
+    def test_rulebook_filename_is_deterministic(self):
+        """规则书文件名由URL摘要确定，元数据丢失后重新扫描仍复用原文件"""
+        manager = WorkshopManager()
+        manager.scan_all_tts_data()
+        info = manager.processed_mods[self.game1_name]["rulebooks"][self.game1_pdf_url]
+        digest = hashlib.sha1(self.game1_pdf_url.encode("utf-8")).hexdigest()[:8]
+        self.assertEqual(info["normalized_filename"], f"rulebook_rules1_{digest}.md")
+        with open(info["editable_text_path"], 'w', encoding='utf-8') as f:
+            f.write("用户粘贴的规则。\n")
+
+        os.remove(self.mock_processed_mods_file)
+        rescanned = WorkshopManager()
+        rescanned.scan_all_tts_data()
+        rescanned_info = rescanned.processed_mods[self.game1_name]["rulebooks"][self.game1_pdf_url]
+        self.assertEqual(rescanned_info["editable_text_path"], info["editable_text_path"])
+        game_dir = os.path.dirname(info["editable_text_path"])
+        self.assertEqual(os.listdir(game_dir), [info["normalized_filename"]])
+        with open(rescanned_info["editable_text_path"], 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "用户粘贴的规则。\n")
+
+    def test_migrate_rulebook_filenames_merges_legacy_duplicates(self):
+        """旧版本随机命名的重复文件被合并为一个确定命名的文件，保留用户内容"""
+        manager = WorkshopManager()
+        manager.scan_all_tts_data()
+        info = manager.processed_mods[self.game1_name]["rulebooks"][self.game1_pdf_url]
+        expected_path = info["editable_text_path"]
+        game_dir = os.path.dirname(expected_path)
+        legacy_path = os.path.join(game_dir, "rulebook_rules1_5f3a9c1.md")
+        os.replace(expected_path, legacy_path)
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            f.write("用户粘贴的规则。\n")
+        # 之前某次启动留下的模板文件、相同内容的重复文件和不同内容的文件
+        manager.rulebook_manager.create_rulebook_file(self.game1_name, "rulebook_rules1_0a1b2c3d.md")
+        shutil.copy(legacy_path, os.path.join(game_dir, "rulebook_rules1_77e1f00d.md"))
+        with open(os.path.join(game_dir, "rulebook_rules1_1234abcd.md"), 'w', encoding='utf-8') as f:
+            f.write("更早的另一份规则。\n")
+        os.utime(os.path.join(game_dir, "rulebook_rules1_1234abcd.md"), (1, 1))
+        info["normalized_filename"] = os.path.basename(legacy_path)
+        info["editable_text_path"] = legacy_path
+        # 仍是模板内容的旧文件
+        game2_info = manager.processed_mods[self.game2_name]["rulebooks"][self.game2_pdf_url1]
+        game2_expected_path = game2_info["editable_text_path"]
+        os.remove(game2_expected_path)
+        game2_info["editable_text_path"] = manager.rulebook_manager.create_rulebook_file(
+            self.game2_name, "rulebook_super_rules_main_9d8c7b6a.md"
+        )
+
+        counts = manager.migrate_rulebook_filenames()
+        self.assertEqual(counts, {"renamed": 2, "removed": 2, "backed_up": 1})
+        self.assertEqual(info["editable_text_path"], expected_path)
+        with open(expected_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "用户粘贴的规则。\n")
+        self.assertEqual(sorted(os.listdir(game_dir)), sorted([
+            os.path.basename(expected_path), "rulebook_rules1_1234abcd.md.bak"
+        ]))
+        with open(self.mock_processed_mods_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        self.assertEqual(saved[self.game1_name]["rulebooks"][self.game1_pdf_url]["editable_text_path"], expected_path)
+        # 模板文件按新文件名重新生成
+        self.assertEqual(game2_info["editable_text_path"], game2_expected_path)
+        self.assertTrue(manager.rulebook_manager.is_template_content(game2_expected_path, self.game2_name))
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(game2_expected_path),
+                                                     "rulebook_super_rules_main_9d8c7b6a.md")))
+
+        self.assertEqual(manager.migrate_rulebook_filenames(), {"renamed": 0, "removed": 0, "backed_up": 0})
+
+    def test_find_rulebook_by_path_and_template_detection(self):
+        """按缓存文件路径找到所属游戏，并区分模板内容和用户填充的内容"""
+        manager = WorkshopManager()
+        manager.create_default_rulebook_entry(self.game3_name)
+        info = manager.check_auto_load_rulebook(self.game3_name)
+        path = info["editable_text_path"]
+
+        self.assertEqual(manager.find_rulebook_by_path(path), (self.game3_name, info["pdf_identifier_key"]))
+        self.assertIsNone(manager.find_rulebook_by_path(os.path.join(self.mock_editable_texts_dir, "unknown.md")))
+
+        self.assertTrue(manager.rulebook_manager.is_template_content(path, self.game3_name))
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("每位玩家拿取五枚金币。\n")
+        self.assertFalse(manager.rulebook_manager.is_template_content(path, self.game3_name))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("  \n")
+        self.assertTrue(manager.rulebook_manager.is_template_content(path, self.game3_name))
+
+
+    def _add_workshop_item(self, game_id, game_name, pdf_url):
+        """模拟运行期间新订阅一个Mod: 写入Mod存档JSON并追加到 WorkshopFileInfos.json"""
+        game_json_path = os.path.join(self.mock_workshop_dir, f"{game_id}.json")
+        with open(game_json_path, 'w', encoding='utf-8') as f:
+            json.dump({"Name": game_name, "ObjectStates": [
+                {"Name": "Custom_PDF", "CustomPDF": {"PDFUrl": pdf_url}}
+            ]}, f)
+        with open(self.workshop_file_infos_path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        items.append({"Directory": game_json_path, "Name": game_name, "UpdateTime": 1700000100})
+        with open(self.workshop_file_infos_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f)
+
+    def test_scan_workshop_changes_only_scans_new_or_changed_mods(self):
+        """增量扫描只解析新增或变化的Mod"""
+        manager = WorkshopManager()
+        first = manager.scan_workshop_changes()
+        self.assertEqual((first["added"], first["scanned"]), (3, 3))
+        self.assertTrue(os.path.exists(manager.scan_state_file))
+
+        with patch.object(manager, '_scan_workshop_game_json') as mock_scan:
+            unchanged = manager.scan_workshop_changes()
+            mock_scan.assert_not_called()
+        self.assertEqual(unchanged["scanned"], 0)
+
+        self._add_workshop_item("24680", "New Game 4", "http://example.com/new_rules.pdf")
+        # Mod存档被重新下载 (修改时间变化)
+        stat = os.stat(self.game1_json_path)
+        os.utime(self.game1_json_path, (stat.st_atime, stat.st_mtime + 10))
+        with patch.object(manager, '_scan_workshop_game_json', wraps=manager._scan_workshop_game_json) as mock_scan:
+            second = manager.scan_workshop_changes()
+        self.assertEqual((second["added"], second["changed"], second["scanned"]), (1, 1, 2))
+        self.assertEqual(sorted(call.args[1] for call in mock_scan.call_args_list), [self.game1_name, "New Game 4"])
+        self.assertTrue(manager.has_game("New Game 4"))
+
+        # 新实例从状态文件继续，不会重新扫描
+        self.assertEqual(WorkshopManager().scan_workshop_changes()["scanned"], 0)
+
+    def test_workshop_watcher_picks_up_new_subscription(self):
+        """工坊清单变化后，监视器在后台增量扫描新订阅的Mod"""
+        manager = WorkshopManager()
+        manager.scan_workshop_changes()
+        watcher = manager.create_watcher("polling", poll_interval=0.1)
+        watcher.debounce_seconds = 0.05
+        self.assertEqual(watcher.start(), "polling")
+        try:
+            self._add_workshop_item("24680", "New Game 4", "http://example.com/new_rules.pdf")
+            deadline = time.monotonic() + 5
+            while not manager.get_game_rulebook_info("New Game 4") and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            watcher.stop()
+        self.assertEqual([rb["original_source"] for rb in manager.get_game_rulebook_info("New Game 4")],
+                         ["http://example.com/new_rules.pdf"])
+
+    def test_workshop_watcher_scans_once_per_burst(self):
+        """订阅更新一次改写许多Mod存档JSON时只增量扫描一次"""
+        manager = WorkshopManager()
+        watcher = manager.create_watcher("polling", poll_interval=0.1)
+        watcher.debounce_seconds = 0.1
+        with patch.object(manager, 'scan_workshop_changes') as mock_scan:
+            watcher.start()
+            try:
+                for i in range(20):
+                    watcher.notify(os.path.join(self.mock_workshop_dir, f"{i}.json"))
+                watcher.notify(self.workshop_file_infos_path)
+                self.assertEqual(watcher.pending_count(), 1)
+                deadline = time.monotonic() + 5
+                while not mock_scan.called and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                time.sleep(0.3)
+            finally:
+                watcher.stop()
+        self.assertEqual(mock_scan.call_count, 1)
+
+    def test_create_watcher_without_tts_data_directory(self):
+        with patch.object(cfg, 'TTS_DATA_DIRECTORY', None):
+            self.assertIsNone(WorkshopManager().create_watcher("polling"))
+
+
+    @unittest.skipUnless(pypdf_available(), "需要 pypdf")
+    def test_extract_rulebook_texts_from_cached_pdfs(self):
+        """从TTS缓存的PDF提取规则书文本，未变化时跳过，不覆盖用户编辑过的文件"""
+        pdf_dir = os.path.join(self.mock_mods_dir, "PDF")
+        os.makedirs(pdf_dir)
+        generate_pdf(os.path.join(pdf_dir, tts_cache_stem(self.game1_pdf_url) + ".PDF"), pages=3, seed=1, lines_per_page=3)
+        manager = WorkshopManager()
+        manager.scan_all_tts_data()
+        extractor = PdfTextExtractor(max_workers=1)
+
+        counts = manager.extract_rulebook_texts(extractor=extractor)
+        self.assertEqual((counts["extracted"], counts["not_cached"]), (1, 2))
+        rulebook = manager.get_game_rulebook_info(self.game1_name)[0]
+        self.assertEqual(rulebook["status"], "text_extracted")
+        with open(rulebook["path"], 'r', encoding='utf-8') as f:
+            self.assertIn("<!-- page 3 -->", f.read())
+        with open(self.mock_processed_mods_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)[self.game1_name]["rulebooks"][self.game1_pdf_url]
+        self.assertEqual(saved["extraction"]["pages"], 3)
+
+        self.assertEqual(manager.extract_rulebook_texts(self.game1_name, extractor)["unchanged"], 1)
+
+        with open(rulebook["path"], 'a', encoding='utf-8') as f:
+            f.write("用户补充的规则说明。\n")
+        self.assertEqual(manager.extract_rulebook_texts(self.game1_name, extractor)["user_edited"], 1)
+        with open(rulebook["path"], 'r', encoding='utf-8') as f:
+            self.assertIn("用户补充的规则说明", f.read())
+
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False) 
\ No newline at end of file
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TabletopSimulatorCompanion (TTS Companion) - 批量建立规则书索引
+离线为所有已填写内容的规则书建立或更新向量索引，参数传递给 TTSAssistantServer/services/bulk_indexer.py:
+    python index_rulebooks.py --workers 4
+    python index_rulebooks.py --game "Terraforming Mars" --force
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from start_server import find_python_executable
+
+
+def main():
+    """主函数"""
+    # 切换到脚本所在目录
+    script_dir = Path(__file__).parent.absolute()
+    os.chdir(script_dir)
+
+    server_dir = 'TTSAssistantServer'
+    if not os.path.exists(os.path.join(server_dir, 'services', 'bulk_indexer.py')):
+        print(f"错误: 找不到批量索引脚本 {os.path.join(server_dir, 'services', 'bulk_indexer.py')}")
+        sys.exit(1)
+
+    python_exec = os.path.abspath(find_python_executable())
+    process = subprocess.Popen([python_exec, '-m', 'services.bulk_indexer', *sys.argv[1:]], cwd=server_dir)
+    try:
+        process.wait()
+    except KeyboardInterrupt:
+        # 子进程同时收到 Ctrl+C，等待它停止工作进程并输出中断信息
+        process.wait()
+    sys.exit(process.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,17 @@ Version: 0.3.4
 local tc_server_address = "http://localhost:5678"
 local debug_mode = false
 
+-- 检查游戏名变化的间隔 (秒)，代替每帧轮询
+local GAME_CHECK_INTERVAL_SECONDS = 2
+-- 最近一次成功通知服务器的游戏名，以及正在等待服务器响应的通知 {game_name = true}
+local last_notified_game = ""
+local pending_game_notifications = {}
+
 -- TC 消息颜色定义 (r, g, b format, 0-1 range)
 local TC_COLORS = {
     INFO = {0.6, 0.8, 1.0},   -- Light Blue
     ANSWER = {0.7, 1.0, 0.7}, -- Light Green
+    SOURCE = {0.75, 0.75, 0.75}, -- Light Gray
     ERROR = {1.0, 0.6, 0.6},  -- Light Red
     USAGE = {0.9, 0.9, 0.6},  -- Light Yellow
     HELP = {0.8, 0.7, 0.9}    -- Light Purple
@@ -31,14 +38,9 @@ function onLoad()
     log_debug("TTS Companion Mod 已加载")
     log_debug("服务器地址: " .. tc_server_address)
 
-    -- 获取游戏名
-    local game_name = Info.name or ""
-
-    -- 通知服务器游戏已加载
-    if game_name ~= "" then
-        log_debug("当前游戏: " .. game_name)
-        notify_game_loaded(game_name)
-    end
+    -- 通知服务器当前游戏，之后定时检查游戏名变化
+    check_game_changed()
+    Wait.time(check_game_changed, GAME_CHECK_INTERVAL_SECONDS, -1)
 end
 
 -- 保存配置
@@ -50,16 +52,11 @@ function onSave()
     return JSON.encode(saved_data)
 end
 
--- 游戏更新时检查游戏名变化
-function onUpdate()
-    -- 获取游戏名
+-- 检查游戏名是否变化 (由 Wait.time 定时调用)，变化时通知服务器
+function check_game_changed()
     local game_name = Info.name or ""
-
-    -- 检查游戏名是否变化
-    local current_game = self.getVar("current_game") or ""
-    if game_name ~= "" and game_name ~= current_game then
-        self.setVar("current_game", game_name)
-        log_debug("游戏已变更: " .. game_name)
+    if game_name ~= "" and game_name ~= last_notified_game then
+        log_debug("当前游戏: " .. game_name)
         notify_game_loaded(game_name)
     end
 end
@@ -93,6 +90,7 @@ function tc_message_to_player(player_steam_color, message_content, message_type_
     local color_rgb_table = TC_COLORS[message_type_key] or TC_COLORS.INFO -- Fallback to INFO color
     local display_prefix = ""
     if message_type_key == "ANSWER" then display_prefix = "[TC-回答] "
+    elseif message_type_key == "SOURCE" then display_prefix = "[TC-出处] "
     elseif message_type_key == "INFO" then display_prefix = "[TC-信息] "
     elseif message_type_key == "ERROR" then display_prefix = "[TC-错误] "
     elseif message_type_key == "USAGE" then display_prefix = "[TC-用法] "
@@ -156,6 +154,9 @@ function handle_question(question, player)
                 local response_player_id = data.player_id
                 if response_player_id == player_id then
                     tc_message_to_player(player_id, data.answer or "收到空的回答。", "ANSWER")
+                    if data.citation_text and data.citation_text ~= "" then
+                        tc_message_to_player(player_id, data.citation_text, "SOURCE")
+                    end
                 else
                     log_debug("Player ID mismatch. Expected: " .. player_id .. ", Got: " .. (response_player_id or "nil"))
                     -- Potentially inform the original player about the mismatch if it's a critical error path
@@ -328,6 +329,8 @@ function handle_rulebook_command(args, player)
                         local status_str = ""
                         if rulebook.status == "awaiting_user_content" then
                             status_str = "[待填充]"
+                        elseif rulebook.status == "text_extracted" then
+                            status_str = "[已从PDF提取]"
                         elseif rulebook.status == "processed_into_rag" then
                             status_str = "[已索引]"
                         end
@@ -398,17 +401,25 @@ function handle_help_command(player)
 end
 
 -- 通知服务器游戏已加载
+-- 同一游戏同时只有一个通知在等待响应；失败时不记录，下次定时检查会重试
 function notify_game_loaded(game_name)
+    if pending_game_notifications[game_name] then
+        return
+    end
+    pending_game_notifications[game_name] = true
+
     local request_body = {
         game_name = game_name
     }
 
     local headers = { ["Content-Type"] = "application/json" }
     WebRequest.custom(tc_server_address .. "/api/game/loaded","POST", true,  JSON.encode(request_body), headers, function(response)
+        pending_game_notifications[game_name] = nil
         if response.is_error then
             log_debug("通知游戏加载失败: " .. response.error)
             return
         end
+        last_notified_game = game_name
 
         if response.text then
             local success, data = pcall(JSON.decode, response.text)